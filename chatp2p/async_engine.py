@@ -0,0 +1,373 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+from typing import Dict, Any, Optional, Callable
+
+from keep_alive import KeepAlive
+from peer_connection import (PeerConnectionError, ProtocoloPeer, MAX_LOTE_ESCRITA, MAX_BYTES_LOTE,
+                             features_locais, cria_compressao)
+from send_queue import SendQueue
+import frame_codec
+from frame_codec import FEATURE_BINARIA, TAMANHO_FRAME, TIPO_COMPRIMIDO
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LEITURA = 65536 # Bytes pedidos ao transporte por leitura no modo binary-framing
+
+# Camada de conexão P2P em asyncio (selecionada por "network": {"engine": "asyncio"} no config.json).
+# Um único event loop, em uma thread, atende o servidor, todas as conexões e os keep-alives:
+# por peer são só duas tasks (leitura e escrita); PING/PONG usam loop.call_later.
+# Codificação, lotes e despacho das mensagens (HELLO/PING/SEND/ACK/PUB/BYE) vêm do ProtocoloPeer, o mesmo
+# do PeerConnection, então peers com engine "threads" e "asyncio" conversam entre si. State e MessageRouter continuam os mesmos:
+# enqueue_msg/envia_bye/close podem ser chamados de qualquer thread (ex: CLI).
+
+
+class AsyncPeerConnection(ProtocoloPeer):
+    # Equivalente do PeerConnection sobre asyncio streams (mesma API pública usada por State, MessageRouter e CLI);
+    # aqui fica só o transporte: leitura, escrita e fechamento no event loop
+    def __init__(self, engine, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 peer_id_remoto: str, foi_iniciado: bool):
+        self.engine = engine
+        self.state = engine.state
+        self.reader = reader
+        self.writer = writer
+        self.sock = writer.get_extra_info("socket") # Para a CLI (getpeername)
+        self.peer_id_remoto = peer_id_remoto
+        self.foi_iniciado = foi_iniciado
+        self.keep_alive = None
+        self.features = set() # Features negociadas no handshake
+
+        endereco = writer.get_extra_info("peername") or ("unknown", 0)
+        self.remoto_ip, self.remoto_porta = endereco[0], endereco[1]
+
+        self._envia_queue = SendQueue(self.state.get_config("send_queue", "lanes"),
+                                      timeout_bloqueio=self.state.get_config("send_queue", "block_timeout") or 5)
+        self._tem_dados = asyncio.Event() # Acorda a task de escrita
+        self._janela_escrita = (self.state.get_config("network", "write_coalesce_ms") or 0) / 1000
+        self._rodando = True
+        self._fechando = False
+        self._tarefas = []
+        self.msgs_enviadas = 0 # Mensagens enviadas pela fila (estatística)
+        self.envios = 0 # Escritas feitas pelo escritor (estatística)
+        self.compressor = None # CompressorFrames/DescompressorFrames se "compress" for negociado (criados no start)
+        self._descompressor = None
+
+        logger.info(f"[PeerConnection] Criada conexão (asyncio) com {peer_id_remoto} ({self.remoto_ip}:{self.remoto_porta}) - Iniciador: {foi_iniciado}")
+
+    def start(self): # Deve ser chamado no event loop, depois do handshake
+        self.compressor, self._descompressor = cria_compressao(self.state, self.features)
+        loop = asyncio.get_running_loop()
+        self._tarefas = [loop.create_task(self._loop_de_leitura()), loop.create_task(self._loop_de_escrita())]
+        if self.foi_iniciado:
+            self.keep_alive = KeepAlive(self, self.state, agendador=loop.call_later) # Prazos no próprio event loop
+            self.keep_alive.start()
+
+    # --- API thread-safe (mesma do PeerConnection)
+
+    def continua_ativo(self) -> bool:
+        return self._rodando
+
+    def enqueue_msg(self, msg: Dict[str, Any], bloquear: bool = True) -> bool:
+        # Levanta queue.Full conforme a política da lane; no event loop nunca bloqueia
+        ok = self._envia_queue.put(msg, bloquear=bloquear and not self.engine.no_loop())
+        if ok:
+            self._acorda_escritor()
+        return ok
+
+    def _envia_direct_msg(self, msg: Dict[str, Any]):
+        self.writer.write(self._codifica_msg(msg)) # Direto no transporte, à frente da fila (ex: BYE_OK)
+
+    def close(self):
+        if self._fechando:
+            return # Já está fechando
+        self._fechando = True
+        self._rodando = False
+        self.engine.chama_no_loop(self._fecha)
+
+    # --- Event loop
+
+    def _acorda_escritor(self):
+        self.engine.chama_no_loop(self._tem_dados.set)
+
+    def _fecha(self):
+        logger.info(f"[PeerConnection] Fechando conexão com {self.peer_id_remoto}")
+        if self.keep_alive:
+            self.keep_alive.stop()
+        self._envia_queue.fechar()
+        atual = asyncio.current_task()
+        for tarefa in self._tarefas:
+            if tarefa is not atual:
+                tarefa.cancel()
+        self.writer.close() # O transporte ainda envia o que já foi escrito (ex: BYE_OK) antes de fechar
+        self.state.remove_conexao(self.peer_id_remoto)
+        self.engine._conexoes.discard(self)
+        logger.info(f"[PeerConnection] Conexão com {self.peer_id_remoto} encerrada")
+
+    async def _loop_de_leitura(self):
+        timeout = self.state.get_config("network", "connection_timeout")
+        try:
+            if FEATURE_BINARIA in self.features:
+                await self._le_frames(timeout)
+                return
+            while self._rodando:
+                linha = await asyncio.wait_for(self.reader.readuntil(b"\n"), timeout)
+                if not linha.strip():
+                    continue
+                self._processa_msg_recebida(frame_codec.de_json(json.loads(linha)))
+        except asyncio.CancelledError:
+            pass
+        except asyncio.IncompleteReadError:
+            logger.warning(f"[PeerConnection] Erro ao receber de {self.peer_id_remoto}: Conexão fechada pelo peer")
+        except asyncio.LimitOverrunError:
+            logger.warning(f"[PeerConnection] Erro ao receber de {self.peer_id_remoto}: mensagem excede tamanho máximo")
+        except asyncio.TimeoutError:
+            logger.warning(f"[PeerConnection] Erro ao receber de {self.peer_id_remoto}: Timeout ao receber mensagem do peer")
+        except Exception as e:
+            logger.warning(f"[PeerConnection] Erro ao receber de {self.peer_id_remoto}: {e}")
+        finally:
+            self.close()
+
+    async def _le_frames(self, timeout: float):
+        # binary-framing: lê o que houver no transporte e decodifica todos os frames completos direto de uma
+        # memoryview do buffer (uma espera por leitura, não por mensagem); o frame parcial fica para a próxima
+        tamanho_maximo = self.state.get_config("network", "max_msg_size")
+        buffer = bytearray()
+        while self._rodando:
+            dados = await asyncio.wait_for(self.reader.read(TAMANHO_LEITURA), timeout)
+            if not dados:
+                raise asyncio.IncompleteReadError(bytes(buffer), None)
+            buffer += dados
+            inicio = 0
+            with memoryview(buffer) as view:
+                while len(buffer) - inicio >= TAMANHO_FRAME.size:
+                    tamanho, = TAMANHO_FRAME.unpack_from(buffer, inicio)
+                    if TAMANHO_FRAME.size + tamanho > tamanho_maximo:
+                        raise PeerConnectionError(f"Mensagem recebida excede tamanho máximo de {tamanho_maximo} bytes")
+                    fim = inicio + TAMANHO_FRAME.size + tamanho
+                    if fim > len(buffer):
+                        break
+                    with view[inicio + TAMANHO_FRAME.size:fim] as corpo: # Solta a view antes de redimensionar o buffer
+                        if self._descompressor and len(corpo) and corpo[0] == TIPO_COMPRIMIDO:
+                            corpos = self._descompressor.descomprime(corpo) # Vários frames (ou só parte de um)
+                        else:
+                            corpos = (corpo,)
+                        msgs = [frame_codec.decodifica(c, self.peer_id_remoto, self.state.get_peer_info()) for c in corpos]
+                    inicio = fim
+                    for msg in msgs:
+                        self._processa_msg_recebida(msg)
+            del buffer[:inicio]
+
+    async def _loop_de_escrita(self):
+        try:
+            while self._rodando:
+                await self._tem_dados.wait()
+                self._tem_dados.clear()
+                if self._janela_escrita:
+                    await asyncio.sleep(self._janela_escrita) # Dá tempo para mais mensagens entrarem no mesmo lote
+
+                # Esvazia a fila (em ordem de prioridade) em uma única escrita
+                lote = self._novo_lote()
+                while lote.mensagens < MAX_LOTE_ESCRITA and lote.tamanho < MAX_BYTES_LOTE:
+                    try:
+                        msg = self._envia_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    lote.adiciona(msg)
+                if not lote.mensagens:
+                    continue
+                if lote.mensagens == MAX_LOTE_ESCRITA or lote.tamanho >= MAX_BYTES_LOTE:
+                    self._tem_dados.set() # Sobrou mensagem na fila: próximo lote sem esperar
+
+                dados = lote.finaliza()
+                if self.compressor:
+                    dados = self.compressor.comprime(dados) # Só se o envio passar do limiar
+                self.writer.write(dados)
+                await self.writer.drain() # Backpressure: espera o kernel aceitar os dados
+                self.msgs_enviadas += lote.mensagens
+                self.envios += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"[PeerConnection] Erro ao enviar para {self.peer_id_remoto}: {e}")
+        finally:
+            self.close()
+
+
+class AsyncEngine:
+    # Dono do event loop: servidor P2P, conexões outbound e todas as AsyncPeerConnection
+    def __init__(self, state):
+        self.state = state
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id = None
+        self._server = None
+        self._conexoes = set()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._roda_loop, name="AsyncEngine", daemon=True)
+        self._thread.start()
+        # Sobe o servidor antes de retornar (mesmo comportamento do PeerServer.start)
+        asyncio.run_coroutine_threadsafe(self._inicia_servidor(), self.loop).result(timeout=10)
+
+    def stop(self):
+        if not self.loop or not self.loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._encerra(), self.loop).result(timeout=5)
+        except Exception as e:
+            logger.debug(f"[AsyncEngine] Erro ao encerrar conexões: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        logger.info("[AsyncEngine] Event loop encerrado")
+
+    def no_loop(self) -> bool:
+        # True se a thread atual é a do event loop
+        return threading.get_ident() == self._thread_id
+
+    def chama_no_loop(self, fn: Callable[[], Any]):
+        # Executa fn no event loop: direto se já estiver nele, senão agenda de forma thread-safe
+        if self.no_loop():
+            fn()
+            return
+        try:
+            self.loop.call_soon_threadsafe(fn)
+        except RuntimeError:
+            pass # Loop já encerrado
+
+    def conectar(self, peer_info: Dict[str, Any]) -> bool:
+        # Versão bloqueante (para threads fora do loop, ex: CLI)
+        return asyncio.run_coroutine_threadsafe(self._conecta(peer_info), self.loop).result()
+
+    def agenda_conexao(self, peer_info: Dict[str, Any], ao_terminar: Callable[[Dict[str, Any], bool], None]):
+        # Dispara a tentativa de conexão no loop sem criar thread; ao_terminar(peer_info, sucesso) roda no loop
+        futuro = asyncio.run_coroutine_threadsafe(self._conecta(peer_info), self.loop)
+
+        def _fim(f):
+            sucesso = not f.cancelled() and f.exception() is None and f.result()
+            ao_terminar(peer_info, sucesso)
+
+        futuro.add_done_callback(_fim)
+
+    # --- Event loop
+
+    def _roda_loop(self):
+        self._thread_id = threading.get_ident()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _limite_msg(self) -> int:
+        return self.state.get_config("network", "max_msg_size") or 32768
+
+    async def _inicia_servidor(self):
+        porta = self.state.port
+        self._server = await asyncio.start_server(self._handle_conexao, "0.0.0.0", porta,
+                                                  limit=self._limite_msg(), reuse_address=True)
+        logger.info(f"[AsyncEngine] Servidor P2P (asyncio) escutando na porta {porta}")
+
+    async def _encerra(self):
+        if self._server:
+            self._server.close()
+        for conexao in list(self._conexoes):
+            conexao.close()
+        await asyncio.sleep(0.1) # Deixa os transportes enviarem o que já foi escrito
+
+    def _msg_hello(self, tipo: str) -> Dict[str, Any]:
+        return {
+            "type": tipo,
+            "peer_id": self.state.get_peer_info(),
+            "version": "1.0",
+            "features": features_locais(self.state),
+            "ttl": 1
+        }
+
+    async def _handle_conexao(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Conexão inbound: espera HELLO, valida, responde HELLO_OK e registra a conexão
+        endereco = writer.get_extra_info("peername")
+        logger.info(f"[AsyncEngine] Nova conexão recebida de {endereco}")
+        timeout = self.state.get_config("network", "connection_timeout")
+
+        try:
+            hello_msg = json.loads(await asyncio.wait_for(reader.readuntil(b"\n"), timeout))
+        except Exception as e:
+            logger.warning(f"[AsyncEngine] Mensagem HELLO inválida de {endereco}: {e}")
+            writer.close()
+            return
+
+        peer_id_remoto = hello_msg.get("peer_id") if isinstance(hello_msg, dict) else None
+        if not isinstance(hello_msg, dict) or hello_msg.get("type") != "HELLO" or not peer_id_remoto:
+            logger.warning(f"[AsyncEngine] Mensagem HELLO inválida de {endereco}")
+            writer.close()
+            return
+
+        # Verifica se já existe conexão com esse peer (evita duplicatas/race conditions)
+        if self.state.verifica_conexao(peer_id_remoto):
+            logger.info(f"[AsyncEngine] Conexão já existe com {peer_id_remoto}")
+            writer.close()
+            return
+
+        conexao = AsyncPeerConnection(self, reader, writer, peer_id_remoto, foi_iniciado=False)
+        hello_ok = self._msg_hello("HELLO_OK")
+        try:
+            writer.write(conexao._codifica_msg(hello_ok)) # Ainda em NDJSON: as features só valem depois do HELLO_OK
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"[AsyncEngine] Falha no handshake com {peer_id_remoto}: {e}")
+            writer.close()
+            return
+        conexao.features = set(hello_ok["features"]) & set(hello_msg.get("features") or [])
+
+        self.state.adiciona_conexao(peer_id_remoto, conexao)
+        self._conexoes.add(conexao)
+        conexao.start()
+        logger.info(f"[AsyncEngine] Conexão estabelecida com {peer_id_remoto}")
+
+    async def _conecta(self, peer_info: Dict[str, Any]) -> bool:
+        # Conexão outbound com retry e backoff exponencial (sem bloquear o loop)
+        ip_remoto = peer_info.get("ip")
+        porta = peer_info.get("port")
+        peer_id_remoto = f"{peer_info['name']}@{peer_info['namespace']}"
+
+        max_tentativas = self.state.get_config("peer_connection", "retry_attempts")
+        backoff_base = self.state.get_config("peer_connection", "backoff_base")
+        timeout = self.state.get_config("network", "connection_timeout")
+
+        for tentativas in range(max_tentativas):
+            writer = None
+            try:
+                logger.debug(f"[AsyncEngine] Tentando conectar com {peer_id_remoto} em {ip_remoto}:{porta} (tentativa {tentativas + 1}/{max_tentativas})")
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(ip_remoto, porta, limit=self._limite_msg()), timeout)
+
+                conexao = AsyncPeerConnection(self, reader, writer, peer_id_remoto, foi_iniciado=True)
+                writer.write(conexao._codifica_msg(self._msg_hello("HELLO")))
+                await writer.drain()
+
+                resposta = json.loads(await asyncio.wait_for(reader.readuntil(b"\n"), timeout))
+                if not isinstance(resposta, dict) or resposta.get("type") != "HELLO_OK":
+                    logger.warning(f"[AsyncEngine] Handshake falhou com {peer_id_remoto}: {resposta}")
+                    writer.close()
+                    continue
+                conexao.features = set(features_locais(self.state)) & set(resposta.get("features") or [])
+
+                self.state.adiciona_conexao(peer_id_remoto, conexao)
+                self._conexoes.add(conexao)
+                conexao.start()
+                logger.info(f"[AsyncEngine] Conectado com sucesso a {peer_id_remoto}")
+                return True
+
+            except Exception as e:
+                logger.debug(f"[AsyncEngine] Falha ao conectar com {peer_id_remoto} (tentativa {tentativas + 1}/{max_tentativas}): {e}")
+                if writer:
+                    writer.close()
+                if tentativas < max_tentativas - 1:
+                    await asyncio.sleep(backoff_base ** tentativas)
+
+        logger.debug(f"[AsyncEngine] Falha ao conectar com {peer_id_remoto} após {max_tentativas} tentativas.")
+        return False
@@ -1,4 +1,4 @@
-from state import State
+from state import State, namespace_do_peer
 from rendezvous_connection import *
 from p2p_client import P2PClient
 import logging
@@ -21,9 +21,10 @@ class CLI:
         print("="*60)
         
         comandos = [
-          ("peers [namespace]", "Descobrir peers ativos"),
+          ("peers [namespace...]", "Descobrir peers ativos (um ou mais namespaces)"),
           ("", "  - peers          : Lista todos os peers"),
           ("", "  - peers CIC      : Lista peers do namespace CIC"),
+          ("", "  - peers CIC UnB  : Lista peers de CIC e UnB (uma requisição)"),
           ("", ""),
           ("msg <peer_id> <mensagem>", "Envia uma mensagem para um peer específico"),
           ("", "  - msg bob@geral Oi!  : Envia 'Oi!' para o peer bob@geral"),
@@ -149,7 +150,7 @@ class CLI:
         print("Registrando no servidor de rendezvous...")
         
         try:
-            resposta = register(self.state) # Tenta registrar o peer no servidor rendezvous	
+            resposta = register(self.state, descobrir=True) # Tenta registrar o peer no servidor rendezvous (já trazendo os peers conhecidos)	
             self.registrado = True # Marca flag como registrado
             print(f"Registrado com sucesso")
             print(f"Status: {resposta.get('status')}")
@@ -163,19 +164,25 @@ class CLI:
             print("Estado não inicializado. Execute setup primeiro.")
             return
 
-        # Verifica se o usuário passou um namespace como argumento
+        # Verifica se o usuário passou um ou mais namespaces como argumento
         if args:
             namespace = args[0] 
         else:
             namespace = None
 
-        if namespace: # Imprime mensagem diferente se namespace foi especificado	
+        if len(args) > 1: # Vários namespaces: uma única requisição agrupada
+            print(f"Descobrindo peers nos namespaces {', '.join(args)}...")
+        elif namespace: # Imprime mensagem diferente se namespace foi especificado	
             print(f"Descobrindo peers no namespace '{namespace}'...")
         else:
             print("Descobrindo peers em todos os namespaces...")
             
         try:
-            peers = discover(self.state, namespace=namespace) # Tenta descobrir peers no servidor rendezvous
+            if len(args) > 1:
+                grupos = discover_varios(self.state, args)
+                peers = [peer for lista in grupos.values() for peer in lista]
+            else:
+                peers = discover(self.state, namespace=namespace) # Tenta descobrir peers no servidor rendezvous
             
             if not peers:
                 print("Nenhum peer encontrado.")
@@ -216,11 +223,18 @@ class CLI:
         print("Status de Peers".center(60))
         print("="*60)
 
-        # Lista peers conectados com sucesso
+        # Lista peers conectados com sucesso, agrupados pelo índice de namespaces do State
         conexoes = self.state.get_todas_conexoes()
+        namespaces = self.state.get_namespaces()
         print(f"\nPeers conectados ({len(conexoes)}):")
         if conexoes:
-            for peer_id in sorted(conexoes.keys()):
+            for namespace in sorted(namespaces):
+                membros = namespaces[namespace]
+                print(f"  #{namespace} ({len(membros)}):")
+                for peer_id in sorted(membros):
+                    print(f"    ✓ {peer_id}")
+            sem_namespace = [peer_id for peer_id in conexoes if namespace_do_peer(peer_id) is None]
+            for peer_id in sorted(sem_namespace):
                 print(f"  ✓ {peer_id}")
         else:
             print("  (nenhum)")
@@ -246,6 +260,14 @@ class CLI:
         else:
             print("  (nenhum)")
 
+        # Repasse de PUB pela malha: cópias recebidas, duplicatas descartadas e repasses feitos
+        router = self.state.get_message_router()
+        if router:
+            pub = router.estatisticas_pub
+            modo = self.state.get_config("message_router", "gossip_mode") or "flood"
+            print(f"\nPUB ({modo}): {pub['recebidos']} recebido(s), {pub['duplicados']} duplicado(s), "
+                  f"{pub['repassados']} repassado(s)")
+
         print("="*60 + "\n")
 
     def cmd_rtt(self):
@@ -282,6 +304,18 @@ class CLI:
                 # Conexões inbound não têm KeepAlive (apenas outbound envia PING)
                 print(f"{peer_id:<25} {'N/A':<15} {0:<10}")
 
+        # Estimativa usada nas retransmissões de SEND (PONGs + ACKs), inclusive para conexões inbound
+        router = self.state.get_message_router()
+        if router:
+            print(f"\n{'Peer ID':<25} {'SRTT':<11} {'RTTVAR':<11} {'RTO':<11}")
+            print("-"*60)
+            for peer_id in sorted(conexoes):
+                estimador = router.estimador_rtt(peer_id)
+                if estimador.srtt is None:
+                    print(f"{peer_id:<25} {'N/A':<11} {'N/A':<11} {estimador.rto() * 1000:>6.0f} ms")
+                else:
+                    print(f"{peer_id:<25} {estimador.srtt * 1000:>6.2f} ms  {estimador.rttvar * 1000:>6.2f} ms  {estimador.rto() * 1000:>6.0f} ms")
+
         print("="*60 + "\n")
 
     def cmd_reconnect(self):
@@ -352,6 +386,7 @@ class CLI:
         if outbounds:
             for peer_id, conexao in outbounds.items():
                 print(f"  - {peer_id} (Conectado a {conexao.sock.getpeername()})")
+                self._imprime_compressao(conexao)
         else:
             print("  (nenhuma)")
 
@@ -360,9 +395,24 @@ class CLI:
         if inbounds:
             for peer_id, conexao in inbounds.items():
                 print(f"  - {peer_id} (Conectado de {conexao.sock.getpeername()})")
+                self._imprime_compressao(conexao)
         else:
             print("  (nenhuma)")
+
+        # Resumo por namespace (índice mantido pelo State)
+        namespaces = self.state.get_namespaces()
+        if namespaces:
+            resumo = ", ".join(f"#{ns}: {len(membros)}" for ns, membros in sorted(namespaces.items()))
+            print(f"Por namespace: {resumo}")
             
+    def _imprime_compressao(self, conexao):
+        # Estatísticas da compressão da conexão (feature "compress"), se negociada
+        compressor = getattr(conexao, "compressor", None)
+        if compressor and compressor.bytes_entrada:
+            taxa = 100 * (1 - compressor.bytes_saida / compressor.bytes_entrada)
+            print(f"      compressão: {compressor.bytes_entrada} -> {compressor.bytes_saida} bytes "
+                  f"({taxa:.0f}% menor, {compressor.tempo * 1000:.1f} ms de CPU)")
+
     def cmd_msg(self, args):
         # Envia mensagem unicast (SEND) para um peer específico e aguarda ACK
         if not self.state:
@@ -383,12 +433,16 @@ class CLI:
             print("Erro: Roteador de mensagens não está disponível.")
             return
 
-        # Envia mensagem SEND e aguarda ACK (com retry e timeout)
+        # Envia mensagem SEND sem bloquear o prompt: o resultado (ACK ou falha após retries) é impresso ao chegar
+        def _resultado(futuro):
+            ok, _ = futuro.result()
+            if ok:
+                print(f"Mensagem para {peer_id} confirmada (ACK recebido).")
+            else:
+                print(f"Falha ao enviar mensagem para {peer_id}. O peer pode estar offline ou não respondeu.")
+
         print(f"Enviando mensagem para {peer_id}...")
-        if router.send(peer_id, message):
-            print("Mensagem enviada e confirmada (ACK recebido).")
-        else:
-            print("Falha ao enviar mensagem. O peer pode estar offline ou não respondeu.")
+        router.send_async(peer_id, message, callback=_resultado)
 
     def cmd_pub(self, args):
         # Envia mensagem broadcast (*) ou namespace-cast (#namespace) sem ACK
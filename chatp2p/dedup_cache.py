@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Limites padrão se o config.json não tiver as chaves em "message_router"
+MAX_POR_PEER_PADRAO = 4096 # msg_ids lembrados por peer de origem
+TTL_PADRAO = 120.0 # Segundos que um msg_id fica no cache (bem acima do tempo total de retransmissão)
+MAX_PEERS_PADRAO = 1024 # Peers de origem acompanhados (o menos recente sai primeiro)
+
+
+class DedupCache:
+    # Cache de msg_ids recentes por peer de origem para suprimir duplicatas no recebimento
+    # (retransmissão após ACK perdido, mesma mensagem chegando por outro caminho).
+    # Cada peer tem um OrderedDict em ordem de chegada: consulta e inserção são O(1) e a expiração
+    # por tempo/tamanho só olha o início. A memória fica limitada a max_peers * max_por_peer entradas.
+    def __init__(self, max_por_peer: int = MAX_POR_PEER_PADRAO, ttl: float = TTL_PADRAO,
+                 max_peers: int = MAX_PEERS_PADRAO):
+        if max_por_peer < 1 or max_peers < 1 or ttl <= 0:
+            raise ValueError(f"Configuração inválida para o cache de duplicatas: max_por_peer={max_por_peer}, ttl={ttl}, max_peers={max_peers}")
+        self._lock = threading.Lock()
+        self._peers: "OrderedDict[str, OrderedDict[str, float]]" = OrderedDict()
+        self.max_por_peer = max_por_peer
+        self.ttl = ttl
+        self.max_peers = max_peers
+        self.duplicatas = 0 # Duplicatas suprimidas (estatística)
+
+    def ja_visto(self, peer_id: str, msg_id: Optional[str]) -> bool:
+        # Registra o msg_id e retorna True se ele já estava no cache (duplicata). Sem msg_id nunca é duplicata.
+        if not msg_id:
+            return False
+        agora = time.monotonic()
+        with self._lock:
+            vistos = self._peers.get(peer_id)
+            if vistos is None:
+                vistos = self._peers[peer_id] = OrderedDict()
+                while len(self._peers) > self.max_peers:
+                    self._peers.popitem(last=False) # Peer de origem há mais tempo sem mensagens
+            else:
+                self._peers.move_to_end(peer_id)
+                self._expira_locked(vistos, agora)
+
+            if msg_id in vistos:
+                self.duplicatas += 1
+                return True
+            vistos[msg_id] = agora
+            if len(vistos) > self.max_por_peer:
+                vistos.popitem(last=False)
+            return False
+
+    def tamanho(self) -> int:
+        # Total de msg_ids lembrados (todos os peers)
+        with self._lock:
+            return sum(len(vistos) for vistos in self._peers.values())
+
+    def limpa(self):
+        with self._lock:
+            self._peers.clear()
+
+    def _expira_locked(self, vistos: "OrderedDict[str, float]", agora: float):
+        # Entradas estão em ordem de inserção: remove do início enquanto estiverem vencidas
+        limite = agora - self.ttl
+        while vistos:
+            msg_id, instante = next(iter(vistos.items()))
+            if instante > limite:
+                break
+            vistos.popitem(last=False)
@@ -0,0 +1,296 @@
+import base64
+import json
+import struct
+import time
+import zlib
+from typing import Dict, Any, Optional, List
+
+# Codificação binária das mensagens peer-to-peer (feature "binary-framing", negociada no HELLO/HELLO_OK).
+# Depois do handshake cada mensagem vira um frame com prefixo de tamanho, sem '\n' e sem JSON para os
+# campos fixos do envelope:
+#
+#   tamanho (u32, bytes que vêm depois) | tipo (u8) | flags (u16) | campos presentes, na ordem das flags
+#
+# Campos que não têm representação fixa (ou valores fora dela) vão em um objeto JSON de "extras".
+# O payload vai por último, cru (texto UTF-8 ou bytes), até o fim do frame.
+FEATURE_BINARIA = "binary-framing"
+
+TIPOS = ("PING", "PONG", "ACK", "SEND", "PUB", "BYE", "BYE_OK", "BATCH") # Código do tipo = índice + 1 (0 = "type" nos extras)
+_CODIGOS = {tipo: i + 1 for i, tipo in enumerate(TIPOS)}
+
+F_MSG_ID = 0x0001 # msg_id UUID em 16 bytes
+F_TTL = 0x0002 # ttl (u8)
+F_SEQ = 0x0004 # seq, base (u32, u32)
+F_CUM = 0x0008 # cum (u32), quantidade de intervalos SACK (u8) e os intervalos (u32, u32)
+F_SRC_REMOTO = 0x0010 # src omitido: é o peer do outro lado da conexão
+F_DST_LOCAL = 0x0020 # dst omitido: é o peer que recebe
+F_REQUIRE_ACK = 0x0040 # require_ack presente
+F_REQUIRE_ACK_SIM = 0x0080 # ...e verdadeiro
+F_TIMESTAMP = 0x0100 # timestamp ASCII (u8 tamanho + bytes)
+F_EXTRAS = 0x0200 # Demais campos em JSON (u32 tamanho + bytes)
+F_PAYLOAD_TEXTO = 0x0400 # payload str em UTF-8 até o fim do frame
+F_PAYLOAD_BYTES = 0x0800 # payload bytes até o fim do frame
+
+# Feature "compress" (só com binary-framing): lotes grandes do escritor vão em frames COMPRIMIDO, cujo corpo é
+# zlib de uma sequência de frames normais. O contexto zlib é um só por conexão e direção (Z_SYNC_FLUSH a cada
+# frame), então chaves e valores repetidos em mensagens anteriores também viram referências curtas.
+FEATURE_COMPRESSAO = "compress"
+TIPO_COMPRIMIDO = 0x80 # Fora da faixa de TIPOS: o leitor testa o primeiro byte antes de decodificar
+
+TAMANHO_FRAME = struct.Struct(">I")
+_TIPO_FLAGS = struct.Struct(">BH")
+_U8 = struct.Struct(">B")
+_U32 = TAMANHO_FRAME
+_PAR_U32 = struct.Struct(">II")
+_CUM = struct.Struct(">IB")
+_MAX_U32 = 0xFFFFFFFF
+
+
+def _u32(valor) -> bool:
+    return type(valor) is int and 0 <= valor <= _MAX_U32
+
+
+def _uuid_bytes(msg_id) -> Optional[bytes]:
+    # UUID canônico (minúsculo, com hífens) em 16 bytes; outros formatos de msg_id vão nos extras
+    if type(msg_id) is not str or len(msg_id) != 36 or msg_id != msg_id.lower():
+        return None
+    if msg_id[8] != "-" or msg_id[13] != "-" or msg_id[18] != "-" or msg_id[23] != "-":
+        return None
+    try:
+        return bytes.fromhex(msg_id.replace("-", ""))
+    except ValueError:
+        return None
+
+
+def codifica(msg: Dict[str, Any], src_local: Optional[str], dst_remoto: Optional[str]) -> bytes:
+    # Frame completo (com o prefixo de tamanho) para uma mensagem
+    resto = dict(msg)
+    tipo = resto.pop("type", None)
+    codigo = _CODIGOS.get(tipo, 0)
+    if not codigo and tipo is not None:
+        resto["type"] = tipo
+    flags = 0
+    campos = []
+
+    uuid_bytes = _uuid_bytes(resto.get("msg_id"))
+    if uuid_bytes is not None:
+        del resto["msg_id"]
+        flags |= F_MSG_ID
+        campos.append(uuid_bytes)
+
+    ttl = resto.get("ttl")
+    if type(ttl) is int and 0 <= ttl <= 0xFF:
+        del resto["ttl"]
+        flags |= F_TTL
+        campos.append(_U8.pack(ttl))
+
+    seq, base = resto.get("seq"), resto.get("base")
+    if _u32(seq) and _u32(base):
+        del resto["seq"], resto["base"]
+        flags |= F_SEQ
+        campos.append(_PAR_U32.pack(seq, base))
+
+    cum, sack = resto.get("cum"), resto.get("sack")
+    if (_u32(cum) and isinstance(sack, list) and len(sack) <= 0xFF
+            and all(isinstance(par, list) and len(par) == 2 and _u32(par[0]) and _u32(par[1]) for par in sack)):
+        del resto["cum"], resto["sack"]
+        flags |= F_CUM
+        campos.append(_CUM.pack(cum, len(sack)))
+        campos.extend(_PAR_U32.pack(a, b) for a, b in sack)
+
+    if "src" in resto and resto["src"] == src_local:
+        del resto["src"]
+        flags |= F_SRC_REMOTO
+    if "dst" in resto and resto["dst"] == dst_remoto:
+        del resto["dst"]
+        flags |= F_DST_LOCAL
+
+    require_ack = resto.get("require_ack")
+    if type(require_ack) is bool:
+        del resto["require_ack"]
+        flags |= F_REQUIRE_ACK | (F_REQUIRE_ACK_SIM if require_ack else 0)
+
+    timestamp = resto.get("timestamp")
+    if type(timestamp) is str and timestamp.isascii() and len(timestamp) <= 0xFF:
+        del resto["timestamp"]
+        flags |= F_TIMESTAMP
+        campos.append(_U8.pack(len(timestamp)) + timestamp.encode("ascii"))
+
+    payload = resto.pop("payload", None)
+    if isinstance(payload, str):
+        flags |= F_PAYLOAD_TEXTO
+        payload = payload.encode("utf-8")
+    elif isinstance(payload, (bytes, bytearray, memoryview)):
+        flags |= F_PAYLOAD_BYTES
+    elif payload is not None:
+        resto["payload"] = payload # Payload não textual (ex: número) segue em JSON
+
+    if resto:
+        extras = json.dumps(resto, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        flags |= F_EXTRAS
+        campos.append(_U32.pack(len(extras)))
+        campos.append(extras)
+    if flags & (F_PAYLOAD_TEXTO | F_PAYLOAD_BYTES):
+        campos.append(payload)
+
+    corpo = b"".join(campos)
+    return TAMANHO_FRAME.pack(len(corpo) + 3) + _TIPO_FLAGS.pack(codigo, flags) + corpo
+
+
+def decodifica(corpo, src_remoto: Optional[str], dst_local: Optional[str]) -> Dict[str, Any]:
+    # Mensagem a partir do corpo de um frame (sem o prefixo de tamanho); aceita memoryview sem copiar.
+    # Levanta ValueError (ou struct.error) para frames malformados.
+    codigo, flags = _TIPO_FLAGS.unpack_from(corpo, 0)
+    pos = _TIPO_FLAGS.size
+    msg: Dict[str, Any] = {}
+    if codigo:
+        if codigo > len(TIPOS):
+            raise ValueError(f"Tipo de frame desconhecido: {codigo}")
+        msg["type"] = TIPOS[codigo - 1]
+
+    if flags & F_MSG_ID:
+        h = corpo[pos:pos + 16].hex()
+        if len(h) != 32:
+            raise ValueError("Frame truncado (msg_id)")
+        msg["msg_id"] = f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+        pos += 16
+    if flags & F_TTL:
+        msg["ttl"] = corpo[pos]
+        pos += 1
+    if flags & F_SEQ:
+        msg["seq"], msg["base"] = _PAR_U32.unpack_from(corpo, pos)
+        pos += _PAR_U32.size
+    if flags & F_CUM:
+        msg["cum"], quantidade = _CUM.unpack_from(corpo, pos)
+        pos += _CUM.size
+        sack = []
+        for _ in range(quantidade):
+            a, b = _PAR_U32.unpack_from(corpo, pos)
+            sack.append([a, b])
+            pos += _PAR_U32.size
+        msg["sack"] = sack
+    if flags & F_SRC_REMOTO:
+        msg["src"] = src_remoto
+    if flags & F_DST_LOCAL:
+        msg["dst"] = dst_local
+    if flags & F_REQUIRE_ACK:
+        msg["require_ack"] = bool(flags & F_REQUIRE_ACK_SIM)
+    if flags & F_TIMESTAMP:
+        tamanho = corpo[pos]
+        msg["timestamp"] = str(corpo[pos + 1:pos + 1 + tamanho], "ascii")
+        pos += 1 + tamanho
+    if flags & F_EXTRAS:
+        tamanho, = _U32.unpack_from(corpo, pos)
+        pos += _U32.size
+        if pos + tamanho > len(corpo):
+            raise ValueError("Frame truncado (extras)")
+        extras = json.loads(bytes(corpo[pos:pos + tamanho]))
+        if not isinstance(extras, dict):
+            raise ValueError("Extras do frame não são um objeto JSON")
+        msg.update(extras)
+        pos += tamanho
+    if flags & F_PAYLOAD_TEXTO:
+        msg["payload"] = str(corpo[pos:], "utf-8")
+    elif flags & F_PAYLOAD_BYTES:
+        msg["payload"] = bytes(corpo[pos:])
+    return msg
+
+
+class MensagemCompartilhada(dict):
+    # Mensagem enfileirada em várias conexões de uma vez (fan-out e repasse de PUB). A codificação de uma PUB não
+    # depende da conexão (src é o peer local ou a origem de um PUB repassado, nunca o peer remoto, e dst é "*" ou
+    # "#ns"), então cada formato de fio ("json", "binario", "batch") é gerado uma vez só e os mesmos bytes vão
+    # para todas as filas. Não altere depois de enfileirar.
+    __slots__ = ("_codificada",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._codificada: Dict[str, bytes] = {}
+
+    def codificada(self, formato: str, codifica) -> bytes:
+        # Corrida entre escritores só gera os mesmos bytes duas vezes; o resultado é igual
+        dados = self._codificada.get(formato)
+        if dados is None:
+            dados = self._codificada[formato] = codifica(self)
+        return dados
+
+
+# Payload bytes em conexões NDJSON (peer sem binary-framing): vai em base64 com "payload_encoding"
+
+def para_json(msg: Dict[str, Any]) -> Dict[str, Any]:
+    payload = msg.get("payload")
+    if not isinstance(payload, (bytes, bytearray, memoryview)):
+        return msg
+    return dict(msg, payload=base64.b64encode(payload).decode("ascii"), payload_encoding="base64")
+
+
+def de_json(msg: Dict[str, Any]) -> Dict[str, Any]:
+    if msg.get("payload_encoding") == "base64" and isinstance(msg.get("payload"), str):
+        del msg["payload_encoding"]
+        msg["payload"] = base64.b64decode(msg["payload"])
+    return msg
+
+
+class CompressorFrames:
+    # Lado do escritor (um por conexão): comprime os bytes de um envio inteiro (frames completos) em um ou mais
+    # frames COMPRIMIDO. Cada pedaço de entrada cabe em tamanho_maximo, assim como o frame resultante.
+    def __init__(self, nivel: int, tamanho_maximo: int, limiar: int):
+        self._zlib = zlib.compressobj(nivel)
+        self.limiar = limiar # Envios menores que isso saem sem compressão (não compensa o custo)
+        self._pedaco = tamanho_maximo - 64 # Folga para cabeçalhos do frame e expansão do deflate em dados incompressíveis
+        self.bytes_entrada = 0 # Estatísticas: bytes antes/depois da compressão e tempo de CPU gasto
+        self.bytes_saida = 0
+        self.tempo = 0.0
+
+    def comprime(self, dados: bytes) -> bytes:
+        if len(dados) < self.limiar:
+            return dados
+        inicio = time.perf_counter()
+        frames = []
+        with memoryview(dados) as view:
+            for pos in range(0, len(dados), self._pedaco):
+                corpo = self._zlib.compress(view[pos:pos + self._pedaco]) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+                frames.append(TAMANHO_FRAME.pack(len(corpo) + 1) + _U8.pack(TIPO_COMPRIMIDO) + corpo)
+        saida = b"".join(frames)
+        self.tempo += time.perf_counter() - inicio
+        self.bytes_entrada += len(dados)
+        self.bytes_saida += len(saida)
+        return saida
+
+
+class DescompressorFrames:
+    # Lado do leitor (um por conexão): expande frames COMPRIMIDO na ordem em que chegam e devolve os corpos dos
+    # frames internos completos. Um frame interno pode começar em um frame COMPRIMIDO e terminar no seguinte.
+    def __init__(self, tamanho_maximo: int):
+        self._zlib = zlib.decompressobj()
+        self._tamanho_maximo = tamanho_maximo
+        self._resto = b"" # Expandido e ainda não entregue (frame interno parcial)
+
+    def descomprime(self, corpo) -> List[memoryview]:
+        # corpo: frame COMPRIMIDO sem o prefixo de tamanho. Os corpos devolvidos valem até a próxima chamada.
+        try:
+            expandido = self._zlib.decompress(corpo[1:], self._tamanho_maximo)
+        except zlib.error as e:
+            raise ValueError(f"Frame comprimido inválido: {e}")
+        if self._zlib.unconsumed_tail:
+            raise ValueError(f"Frame comprimido expande para mais de {self._tamanho_maximo} bytes")
+        if self._resto:
+            dados = self._resto + expandido
+            self._resto = b""
+        else:
+            dados = expandido # Caso comum: o envio terminou em fronteira de frame, nada a juntar
+        corpos = []
+        pos = 0
+        view = memoryview(dados)
+        while len(dados) - pos >= TAMANHO_FRAME.size:
+            tamanho, = TAMANHO_FRAME.unpack_from(dados, pos)
+            if TAMANHO_FRAME.size + tamanho > self._tamanho_maximo:
+                raise ValueError(f"Frame interno excede tamanho máximo de {self._tamanho_maximo} bytes")
+            fim = pos + TAMANHO_FRAME.size + tamanho
+            if fim > len(dados):
+                break
+            corpos.append(view[pos + TAMANHO_FRAME.size:fim])
+            pos = fim
+        if pos < len(dados):
+            self._resto = dados[pos:]
+        return corpos
@@ -1,33 +1,40 @@
 import threading
 import time
 import logging
-from typing import Dict
+from typing import Dict, Callable, Optional
+
+from timer_wheel import TimerWheel
 
 logger = logging.getLogger(__name__)
 
 class KeepAlive:
-    def __init__(self, conexao, state):
+    # PING periódico e timeout de PONG por prazos agendados (sem thread por conexão).
+    # agendador: função no formato call_later(atraso, fn, *args) que retorna um handle com cancel();
+    # por padrão a TimerWheel do state (engine "threads") ou loop.call_later (engine "asyncio").
+    def __init__(self, conexao, state, agendador: Optional[Callable] = None):
         self.conexao = conexao  # Referência para a conexão peer
         self.state = state  # Referência para o estado compartilhado
         self._falhas = 0  # Contador de PINGs sem resposta consecutivos
         self._pings_pendentes = {}  # Dicionário {msg_id: timestamp} de PINGs aguardando PONG
         self._rodando = threading.Event()  # Flag para indicar se KeepAlive está rodando
-        self._thread_keep_alive = None  # Thread que executa o loop de PING
+        self._agendador = agendador  # call_later usado para agendar o próximo PING/verificação de PONG
+        self._timer_proprio = None  # TimerWheel própria, só se o state não tiver uma compartilhada
+        self._temporizador = None  # Handle do próximo prazo agendado (cancelado no stop)
         self._rtts = []  # Armazena os últimos RTTs (em ms)
         self._max_rtts = 10  # Mantém apenas os últimos 10 RTTs      
         
     def start(self):
-        # Inicia thread de KeepAlive que envia PING a cada intervalo configurado
+        # Agenda o primeiro PING; os seguintes são reagendados a cada verificação de PONG
         try:
-            self._rodando.set()  # Marca KeepAlive como rodando
+            if self._agendador is None:
+                timer_wheel = self.state.get_timer_wheel()
+                if timer_wheel is None:
+                    self._timer_proprio = timer_wheel = TimerWheel()
+                    timer_wheel.start()
+                self._agendador = timer_wheel.call_later
 
-            # Cria thread daemon que executará o loop de PING
-            self._thread_keep_alive = threading.Thread(
-                target=self._loop_ping,
-                name=f"KeepAlive-{self.conexao.peer_id_remoto}",
-                daemon=True
-            )
-            self._thread_keep_alive.start()
+            self._rodando.set()  # Marca KeepAlive como rodando
+            self._temporizador = self._agendador(0, self._envia_ping)
 
             logger.debug(f"[KeepAlive] KeepAlive iniciado para {self.conexao.peer_id_remoto}")
 
@@ -40,44 +47,50 @@ class KeepAlive:
         if not self._rodando.is_set():
           return # Já está parado
 
-        self._rodando.clear() # Sinaliza para parar o loop de ping
+        self._rodando.clear() # Sinaliza para não reagendar
         logger.debug(f"[KeepAlive] Encerrando KeepAlive para {self.conexao.peer_id_remoto}...")
 
-        thread_atual = threading.current_thread() # Obtém a thread atual
- 
-        if self._thread_keep_alive and self._thread_keep_alive.is_alive(): # Verifica se a thread de keep-alive está ativa
-            if thread_atual != self._thread_keep_alive: # Evita que uma thread tente se juntar a si mesma
-                self._thread_keep_alive.join(timeout=5) # Aguarda a thread terminar com timeout
+        if self._temporizador:
+            self._temporizador.cancel() # Remove o prazo pendente (PING ou verificação de PONG)
+        if self._timer_proprio:
+            self._timer_proprio.stop()
     
     
-    
-    def _loop_ping(self):
+    def _envia_ping(self):
+        if not self._rodando.is_set():
+            return
+        try:
+            msg_id = self.conexao.envia_ping() # Envia ping e obtém o ID da mensagem
+            self._pings_pendentes[msg_id] = time.monotonic() # Armazena o ping pendente com o timestamp
+            logger.debug(f"[KeepAlive] Ping enviado para {self.conexao.peer_id_remoto}")
+        except Exception as e:
+            logger.error(f"[KeepAlive] Erro ao enviar ping para {self.conexao.peer_id_remoto}: {e}")
+            msg_id = None
+
+        # Verifica o PONG depois do intervalo de ping (e já envia o próximo PING nesse momento)
         ping_interval = self.state.get_config("keepalive", "ping_interval") # Pega configuração de intervalo de ping no json
+        self._temporizador = self._agendador(ping_interval, self._verifica_pong, msg_id)
+
+    def _verifica_pong(self, msg_id):
+        if not self._rodando.is_set():
+            return
         max_falhas = self.state.get_config("keepalive", "max_ping_failures") # Pega configuração de falhas máximas no json
-        
-   
-        while self._rodando.is_set():
-            try:
-                msg_id = self.conexao.envia_ping() # Envia ping e obtém o ID da mensagem
-                tempo_agora = time.time() # Marca o tempo do envio do ping
-                self._pings_pendentes[msg_id] = tempo_agora # Armazena o ping pendente com o timestamp
-                logger.debug(f"[KeepAlive] Ping enviado para {self.conexao.peer_id_remoto}") 
-                
-                time.sleep(ping_interval) # Aguarda o intervalo de ping antes de enviar o próximo
-                
-                if msg_id in self._pings_pendentes: # Verifica se o ping ainda está pendente (não respondido)
-                    self._falhas += 1 # Incrementa o contador de falhas
-                    logger.warning(f"[KeepAlive] Ping não respondido de {self.conexao.peer_id_remoto}. Falhas: {self._falhas}")
-                    
-                    if self._falhas >= max_falhas: # Verifica se o número de falhas atingiu o máximo permitido
-                        logger.error(f"[KeepAlive] Máximo de falhas atingido para {self.conexao.peer_id_remoto}. Encerrando conexão.")
-                        self.conexao.close() # Encerra a conexão
-                        break
-                else:
-                    self._falhas = 0 # Reseta o contador de falhas se o ping foi respondido
-            
-            except Exception as e:
-                logger.error(f"[KeepAlive] Erro no loop de ping para {self.conexao.peer_id_remoto}: {e}")
+
+        if msg_id is None or self._pings_pendentes.pop(msg_id, None) is not None: # Ping ainda pendente (não respondido)
+            self._falhas += 1 # Incrementa o contador de falhas
+            logger.warning(f"[KeepAlive] Ping não respondido de {self.conexao.peer_id_remoto}. Falhas: {self._falhas}")
+
+            if self._falhas >= max_falhas: # Verifica se o número de falhas atingiu o máximo permitido
+                logger.error(f"[KeepAlive] Máximo de falhas atingido para {self.conexao.peer_id_remoto}. Encerrando conexão.")
+                self._rodando.clear()
+                # Encerra a conexão fora da thread do temporizador (close pode aguardar as threads da conexão)
+                threading.Thread(target=self.conexao.close, name=f"KeepAlive-{self.conexao.peer_id_remoto}",
+                                 daemon=True).start()
+                return
+        else:
+            self._falhas = 0 # Reseta o contador de falhas se o ping foi respondido
+
+        self._envia_ping()
                 
     def processa_pong(self, msg_pong):
         msg_id = msg_pong.get("msg_id") # Extrai o ID da mensagem do pong recebido
@@ -85,8 +98,13 @@ class KeepAlive:
         try:
             if msg_id in self._pings_pendentes: # Verifica se o pong corresponde a um ping pendente
                 tempo_envio = self._pings_pendentes[msg_id] # Obtém o tempo de envio do ping
-                rtt = (time.time() - tempo_envio) * 1000  # RTT em milissegundos
+                rtt = (time.monotonic() - tempo_envio) * 1000  # RTT em milissegundos
                 self._pings_pendentes.pop(msg_id) # Remove o ping pendente
+
+                # Alimenta o estimador de RTO do peer (usado nas retransmissões de SEND)
+                router = self.state.get_message_router()
+                if router:
+                    router.registra_rtt(self.conexao.peer_id_remoto, rtt / 1000)
                 self._falhas = 0  # Reseta o contador de falhas
 
                 # Armazena o RTT (mantém apenas os últimos N)
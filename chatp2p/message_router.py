@@ -1,18 +1,45 @@
 import threading
+import queue
 import uuid
-import time
 import logging
+import random
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime
 from typing import Callable, Dict, Any, Optional, Tuple, List
 
+from timer_wheel import TimerWheel
+from rtt_estimator import RttEstimator
+from dedup_cache import DedupCache, MAX_POR_PEER_PADRAO, TTL_PADRAO
+from frame_codec import MensagemCompartilhada
+
 logger = logging.getLogger(__name__)
 
+MAX_INTERVALOS_SACK = 16  # Intervalos SACK por ACK (os demais são confirmados nos ACKs seguintes)
+LIMIAR_RETRANSMISSAO_RAPIDA = 3  # Seqs posteriores recebidos (SACK) para considerar uma lacuna perdida
+MAX_PUB_TTL_PADRAO = 16  # Saltos máximos de um PUB repassado (TTL recebido acima disso é reduzido)
+GOSSIP_FANOUT_PADRAO = 3  # Vizinhos sorteados por repasse no modo "fanout"
+
 
 class MessageRouter:
     def __init__(self, state):
         self.state = state
-        self._pending_acks: Dict[str, Dict[str, Any]] = {}  # Dicionário que guarda ACKs esperados {msg_id: {"event": Event, "response": dict}}
+        self._pending_acks: Dict[str, Dict[str, Any]] = {}  # SENDs em voo aguardando ACK {msg_id: {"future", "msg", "attempt", "timer", ...}}
+        self._janelas: Dict[str, Dict[str, Any]] = {}  # Janela por peer {dst: {"em_voo": int, "espera": deque de envios sem vaga}}
+        self._timer_proprio = None  # TimerWheel própria, só se o state não tiver uma compartilhada
+        self._rtts: Dict[str, RttEstimator] = {}  # Estimador de RTT/RTO por peer {peer_id: RttEstimator}
+        # Stream sequenciado (feature "seq"), por conexão: somem junto com a conexão
+        self._seq_envio = weakref.WeakKeyDictionary()  # {conexão: {"proximo": int, "em_voo": {seq: msg_id}}}
+        self._seq_recebe = weakref.WeakKeyDictionary()  # {conexão: {"esperado": int, "buffer": {seq: msg}, "sem_ack": int, "timer": handle}}
+        # msg_ids já entregues por peer de origem: retransmissões (ACK perdido) são confirmadas de novo sem reentregar
+        self._vistos = DedupCache(
+            max_por_peer=state.get_config("message_router", "dedup_size") or MAX_POR_PEER_PADRAO,
+            ttl=state.get_config("message_router", "dedup_ttl") or TTL_PADRAO,
+        )
         self._lock = threading.Lock()  # Lock para acesso thread-safe ao dicionário de pending_acks
+        self.estatisticas_pub = {"recebidos": 0, "duplicados": 0, "repassados": 0}  # Contadores do repasse de PUB (cmd_status)
         self._callbacks: List[Callable[[str, str, Dict[str, Any]], None]] = []  # Lista de funções callback chamadas quando mensagem é recebida
 
     def register_receive_callback(self, cb: Callable[[str, str, Dict[str, Any]], None]):
@@ -37,19 +64,36 @@ class MessageRouter:
         timeout: Optional[float] = None,
         retries: Optional[int] = None,
     ) -> Tuple[bool, Optional[Dict[str, Any]]]:
-        # Obtém configurações de timeout e retries do config.json (com fallbacks)
-        cfg_timeout = self.state.get_config("network", "ack_timeout") or 5
-        cfg_retries = self.state.get_config("message_router", "max_retries") or 2
+        # Versão bloqueante de send_async: aguarda o ACK (ou a falha após os retries)
+        return self.send_async(dst, payload, require_ack, ttl, timeout, retries).result()
 
-        # Usa valores passados como parâmetro ou valores do config
-        timeout = timeout or cfg_timeout
-        retries = retries if retries is not None else cfg_retries
+    def send_async(
+        self,
+        dst: str,
+        payload: str,
+        require_ack: bool = True,
+        ttl: int = 1,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        callback: Optional[Callable[[Future], None]] = None,
+    ) -> Future:
+        # Envia SEND sem bloquear: retorna um Future que resolve para (ok, ack) como send().
+        # Até "window" mensagens por peer ficam em voo (sem ACK); as demais aguardam vaga na janela.
+        # Timeout de ACK e retransmissões são prazos na TimerWheel: o timeout é o RTO estimado para o peer
+        # (ou `timeout`, se informado) e dobra a cada retransmissão.
+        # callback(future), se informado, é chamado quando o resultado estiver disponível.
+        futuro = Future()
+        if callback:
+            futuro.add_done_callback(callback)
+
+        # Obtém configuração de retries do config.json (com fallback)
+        cfg_retries = self.state.get_config("message_router", "max_retries") or 2
 
         # Verifica se o peer está conectado
-        peer_conn = self.state.get_conexao(dst)
-        if not peer_conn:
+        if not self.state.get_conexao(dst):
             logger.warning(f"[MessageRouter] Peer {dst} não conectado")
-            return False, None
+            futuro.set_result((False, None))
+            return futuro
 
         # Gera ID único para a mensagem
         msg_id = str(uuid.uuid4())
@@ -63,86 +107,263 @@ class MessageRouter:
             "ttl": ttl,
         }
 
-        # Cria estrutura para aguardar ACK com Event (para sincronização entre threads)
-        pending = {"event": threading.Event(), "response": None}
+        # Sem ACK não há o que esperar: não ocupa a janela
+        if not require_ack:
+            futuro.set_result((self._transmite(dst, msg), None))
+            return futuro
 
-        # Registra ACK pendente no dicionário (thread-safe)
+        pending = {
+            "dst": dst,
+            "msg": msg,
+            "future": futuro,
+            "timeout": timeout,  # Timeout fixo do chamador; None = RTO estimado
+            "retries": retries if retries is not None else cfg_retries,
+            "attempt": 0,
+            "timer": None,
+            "conexao": None,  # Conexão em que a mensagem foi sequenciada (feature "seq")
+            "seq": None,
+            "enviado_em": None,  # Instante da primeira transmissão (amostra de RTT se não houver retransmissão)
+            "sack": False,  # Recebido fora de ordem (SACK): não retransmite, aguarda o ACK cumulativo
+            "rapida": None,  # Tentativa em que houve retransmissão rápida (no máximo uma por tentativa)
+        }
+
+        # Entra na janela do peer ou aguarda vaga (thread-safe)
         with self._lock:
+            janela = self._janelas.setdefault(dst, {"em_voo": 0, "espera": deque()})
+            if janela["em_voo"] >= self._tamanho_janela():
+                janela["espera"].append(pending)
+                return futuro
+            janela["em_voo"] += 1
             self._pending_acks[msg_id] = pending
 
-        # Loop de retry com backoff exponencial
-        attempt = 0
-        while attempt <= retries:
-            try:
-                logger.debug(f"[MessageRouter] Enviando SEND {msg_id} para {dst} (tentativa {attempt + 1})")
-                peer_conn.enqueue_msg(msg)  # Envia mensagem para fila de envio
-
-                # Aguarda ACK com timeout (Event.wait() bloqueia até set() ser chamado ou timeout)
-                ok = pending["event"].wait(timeout)
-                if ok:
-                    # ACK recebido: desbloqueia Event e retorna resposta
-                    logger.debug(f"[MessageRouter] ACK recebido para {msg_id}")
-                    with self._lock:
-                        resp = self._pending_acks.pop(msg_id, {}).get("response")
-                    return True, resp
-                else:
-                    # Timeout: tenta novamente com backoff exponencial
-                    attempt += 1
-                    if attempt <= retries:
-                        backoff = 2 ** (attempt - 1)  # Backoff: 1s, 2s, 4s, 8s...
-                        logger.info(f"[MessageRouter] Timeout aguardando ACK, retry em {backoff}s")
-                        time.sleep(backoff)
-                    else:
-                        logger.warning(
-                            f"[MessageRouter] Falha: ACK não recebido para {msg_id} após {retries + 1} tentativas"
-                        )
-                        break
-            except Exception as e:
-                logger.exception(f"[MessageRouter] Erro ao enviar SEND para {dst}: {e}")
-                break
+        self._envia_tentativa(pending)
+        return futuro
+
+    def _tamanho_janela(self) -> int:
+        return self.state.get_config("message_router", "window") or 128
 
-        # Remove pending ACK do dicionário (não recebeu resposta)
+    def _timer_wheel(self) -> TimerWheel:
+        # TimerWheel compartilhada (ou uma própria, se o router for usado sem P2PClient); não chamar com self._lock
+        timer_wheel = self.state.get_timer_wheel()
+        if timer_wheel is None:
+            with self._lock:
+                if self._timer_proprio is None:
+                    self._timer_proprio = TimerWheel()
+                    self._timer_proprio.start()
+            timer_wheel = self._timer_proprio
+        return timer_wheel
+
+    def _agenda(self, atraso: float, fn: Callable, *args):
+        return self._timer_wheel().call_later(atraso, fn, *args)
+
+    def _transmite(self, dst: str, msg: Dict[str, Any]) -> bool:
+        # Enfileira na conexão atual do peer sem bloquear (pode ter reconectado desde o envio original)
+        peer_conn = self.state.get_conexao(dst)
+        if not peer_conn:
+            return False
+        try:
+            return peer_conn.enqueue_msg(msg, bloquear=False) is not False
+        except queue.Full as e:
+            # Fila de envio do peer cheia (peer lento): conta como tentativa perdida
+            logger.warning(f"[MessageRouter] SEND {msg['msg_id']} para {dst} não enfileirado: {e}")
+            return False
+        except Exception as e:
+            logger.exception(f"[MessageRouter] Erro ao enviar SEND para {dst}: {e}")
+            return False
+
+    def _envia_tentativa(self, pending: Dict[str, Any]):
+        # (Re)transmite e agenda o timeout de ACK desta tentativa
+        msg = pending["msg"]
         with self._lock:
-            self._pending_acks.pop(msg_id, None)
+            if msg["msg_id"] not in self._pending_acks:
+                return # ACK chegou ou envio já finalizado
+        logger.debug(f"[MessageRouter] Enviando SEND {msg['msg_id']} para {pending['dst']} (tentativa {pending['attempt'] + 1})")
+        peer_conn = self.state.get_conexao(pending["dst"])
+        if not peer_conn:
+            self._falha_peer(pending)
+            return
+        if "seq" in getattr(peer_conn, "features", ()):
+            seq, base = self._sequencia(pending, peer_conn)
+            msg = dict(msg, seq=seq, base=base)
+        if pending["enviado_em"] is None:
+            pending["enviado_em"] = time.monotonic()
+        self._transmite(pending["dst"], msg)
+        if pending["timeout"]:
+            espera = min(pending["timeout"] * 2 ** pending["attempt"], self.estimador_rtt(pending["dst"]).rto_maximo)
+        else:
+            espera = self.estimador_rtt(pending["dst"]).rto(pending["attempt"])
+        pending["timer"] = self._agenda(espera, self._timeout_ack, msg["msg_id"])
 
-        return False, None
+    def estimador_rtt(self, peer_id: str) -> RttEstimator:
+        # Estimador de RTT do peer (criado na primeira consulta); alimentado por ACKs e PONGs
+        with self._lock:
+            estimador = self._rtts.get(peer_id)
+            if estimador is None:
+                estimador = self._rtts[peer_id] = RttEstimator(
+                    rto_inicial=self.state.get_config("network", "ack_timeout") or 5,
+                    rto_minimo=(self.state.get_config("message_router", "min_rto_ms") or 200) / 1000,
+                    rto_maximo=self.state.get_config("message_router", "max_rto") or 60,
+                )
+            return estimador
+
+    def registra_rtt(self, peer_id: str, rtt: float):
+        # Amostra de RTT (segundos) medida fora do router, ex: PING/PONG do KeepAlive
+        self.estimador_rtt(peer_id).amostra(rtt)
+
+    def _amostra_ack(self, pendings: List[Dict[str, Any]]):
+        # Uma amostra por ACK: a mensagem confirmada mais recente que não foi retransmitida (algoritmo de Karn)
+        candidatos = [p for p in pendings if p["attempt"] == 0 and p["enviado_em"] is not None]
+        if candidatos:
+            ultimo = max(candidatos, key=lambda p: p["enviado_em"])
+            self.registra_rtt(ultimo["dst"], time.monotonic() - ultimo["enviado_em"])
+
+    def _sequencia(self, pending: Dict[str, Any], peer_conn) -> Tuple[int, int]:
+        # Número de sequência da mensagem na conexão atual; retransmissões na mesma conexão repetem o seq
+        # (o receptor descarta duplicatas), numa conexão nova a mensagem recebe o próximo seq dela.
+        # Retorna também a base: menor seq ainda em voo. Seqs abaixo dela foram confirmados ou abandonados,
+        # então o receptor não deve mais esperar por eles.
+        with self._lock:
+            stream = self._seq_envio.setdefault(peer_conn, {"proximo": 1, "em_voo": {}})
+            if pending["conexao"] is not peer_conn:
+                self._remove_em_voo_locked(pending)
+                pending["conexao"], pending["seq"] = peer_conn, stream["proximo"]
+                stream["em_voo"][stream["proximo"]] = pending["msg"]["msg_id"]
+                stream["proximo"] += 1
+            base = next(iter(stream["em_voo"])) # em_voo é inserido em ordem crescente de seq
+            return pending["seq"], base
 
-    def publish(self, dst: str, payload: str, ttl: int = 1) -> int:
-        # Obtém todas as conexões ativas
-        conexoes = self.state.get_todas_conexoes()
+    def _remove_em_voo_locked(self, pending: Dict[str, Any]):
+        stream = self._seq_envio.get(pending["conexao"]) if pending["conexao"] is not None else None
+        if stream:
+            stream["em_voo"].pop(pending["seq"], None)
+
+    def _timeout_ack(self, msg_id: str):
+        # Callback da TimerWheel: ACK não chegou no prazo
+        with self._lock:
+            pending = self._pending_acks.get(msg_id)
+        if not pending:
+            return
+        if pending.get("sack") and self.state.get_conexao(pending["dst"]) is pending["conexao"]:
+            # Já chegou (SACK) e aguarda o ACK cumulativo passar por ele: reenvia só para levar a base atual
+            # (sem contar tentativa), caso o receptor ainda espere por um seq abandonado
+            self._envia_tentativa(pending)
+            return
+        pending["sack"] = False
+        pending["attempt"] += 1
+        if pending["attempt"] <= pending["retries"]:
+            # Retransmite já; o próximo timeout é o dobro do anterior (backoff exponencial limitado)
+            logger.info(f"[MessageRouter] Timeout aguardando ACK para {msg_id}, retransmitindo (tentativa {pending['attempt'] + 1})")
+            self._envia_tentativa(pending)
+        else:
+            logger.warning(
+                f"[MessageRouter] Falha: ACK não recebido para {msg_id} após {pending['retries'] + 1} tentativas"
+            )
+            self._finaliza(msg_id, False, None)
+            if pending["conexao"] is not None:
+                self._anuncia_base(pending["conexao"])
+
+    def _anuncia_base(self, peer_conn):
+        # Depois de abandonar um seq, reenvia o menor SEND ainda em voo para levar a nova base ao receptor
+        # (sem isso, mensagens já recebidas depois da lacuna ficariam presas no buffer de reordenação)
+        with self._lock:
+            stream = self._seq_envio.get(peer_conn)
+            if not stream or not stream["em_voo"]:
+                return
+            seq, msg_id = next(iter(stream["em_voo"].items()))
+            pending = self._pending_acks.get(msg_id)
+        if pending:
+            self._transmite(pending["dst"], dict(pending["msg"], seq=seq, base=seq))
+
+    def _finaliza(self, msg_id: str, ok: bool, resp: Optional[Dict[str, Any]]):
+        # Resolve o Future, libera a vaga na janela e envia o próximo da fila de espera do peer
+        self._finaliza_varios([msg_id], ok, resp)
+
+    def _finaliza_varios(self, msg_ids: List[str], ok: bool, resp: Optional[Dict[str, Any]]):
+        # Os próximos da fila de espera são coletados sob o lock e despachados em laço. _envia_tentativa
+        # nunca volta a chamar _finaliza, então uma fila de espera longa não aprofunda a pilha
+        finalizados, proximos = [], []
+        with self._lock:
+            for msg_id in msg_ids:
+                pending = self._pending_acks.pop(msg_id, None)
+                if not pending:
+                    continue
+                self._remove_em_voo_locked(pending)
+                finalizados.append(pending)
+                proximo = self._libera_vaga_locked(pending["dst"])
+                if proximo:
+                    proximos.append(proximo)
+        for pending in finalizados:
+            if pending["timer"]:
+                pending["timer"].cancel()
+            pending["future"].set_result((ok, resp)) # Fora do lock: callbacks podem chamar send_async
+        for proximo in proximos:
+            self._envia_tentativa(proximo)
+
+    def _libera_vaga_locked(self, dst: str) -> Optional[Dict[str, Any]]:
+        # Vaga liberada na janela do peer: passa direto para o próximo da espera (retornado) ou é devolvida
+        janela = self._janelas.get(dst)
+        if not janela:
+            return None
+        if janela["espera"]:
+            proximo = janela["espera"].popleft()
+            self._pending_acks[proximo["msg"]["msg_id"]] = proximo
+            return proximo
+        janela["em_voo"] -= 1
+        if not janela["em_voo"]:
+            del self._janelas[dst]
+        return None
+
+    def _falha_peer(self, pending: Dict[str, Any]):
+        # Peer desconectado: falha este envio e toda a fila de espera do peer de uma vez (nada ganha a vaga).
+        # Os outros envios em voo para o peer seguem pelo próprio timeout (podem ir por uma reconexão)
+        dst = pending["dst"]
+        falhos = []
+        with self._lock:
+            if self._pending_acks.pop(pending["msg"]["msg_id"], None) is None:
+                return # ACK chegou ou envio já finalizado
+            self._remove_em_voo_locked(pending)
+            falhos.append(pending)
+            janela = self._janelas.get(dst)
+            if janela:
+                falhos.extend(janela["espera"])
+                janela["espera"].clear()
+                janela["em_voo"] -= 1
+                if not janela["em_voo"]:
+                    del self._janelas[dst]
+        logger.warning(f"[MessageRouter] Peer {dst} não conectado: {len(falhos)} SEND(s) falharam")
+        for falho in falhos:
+            if falho["timer"]:
+                falho["timer"].cancel()
+            falho["future"].set_result((False, None))
+
+    def publish(self, dst: str, payload: str, ttl: Optional[int] = None) -> int:
+        # ttl > 1: os vizinhos repassam o PUB (flood/gossip) até ttl saltos, alcançando peers sem conexão direta.
+        # Sem ttl usa "pub_ttl" do config (padrão 1 = só os vizinhos diretos, sem repasse).
         count = 0  # Contador de mensagens enviadas
+        if ttl is None:
+            ttl = self.state.get_config("message_router", "pub_ttl") or 1
+        ttl = max(1, min(ttl, self._max_pub_ttl()))
 
-        # Itera sobre todas as conexões para enviar PUB
-        for peer_id, conn in conexoes.items():
-            if dst == "*":
-                # Broadcast: envia para TODOS os peers conectados
-                msg = {
-                    "type": "PUB",
-                    "msg_id": str(uuid.uuid4()),
-                    "src": self.state.get_peer_info(),
-                    "dst": dst,
-                    "payload": payload,
-                    "ttl": ttl,
-                }
-                conn.enqueue_msg(msg)
-                logger.debug(f"[MessageRouter] PUB enviado para {peer_id} (broadcast)")
-                count += 1
-            elif dst.startswith("#"):
-                # Namespace-cast: envia apenas para peers do namespace especificado
-                ns = dst.lstrip("#")  # Remove o # do início (ex: "#CIC" -> "CIC")
-                parts = peer_id.split("@")  # Separa nome e namespace (ex: "alice@CIC" -> ["alice", "CIC"])
-                if len(parts) == 2 and parts[1] == ns:  # Verifica se o namespace do peer corresponde
-                    msg = {
-                        "type": "PUB",
-                        "msg_id": str(uuid.uuid4()),
-                        "src": self.state.get_peer_info(),
-                        "dst": dst,
-                        "payload": payload,
-                        "ttl": ttl,
-                    }
-                    conn.enqueue_msg(msg)
-                    logger.debug(f"[MessageRouter] PUB enviado para {peer_id} (namespace #{ns})")
-                    count += 1
+        # Uma única mensagem (um msg_id) por publicação, enfileirada em todas as conexões: cada escritor
+        # reaproveita os bytes já codificados pelo primeiro (fan-out = uma codificação + N pushes em fila)
+        msg = MensagemCompartilhada(
+            type="PUB",
+            msg_id=str(uuid.uuid4()),
+            src=self.state.get_peer_info(),
+            dst=dst,
+            payload=payload,
+            ttl=ttl,
+        )
+        # Registra o próprio msg_id: cópias que voltarem pelos vizinhos são duplicatas (não reentrega nem repassa)
+        self._vistos.ja_visto(msg["src"], msg["msg_id"])
+        alvos = self._alvos_pub(dst, ttl)
+
+        # Itera sobre as conexões de destino para enviar PUB
+        for peer_id, conn in alvos.items():
+            if not self._enfileira_pub(conn, msg):
+                continue
+            logger.debug(f"[MessageRouter] PUB enviado para {peer_id} ({dst})")
+            count += 1
 
         # Log do resultado final baseado na quantidade de peers que receberam
         if count == 0:
@@ -156,20 +377,87 @@ class MessageRouter:
 
         return count
 
+    def _alvos_pub(self, dst: str, ttl: int) -> Dict[str, Any]:
+        # Conexões que recebem um PUB (publicado ou repassado) para dst
+        if dst == "*":
+            return self.state.get_todas_conexoes()  # Broadcast: envia para TODOS os peers conectados
+        if not dst.startswith("#"):
+            return {}
+        if ttl > 1 and self.state.get_config("message_router", "pub_transit"):
+            # "pub_transit": vizinhos de outros namespaces também recebem, só para repassar (membros sem
+            # conexão direta podem estar atrás deles); a entrega continua só nos membros
+            return self.state.get_todas_conexoes()
+        # Namespace-cast: só os membros do namespace, direto do índice do State (ex: "#CIC" -> "CIC"),
+        # também no repasse: o PUB não passa por peers de fora do namespace
+        return self.state.get_conexoes_namespace(dst.lstrip("#"))
+
+    def _repassa_pub(self, msg: Dict[str, Any], peer_conn) -> int:
+        # Repasse (flood) de um PUB recebido pela primeira vez, com ttl - 1, para os vizinhos exceto quem o enviou
+        # e a origem (em namespace-cast, só os vizinhos membros do namespace, salvo "pub_transit"). No modo
+        # "fanout" (gossip) só gossip_fanout vizinhos sorteados recebem: menos cópias redundantes em malhas
+        # densas, ao custo de entrega probabilística. O DedupCache garante um repasse por msg_id.
+        ttl = min(msg.get("ttl"), self._max_pub_ttl()) - 1
+        src = msg.get("src")
+        vizinhos = [
+            (peer_id, conn) for peer_id, conn in self._alvos_pub(msg.get("dst") or "*", ttl).items()
+            if conn is not peer_conn and peer_id != src
+        ]
+        if self.state.get_config("message_router", "gossip_mode") == "fanout":
+            fanout = self.state.get_config("message_router", "gossip_fanout") or GOSSIP_FANOUT_PADRAO
+            if len(vizinhos) > fanout:
+                vizinhos = random.sample(vizinhos, fanout)
+
+        # Mesma mensagem (msg_id, src de origem, dst, payload) com um salto a menos, codificada uma vez para todos
+        repasse = MensagemCompartilhada(msg, ttl=ttl)
+        count = 0
+        for peer_id, conn in vizinhos:
+            if self._enfileira_pub(conn, repasse):
+                count += 1
+        if count:
+            with self._lock:
+                self.estatisticas_pub["repassados"] += count
+            logger.debug(f"[MessageRouter] PUB {msg.get('msg_id')} de {src} repassado para {count} peer(s) (ttl={ttl})")
+        return count
+
+    def _max_pub_ttl(self) -> int:
+        return self.state.get_config("message_router", "max_pub_ttl") or MAX_PUB_TTL_PADRAO
+
+    def _enfileira_pub(self, conn, msg: Dict[str, Any]) -> bool:
+        # Um peer com a lane de PUB cheia (política "fail"/"block") não impede o envio aos demais
+        try:
+            return conn.enqueue_msg(msg) is not False
+        except queue.Full as e:
+            logger.warning(f"[MessageRouter] PUB para {conn.peer_id_remoto} descartado: {e}")
+            return False
+
     def process_incoming(self, msg: Dict[str, Any], peer_conn) -> None:
         # Processa mensagens recebidas (ACK/SEND/PUB) e roteia para tratamento adequado
         t = msg.get("type")
         try:
-            if t == "ACK":
-                # ACK recebido: desbloqueia thread que está aguardando no send()
+            if t == "ACK" and "cum" in msg:
+                # ACK cumulativo + SACK do stream sequenciado: confirma vários SENDs de uma vez
+                self._processa_ack_seq(msg, peer_conn)
+
+            elif t == "ACK":
+                # ACK recebido: resolve o Future do send_async/send e libera a vaga na janela
                 orig_id = msg.get("msg_id")
                 with self._lock:
                     pending = self._pending_acks.get(orig_id)
-                    if pending:
-                        pending["response"] = msg  # Armazena resposta ACK
-                        pending["event"].set()  # Desbloqueia Event.wait() no método send()
-                    else:
-                        logger.debug(f"[MessageRouter] ACK para mensagem desconhecida {orig_id}")
+                if pending:
+                    logger.debug(f"[MessageRouter] ACK recebido para {orig_id}")
+                    self._amostra_ack([pending])
+                    self._finaliza(orig_id, True, msg)
+                else:
+                    logger.debug(f"[MessageRouter] ACK para mensagem desconhecida {orig_id}")
+
+            elif t == "SEND" and msg.get("seq") is not None and "seq" in getattr(peer_conn, "features", ()):
+                # SEND sequenciado: entrega em ordem e exatamente uma vez; o ACK sai agrupado depois
+                for m in self._recebe_seq(msg, peer_conn):
+                    if self._vistos.ja_visto(m.get("src"), m.get("msg_id")):
+                        # Já entregue por uma conexão anterior (reenviado após reconexão)
+                        logger.debug(f"[MessageRouter] SEND duplicado {m.get('msg_id')} de {m.get('src')} ignorado")
+                        continue
+                    self._notify_receive(m.get("src"), m.get("payload"), {"type": "SEND", "msg": m})
 
             elif t == "SEND":
                 # SEND recebido: notifica callbacks e envia ACK se necessário
@@ -177,10 +465,14 @@ class MessageRouter:
                 payload = msg.get("payload")
                 require_ack = msg.get("require_ack", False)
 
-                # Notifica todos os callbacks registrados (ex: imprime mensagem no console)
-                self._notify_receive(src, payload, {"type": "SEND", "msg": msg})
+                # Notifica todos os callbacks registrados (ex: imprime mensagem no console),
+                # a menos que seja uma retransmissão de algo já entregue (nosso ACK se perdeu)
+                if self._vistos.ja_visto(src, msg.get("msg_id")):
+                    logger.debug(f"[MessageRouter] SEND duplicado {msg.get('msg_id')} de {src}; reenviando ACK")
+                else:
+                    self._notify_receive(src, payload, {"type": "SEND", "msg": msg})
 
-                # Envia ACK de volta se a mensagem requer confirmação
+                # Envia ACK de volta se a mensagem requer confirmação (também para duplicatas)
                 if require_ack:
                     ack = {
                         "type": "ACK",
@@ -196,10 +488,24 @@ class MessageRouter:
                         logger.exception("Erro ao enviar ACK")
 
             elif t == "PUB":
-                # PUB recebido: notifica callbacks (não requer ACK)
+                # PUB recebido: notifica callbacks (não requer ACK); duplicatas (mesmo PUB chegando por outro
+                # caminho da malha) são descartadas antes de entregar ou repassar
                 src = msg.get("src")
                 payload = msg.get("payload")
-                self._notify_receive(src, payload, {"type": "PUB", "msg": msg})
+                with self._lock:
+                    self.estatisticas_pub["recebidos"] += 1
+                if self._vistos.ja_visto(src, msg.get("msg_id")):
+                    with self._lock:
+                        self.estatisticas_pub["duplicados"] += 1
+                    logger.debug(f"[MessageRouter] PUB duplicado {msg.get('msg_id')} de {src} ignorado")
+                    return
+                # Com "pub_transit" o namespace-cast repassado passa por peers de outros namespaces: estes só repassam
+                dst = msg.get("dst") or "*"
+                if dst == "*" or dst.lstrip("#") == self.state.namespace:
+                    self._notify_receive(src, payload, {"type": "PUB", "msg": msg})
+                ttl = msg.get("ttl")
+                if isinstance(ttl, int) and ttl > 1:
+                    self._repassa_pub(msg, peer_conn)
 
             else:
                 # Tipo de mensagem desconhecido (ignora)
@@ -208,13 +514,142 @@ class MessageRouter:
         except Exception:
             logger.exception("[MessageRouter] Erro ao processar mensagem recebida")
 
+    def _processa_ack_seq(self, ack: Dict[str, Any], peer_conn):
+        # Finaliza todo SEND em voo nesta conexão com seq <= cum (entregue em ordem). Os que estão em algum
+        # intervalo SACK já chegaram e não são retransmitidos, mas continuam ocupando a janela até o cum
+        # passar por eles; assim o buffer de reordenação do receptor nunca passa do tamanho da janela.
+        cum = ack.get("cum") or 0
+        intervalos = [(a, b) for a, b in (ack.get("sack") or [])]
+        confirmados = []
+        with self._lock:
+            stream = self._seq_envio.get(peer_conn)
+            if not stream:
+                return
+            novos = [] # Confirmados pela primeira vez por este ACK (só eles dão amostra de RTT)
+            for seq, msg_id in stream["em_voo"].items():
+                pending = self._pending_acks.get(msg_id)
+                if seq <= cum:
+                    confirmados.append(msg_id)
+                    if pending and not pending["sack"]:
+                        novos.append(pending)
+                elif pending and not pending["sack"] and any(a <= seq <= b for a, b in intervalos):
+                    pending["sack"] = True
+                    novos.append(pending)
+
+            # Retransmissão rápida: lacuna com LIMIAR_RETRANSMISSAO_RAPIDA seqs posteriores já recebidos
+            # provavelmente se perdeu; não espera o RTO (uma vez por tentativa, conta como retransmissão)
+            maior_sack = max((b for _, b in intervalos), default=0)
+            rapidas = []
+            for seq, msg_id in stream["em_voo"].items():
+                if seq + LIMIAR_RETRANSMISSAO_RAPIDA > maior_sack:
+                    break
+                pending = self._pending_acks.get(msg_id)
+                if (seq > cum and pending and not pending["sack"] and pending["rapida"] != pending["attempt"]
+                        and pending["attempt"] < pending["retries"]):
+                    pending["rapida"] = pending["attempt"] = pending["attempt"] + 1
+                    rapidas.append(pending)
+        self._amostra_ack(novos)
+        for pending in rapidas:
+            if pending["timer"]:
+                pending["timer"].cancel()
+            self._envia_tentativa(pending)
+        self._finaliza_varios(confirmados, True, ack)
+
+    def _recebe_seq(self, msg: Dict[str, Any], peer_conn) -> List[Dict[str, Any]]:
+        # Buffer de reordenação: retorna as mensagens que podem ser entregues agora, em ordem
+        seq = msg["seq"]
+        limite_buffer = self.state.get_config("message_router", "reorder_buffer") or 1024
+        ack_a_cada = self.state.get_config("message_router", "ack_every") or 32
+        entregar = []
+        timer_wheel = self._timer_wheel()
+        with self._lock:
+            recebe = self._seq_recebe.get(peer_conn)
+            if recebe is None:
+                recebe = self._seq_recebe[peer_conn] = {"esperado": 1, "buffer": {}, "sem_ack": 0, "timer": None}
+            base = msg.get("base") or 0
+            if base > recebe["esperado"]:
+                # O remetente desistiu dos seqs que faltam abaixo da base: entrega o que já chegou e pula a lacuna
+                for anterior in sorted(k for k in recebe["buffer"] if k < base):
+                    entregar.append(recebe["buffer"].pop(anterior))
+                logger.debug(f"[MessageRouter] Seqs {recebe['esperado']}..{base - 1} de {peer_conn.peer_id_remoto} abandonados pelo remetente")
+                recebe["esperado"] = base
+            if seq == recebe["esperado"]:
+                entregar.append(msg)
+                recebe["buffer"].pop(seq, None) # Cópia anterior que ficou no buffer quando a base pulou até ela
+                recebe["esperado"] += 1
+            elif seq > recebe["esperado"] and seq not in recebe["buffer"]:
+                if len(recebe["buffer"]) < limite_buffer:
+                    recebe["buffer"][seq] = msg # Fora de ordem: aguarda os anteriores
+                else:
+                    logger.warning(f"[MessageRouter] Buffer de reordenação cheio para {peer_conn.peer_id_remoto}; seq {seq} descartado")
+            else:
+                logger.debug(f"[MessageRouter] SEND duplicado seq {seq} de {peer_conn.peer_id_remoto} ignorado")
+            while recebe["esperado"] in recebe["buffer"]: # Libera o que estava esperando por este seq (ou pela base)
+                entregar.append(recebe["buffer"].pop(recebe["esperado"]))
+                recebe["esperado"] += 1
+
+            # Duplicatas também são confirmadas (o ACK anterior pode ter se perdido)
+            recebe["sem_ack"] += 1
+            imediato = recebe["sem_ack"] >= ack_a_cada
+            if not imediato and recebe["timer"] is None:
+                intervalo = (self.state.get_config("message_router", "ack_interval_ms") or 10) / 1000
+                recebe["timer"] = timer_wheel.call_later(intervalo, self._envia_ack_seq, peer_conn)
+        if imediato:
+            self._envia_ack_seq(peer_conn)
+        return entregar
+
+    def _envia_ack_seq(self, peer_conn):
+        # ACK cumulativo (último seq entregue em ordem) + intervalos SACK do que está no buffer
+        with self._lock:
+            recebe = self._seq_recebe.get(peer_conn)
+            if not recebe or not recebe["sem_ack"]:
+                return
+            if recebe["timer"]:
+                recebe["timer"].cancel()
+            recebe["timer"] = None
+            recebe["sem_ack"] = 0
+            cum = recebe["esperado"] - 1
+            sack = []
+            for seq in sorted(recebe["buffer"]):
+                if sack and seq == sack[-1][1] + 1:
+                    sack[-1][1] = seq
+                else:
+                    if len(sack) == MAX_INTERVALOS_SACK:
+                        break
+                    sack.append([seq, seq])
+        ack = {
+            "type": "ACK",
+            "cum": cum,
+            "sack": sack,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "src": self.state.get_peer_info(),
+            "dst": peer_conn.peer_id_remoto,
+            "ttl": 1,
+        }
+        try:
+            peer_conn.enqueue_msg(ack, bloquear=False)
+        except queue.Full as e:
+            logger.warning(f"[MessageRouter] ACK para {peer_conn.peer_id_remoto} descartado: {e}")
+
     def shutdown(self):
-        # Desbloqueia todas as threads aguardando ACKs e limpa o dicionário
+        # Falha todos os envios pendentes (em voo e em espera), liberando quem aguarda send()
         with self._lock:
-            for k, v in list(self._pending_acks.items()):
-                try:
-                    v["response"] = None  # Marca resposta como None (não recebida)
-                    v["event"].set()  # Desbloqueia Event.wait() para liberar threads travadas
-                except Exception:
-                    pass
+            pendentes = list(self._pending_acks.values())
+            for janela in self._janelas.values():
+                pendentes.extend(janela["espera"])
             self._pending_acks.clear()  # Limpa dicionário de ACKs pendentes
+            self._janelas.clear()
+            self._seq_envio.clear()
+            for recebe in self._seq_recebe.values():
+                if recebe["timer"]:
+                    recebe["timer"].cancel()
+            self._seq_recebe.clear()
+            timer_proprio, self._timer_proprio = self._timer_proprio, None
+        self._vistos.limpa()
+        for pending in pendentes:
+            if pending["timer"]:
+                pending["timer"].cancel()
+            if not pending["future"].done():
+                pending["future"].set_result((False, None))
+        if timer_proprio:
+            timer_proprio.stop()
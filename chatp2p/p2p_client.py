@@ -2,11 +2,14 @@ import socket
 import threading
 import time
 import logging
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable
 from peer_server import PeerServer
+from async_engine import AsyncEngine
 from peer_connection import PeerConnection, PeerConnectionError
 from message_router import MessageRouter
-from rendezvous_connection import discover, register, unregister, RendezvousError
+from timer_wheel import TimerWheel
+from rendezvous_connection import discover, register, unregister, heartbeat, RendezvousError, RendezvousServerErro
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +17,11 @@ class P2PClient:
     def __init__(self, state):
         self.state = state  # Referência para o estado compartilhado
         self.peer_server = None  # Servidor TCP para aceitar conexões inbound
+        self.engine = None  # Event loop asyncio (servidor + conexões) quando network.engine = "asyncio"
         self._rodando = threading.Event()  # Flag para indicar se o cliente P2P está rodando
-        self._thread_discover = None  # Thread para discover automático de peers
-        self._thread_reregister = None  # Thread para re-registro automático no Rendezvous
+        self.timer_wheel = None  # Temporizador compartilhado (keep-alives, discover, re-registro)
+        self._executor = None  # Executa as rodadas de discover/re-registro (I/O bloqueante fora da TimerWheel)
+        self._temporizadores = {}  # {nome da rodada: handle do próximo prazo agendado}
 
         # Rastreamento de peers com falha de conexão para implementar backoff exponencial
         self._peers_com_falha = {}  # {peer_id: {'timestamp': float, 'tentativas': int}}
@@ -26,10 +31,22 @@ class P2PClient:
     def start(self):
         # Inicia o cliente P2P: servidor TCP, message router e threads de discover/re-registro
         try:
+            # Um único temporizador para todos os prazos periódicos, independente do número de peers
+            self.timer_wheel = TimerWheel()
+            self.timer_wheel.start()
+            self.state.set_timer_wheel(self.timer_wheel)
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="P2PClient")
+
             # Cria e inicia servidor TCP para aceitar conexões inbound de outros peers
-            self.peer_server = PeerServer(self.state)
-            self.peer_server.start()
-            logger.debug(f"[P2PClient] PeerServer iniciado na porta {self.state.port}")
+            # ("threads": PeerServer + threads por conexão; "asyncio": um event loop para todas as conexões)
+            if self.state.get_config("network", "engine") == "asyncio":
+                self.engine = AsyncEngine(self.state)
+                self.engine.start()
+                logger.debug(f"[P2PClient] AsyncEngine iniciado na porta {self.state.port}")
+            else:
+                self.peer_server = PeerServer(self.state)
+                self.peer_server.start()
+                logger.debug(f"[P2PClient] PeerServer iniciado na porta {self.state.port}")
 
             # Instancia e registra o MessageRouter no state para gerenciar SEND/ACK/PUB
             try:
@@ -48,19 +65,13 @@ class P2PClient:
             # Marca o cliente como rodando
             self._rodando.set()
 
-            # Cria e inicia thread de discover automático (busca peers a cada 60s)
-            self._thread_discover = threading.Thread(target=self._loop_discover,
-                                                    name="P2PClient_Discover",
-                                                    daemon=True)
-            self._thread_discover.start()
-            logger.debug("[P2PClient] Loop de discover iniciado")
+            # Agenda a primeira rodada de discover automático (as seguintes são reagendadas por ela)
+            self._agenda_rodada("discover", 0, self._rodada_discover)
+            logger.debug("[P2PClient] Discover automático agendado")
 
-            # Cria e inicia thread de re-registro automático (renova TTL antes de expirar)
-            self._thread_reregister = threading.Thread(target=self._loop_reregister,
-                                                      name="P2PClient_Reregister",
-                                                      daemon=True)
-            self._thread_reregister.start()
-            logger.debug("[P2PClient] Loop de re-registro iniciado")
+            # Agenda a primeira verificação de re-registro automático (renova TTL antes de expirar)
+            self._agenda_rodada("reregister", 0, self._rodada_reregister)
+            logger.debug("[P2PClient] Re-registro automático agendado")
 
         except Exception as e:
             logger.error(f"[P2PClient] Erro ao iniciar PeerServer: {e}")
@@ -93,15 +104,19 @@ class P2PClient:
                 self.peer_server.stop()
                 logger.debug("[P2PClient] PeerServer parado")
 
-            thread_atual = threading.current_thread()
+            if self.engine:
+                self.engine.stop()
+                logger.debug("[P2PClient] AsyncEngine parado")
 
-            if self._thread_discover and self._thread_discover.is_alive():
-                if thread_atual != self._thread_discover:
-                    self._thread_discover.join(timeout=5)
+            # Cancela as rodadas agendadas; uma rodada em execução termina sem reagendar
+            for temporizador in list(self._temporizadores.values()):
+                temporizador.cancel()
+            if self._executor:
+                self._executor.shutdown(wait=False)
 
-            if self._thread_reregister and self._thread_reregister.is_alive():
-                if thread_atual != self._thread_reregister:
-                    self._thread_reregister.join(timeout=5)
+            if self.timer_wheel:
+                self.timer_wheel.stop()
+                logger.debug("[P2PClient] TimerWheel parada")
 
         except Exception as e:
             logger.error(f"[P2PClient] Erro ao parar threads: {e}")
@@ -180,12 +195,15 @@ class P2PClient:
                     continue
 
                 # Tenta conectar em paralelo (não aguarda término)
-                thread = threading.Thread(
-                    target=self._tentar_conectar_thread,
-                    args=(peer,),
-                    daemon=True
-                )
-                thread.start()
+                if self.engine:
+                    self.engine.agenda_conexao(peer, self._fim_conexao_agendada)
+                else:
+                    thread = threading.Thread(
+                        target=self._tentar_conectar_thread,
+                        args=(peer,),
+                        daemon=True
+                    )
+                    thread.start()
                 count_tentativas += 1
 
             logger.info(f"[P2PClient] Discover forçado concluído. {count_tentativas} tentativas de conexão iniciadas em background.")
@@ -202,98 +220,180 @@ class P2PClient:
         if not sucesso:
             self._registra_falha_conexao(peer_id_remoto)  # Registra falha se não conectou
 
-    def _loop_discover(self):
-        intervalo = self.state.get_config("rendezvous", "discover_interval")
-        max_threads_simultaneas = 10  # Limite de threads simultâneas
-
-        while self._rodando.is_set():
-            try:
-                peers = discover(self.state)
-                meu_peer_id = self.state.peer_id
-
-                # Lista de threads para conexões em paralelo
-                threads_conexao = []
-
-                for peer in peers:
-                    peer_id_remoto = f"{peer['name']}@{peer['namespace']}"
-
-                    # Pula se for o próprio peer
-                    if peer_id_remoto == meu_peer_id:
-                        continue
-
-                    # Pula se já está conectado
-                    if self.state.verifica_conexao(peer_id_remoto):
-                        continue
-
-                    # Verifica backoff antes de tentar conectar
-                    if not self._deve_tentar_conectar(peer_id_remoto):
-                        continue
-
-                    # Cria thread para conectar em paralelo
-                    thread = threading.Thread(
-                        target=self._tentar_conectar_thread,
-                        args=(peer,),
-                        daemon=True
-                    )
-                    threads_conexao.append(thread)
-                    thread.start()
+    def _fim_conexao_agendada(self, peer: Dict[str, Any], sucesso: bool):
+        # Callback do AsyncEngine ao terminar uma tentativa de conexão (roda no event loop)
+        peer_id_remoto = f"{peer['name']}@{peer['namespace']}"
+        if sucesso:
+            self._limpa_falha_conexao(peer_id_remoto)
+        else:
+            self._registra_falha_conexao(peer_id_remoto)
+
+    def _agenda_rodada(self, nome: str, atraso: float, rodada: Callable[[], float]):
+        # Agenda uma rodada periódica na TimerWheel; a rodada roda no executor e retorna o atraso da próxima
+        if self._rodando.is_set():
+            self._temporizadores[nome] = self.timer_wheel.call_later(atraso, self._dispara_rodada, nome, rodada)
+
+    def _dispara_rodada(self, nome: str, rodada: Callable[[], float]):
+        # Callback da TimerWheel: só repassa ao executor (discover/registro fazem I/O bloqueante)
+        if not self._rodando.is_set():
+            return
+        try:
+            self._executor.submit(self._executa_rodada, nome, rodada)
+        except RuntimeError:
+            pass  # Executor já encerrado (stop em andamento)
 
-                    # Limita threads simultâneas
-                    if len(threads_conexao) >= max_threads_simultaneas:
-                        # Aguarda algumas threads terminarem antes de criar novas
-                        for t in threads_conexao[:5]:
-                            t.join(timeout=1)
-                        # Remove threads que já terminaram
-                        threads_conexao = [t for t in threads_conexao if t.is_alive()]
+    def _executa_rodada(self, nome: str, rodada: Callable[[], float]):
+        try:
+            proximo = rodada()
+        except Exception as e:
+            logger.error(f"[P2PClient] Erro na rodada de {nome}: {e}")
+            proximo = 30
+        self._agenda_rodada(nome, proximo, rodada)
 
-                # Aguarda todas as threads restantes terminarem (com timeout)
-                for thread in threads_conexao:
-                    thread.join(timeout=30)
+    def _rodada_discover(self) -> float:
+        # Uma rodada de discover automático; retorna quantos segundos esperar até a próxima
+        intervalo = self.state.get_config("rendezvous", "discover_interval")
+        max_threads_simultaneas = 10  # Limite de threads simultâneas
+        # DISCOVER limitado (opcional): quantos peers pedir e em que ordem (ex: "nearest" = mesma rede primeiro)
+        limite = self.state.get_config("rendezvous", "discover_limit")
+        amostra = self.state.get_config("rendezvous", "discover_sample")
 
-            except RendezvousError as e:
-                logger.error(f"[P2PClient] Erro no discover automático {e}")
+        try:
+            # A primeira rodada aproveita os peers que vieram junto com o REGISTER (sem nova requisição)
+            peers = self.state.peers_registro
+            self.state.peers_registro = None
+            if peers is None:
+                peers = discover(self.state, limit=limite, sample=amostra)
+            meu_peer_id = self.state.peer_id
 
-            time.sleep(intervalo)
+            # Lista de threads para conexões em paralelo
+            threads_conexao = []
 
-    def _loop_reregister(self):
-        intervalo_verificacao = 30  # Verifica a cada 30 segundos
+            for peer in peers:
+                peer_id_remoto = f"{peer['name']}@{peer['namespace']}"
 
-        while self._rodando.is_set():
-            try:
-                # Pega o TTL recebido e o timestamp do último registro
-                ttl_recebido = self.state.ttl_recebido
-                timestamp_registro = self.state.timestamp_registro
+                # Pula se for o próprio peer
+                if peer_id_remoto == meu_peer_id:
+                    continue
 
-                # Se ainda não registrou, espera e continua
-                if ttl_recebido is None or timestamp_registro is None:
-                    time.sleep(intervalo_verificacao)
+                # Pula se já está conectado
+                if self.state.verifica_conexao(peer_id_remoto):
                     continue
 
-                # Calcula quanto tempo falta para expirar
-                tempo_decorrido = time.time() - timestamp_registro
-                tempo_restante = ttl_recebido - tempo_decorrido
+                # Verifica backoff antes de tentar conectar
+                if not self._deve_tentar_conectar(peer_id_remoto):
+                    continue
 
-                # Threshold dinâmico: 10% do TTL ou threshold do config, o que for MENOR
-                threshold_config = self.state.get_config("rendezvous", "ttl_warning_treshold")
-                threshold = min(threshold_config, ttl_recebido * 0.1)
+                # Com asyncio a tentativa roda no event loop, sem thread por peer
+                if self.engine:
+                    self.engine.agenda_conexao(peer, self._fim_conexao_agendada)
+                    continue
 
-                # Se está próximo de expirar, re-registra
-                if tempo_restante <= threshold:
-                    logger.info(f"[P2PClient] TTL expirando em {tempo_restante:.0f}s. Iniciando re-registro...")
-                    try:
-                        register(self.state)
-                        logger.info(f"[P2PClient] Re-registro bem-sucedido! Novo TTL: {self.state.ttl_recebido}s")
-                    except RendezvousError as e:
-                        logger.error(f"[P2PClient] Erro ao re-registrar: {e}")
+                # Cria thread para conectar em paralelo
+                thread = threading.Thread(
+                    target=self._tentar_conectar_thread,
+                    args=(peer,),
+                    daemon=True
+                )
+                threads_conexao.append(thread)
+                thread.start()
 
-            except Exception as e:
-                logger.error(f"[P2PClient] Erro no loop de re-registro: {e}")
+                # Limita threads simultâneas
+                if len(threads_conexao) >= max_threads_simultaneas:
+                    # Aguarda algumas threads terminarem antes de criar novas
+                    for t in threads_conexao[:5]:
+                        t.join(timeout=1)
+                    # Remove threads que já terminaram
+                    threads_conexao = [t for t in threads_conexao if t.is_alive()]
+
+            # Aguarda todas as threads restantes terminarem (com timeout)
+            for thread in threads_conexao:
+                thread.join(timeout=30)
+
+        except RendezvousServerErro as e:
+            logger.error(f"[P2PClient] Erro no discover automático {e}")
+            if e.retry_after:
+                # Servidor bloqueou este IP: tentar antes do prazo só prolonga o bloqueio
+                logger.info(f"[P2PClient] Próximo discover em {e.retry_after}s (retry_after do servidor)")
+                return e.retry_after
+        except RendezvousError as e:
+            logger.error(f"[P2PClient] Erro no discover automático {e}")
+
+        # Usa o intervalo sugerido pelo servidor (menos polling em namespaces estáveis ou
+        # com o servidor sobrecarregado), limitado a uma faixa razoável
+        sugerido = self.state.discover_sugerido
+        if sugerido:
+            return min(600, max(5, sugerido))
+        return intervalo
+
+    def _rodada_reregister(self) -> float:
+        # Verifica o TTL e renova o registro se necessário; retorna quando verificar de novo
+        intervalo_verificacao = 30  # Verifica no máximo a cada 30 segundos (o registro pode mudar pela CLI)
+
+        # Pega o TTL recebido e o timestamp do último registro
+        ttl_recebido = self.state.ttl_recebido
+        timestamp_registro = self.state.timestamp_registro
+
+        # Se ainda não registrou, espera e verifica de novo
+        if ttl_recebido is None or timestamp_registro is None:
+            return intervalo_verificacao
+
+        # Calcula quanto tempo falta para expirar
+        tempo_decorrido = time.time() - timestamp_registro
+        tempo_restante = ttl_recebido - tempo_decorrido
+
+        # Threshold dinâmico: 10% do TTL ou threshold do config, o que for MENOR
+        threshold_config = self.state.get_config("rendezvous", "ttl_warning_treshold")
+        threshold = min(threshold_config, ttl_recebido * 0.1)
+
+        # Com sugestão do servidor (refresh_after), renova no momento indicado por ele
+        refresh_sugerido = self.state.refresh_sugerido
+        espera = tempo_restante - threshold
+        if refresh_sugerido:
+            espera = min(espera, refresh_sugerido - tempo_decorrido)
+
+        # Ainda não é hora de renovar: acorda no prazo de renovação (ou na próxima verificação)
+        if espera > 0:
+            return max(1, min(intervalo_verificacao, espera))
+
+        logger.info(f"[P2PClient] TTL expirando em {tempo_restante:.0f}s. Renovando registro...")
+        try:
+            # HEARTBEAT só com o lease (barato para o servidor); REGISTER completo como fallback
+            renovado = False
+            if self.state.lease:
+                try:
+                    heartbeat(self.state)
+                    renovado = True
+                    logger.info(f"[P2PClient] Lease renovado! Novo TTL: {self.state.ttl_recebido}s")
+                except RendezvousServerErro as e:
+                    if e.retry_after:
+                        raise  # IP bloqueado: o REGISTER também seria recusado
+                    # Lease recusado (expirou/desconhecido): faz REGISTER completo
+
+            if not renovado:
+                register(self.state)
+                logger.info(f"[P2PClient] Re-registro bem-sucedido! Novo TTL: {self.state.ttl_recebido}s")
+        except RendezvousServerErro as e:
+            logger.error(f"[P2PClient] Erro ao re-registrar: {e}")
+            if e.retry_after:
+                logger.info(f"[P2PClient] Nova tentativa de re-registro em {e.retry_after}s (retry_after do servidor)")
+                return e.retry_after
+            return intervalo_verificacao
+        except RendezvousError as e:
+            logger.error(f"[P2PClient] Erro ao re-registrar: {e}")
+            return intervalo_verificacao
 
-            time.sleep(intervalo_verificacao)
+        return 0  # Recalcula o próximo prazo com o novo TTL
 
 
     def conectar_com_peer(self, peer_info: Dict[str, Any]) -> bool:
         # Tenta conectar com um peer específico usando retry com backoff exponencial
+        if self.engine:
+            sucesso = self.engine.conectar(peer_info)
+            if sucesso:
+                self._limpa_falha_conexao(f"{peer_info['name']}@{peer_info['namespace']}")
+            return sucesso
+
         ip_remoto = peer_info.get("ip")
         porta = peer_info.get("port")
         peer_id_remoto = f"{peer_info['name']}@{peer_info['namespace']}"
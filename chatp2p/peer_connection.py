@@ -1,25 +1,416 @@
 import socket
 import json
+import struct
 import logging
 import threading
 import queue
+import time
 import uuid
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from keep_alive import KeepAlive
+from send_queue import SendQueue
+import frame_codec
+from frame_codec import (FEATURE_BINARIA, FEATURE_COMPRESSAO, TAMANHO_FRAME, TIPO_COMPRIMIDO,
+                         CompressorFrames, DescompressorFrames, MensagemCompartilhada)
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
 class PeerConnectionError(Exception): # Exceção base para erros de conexão entre peers
     pass
 
-class PeerConnection:
+MAX_LOTE_ESCRITA = 256 # Máximo de mensagens juntadas em um único envio
+MAX_BYTES_LOTE = 256 * 1024 # Máximo de bytes por envio (o resto vai no próximo)
+
+class FramedReader:
+    # Decodificador incremental de linhas (uma mensagem JSON por linha) ou de frames com prefixo de tamanho
+    # (binary-framing) com buffer de recepção fixo. Os bytes que chegam depois de uma mensagem ficam guardados
+    # para a próxima chamada, então várias mensagens no mesmo segmento TCP (ex: PING+SEND+ACK em rajada)
+    # são todas entregues, em ordem. A troca de linhas para frames depois do HELLO_OK não perde nada do buffer.
+    def __init__(self, sock: socket.socket, tamanho_maximo: int, tamanho_buffer: int = 65536):
+        self.sock = sock
+        self.tamanho_maximo = tamanho_maximo # Limite por mensagem, incluindo o '\n'
+        # O buffer sempre comporta uma mensagem de tamanho máximo inteira
+        self._buffer = bytearray(max(tamanho_buffer, tamanho_maximo + 1))
+        self._view = memoryview(self._buffer) # recv_into direto no buffer, sem bytes intermediários
+        self._inicio = 0 # Início dos dados ainda não consumidos
+        self._fim = 0 # Fim dos dados válidos no buffer
+        self._procura = 0 # Onde continuar procurando '\n' (não re-escaneia dados já vistos)
+
+    def pendente(self) -> int: # Bytes recebidos e ainda não entregues
+        return self._fim - self._inicio
+
+    def proxima_linha(self) -> bytes:
+        # Retorna a próxima linha completa (sem o '\n'), lendo do socket só quando necessário
+        while True:
+            pos = self._buffer.find(b'\n', self._procura, self._fim)
+            if pos >= 0:
+                if pos + 1 - self._inicio > self.tamanho_maximo:
+                    raise PeerConnectionError(f"Mensagem recebida excede tamanho máximo de {self.tamanho_maximo} bytes")
+                linha = bytes(self._view[self._inicio:pos]) # Única cópia por mensagem
+                self._inicio = self._procura = pos + 1
+                if self._inicio == self._fim: # Buffer esvaziou: volta ao começo sem mover nada
+                    self._inicio = self._fim = self._procura = 0
+                return linha
+
+            self._procura = self._fim
+            if self._fim - self._inicio >= self.tamanho_maximo:
+                raise PeerConnectionError(f"Mensagem recebida excede tamanho máximo de {self.tamanho_maximo} bytes")
+
+            if self._fim == len(self._buffer):
+                # Sem espaço no final: move a mensagem parcial para o início do buffer
+                pendente = self._fim - self._inicio
+                self._view[:pendente] = self._view[self._inicio:self._fim]
+                self._procura -= self._inicio
+                self._inicio, self._fim = 0, pendente
+
+            recebidos = self.sock.recv_into(self._view[self._fim:])
+            if not recebidos:
+                raise PeerConnectionError("Conexão fechada pelo peer")
+            self._fim += recebidos
+
+    def proximo_frame(self) -> memoryview:
+        # Retorna o corpo do próximo frame (sem o prefixo de tamanho) como memoryview do buffer, sem cópia.
+        # A view só é válida até a próxima leitura: decodifique antes de chamar de novo.
+        self._garante(TAMANHO_FRAME.size)
+        tamanho, = TAMANHO_FRAME.unpack_from(self._buffer, self._inicio)
+        if TAMANHO_FRAME.size + tamanho > self.tamanho_maximo:
+            raise PeerConnectionError(f"Mensagem recebida excede tamanho máximo de {self.tamanho_maximo} bytes")
+        self._garante(TAMANHO_FRAME.size + tamanho)
+        inicio = self._inicio + TAMANHO_FRAME.size
+        self._inicio = self._procura = inicio + tamanho
+        corpo = self._view[inicio:self._inicio]
+        if self._inicio == self._fim: # Buffer esvaziou: o próximo recv volta ao começo
+            self._inicio = self._fim = self._procura = 0
+        return corpo
+
+    def _garante(self, n: int):
+        # Lê do socket até ter pelo menos n bytes não consumidos no buffer
+        while self._fim - self._inicio < n:
+            if self._inicio + n > len(self._buffer):
+                # Não cabe a partir daqui: move o frame parcial para o início do buffer
+                pendente = self._fim - self._inicio
+                self._view[:pendente] = self._view[self._inicio:self._fim]
+                self._inicio, self._fim, self._procura = 0, pendente, pendente
+            recebidos = self.sock.recv_into(self._view[self._fim:])
+            if not recebidos:
+                raise PeerConnectionError("Conexão fechada pelo peer")
+            self._fim += recebidos
+
+def features_locais(state) -> List[str]:
+    # Features anunciadas no HELLO/HELLO_OK; "seq" (stream sequenciado com ACK cumulativo), "batch"
+    # (várias mensagens por linha) e "binary-framing" (frames binários após o handshake) podem ser desligadas no config
+    features = ["ack", "metrics"]
+    if state.get_config("message_router", "seq_stream"):
+        features.append("seq")
+    if state.get_config("network", "batch"):
+        features.append("batch")
+    if state.get_config("network", "binary_framing"):
+        features.append(FEATURE_BINARIA)
+        if state.get_config("network", "compress"):
+            features.append(FEATURE_COMPRESSAO) # Comprime sequências de frames binários: depende de binary-framing
+    return features
+
+
+def cria_compressao(state, features) -> tuple:
+    # (compressor, descompressor) da conexão se "compress" foi negociado, senão (None, None)
+    if FEATURE_COMPRESSAO not in features or FEATURE_BINARIA not in features:
+        return None, None
+    tamanho_maximo = state.get_config("network", "max_msg_size")
+    nivel = state.get_config("network", "compress_level")
+    limiar = state.get_config("network", "compress_min_bytes")
+    return (CompressorFrames(1 if nivel is None else nivel, tamanho_maximo, 512 if limiar is None else limiar),
+            DescompressorFrames(tamanho_maximo))
+
+
+TIPOS_BATCH = ("SEND", "PUB", "ACK") # Mensagens que podem viajar dentro de um BATCH
+CAMPOS_COMPARTILHADOS = ("src", "dst", "ttl") # Omitidos nas mensagens internas quando iguais aos do BATCH
+
+
+class MontadorLote:
+    # Monta os bytes de um envio do escritor a partir das mensagens da fila. Com a feature "batch",
+    # sequências de SEND/PUB/ACK viram um único frame BATCH por linha:
+    #   {"type":"BATCH","src":...,"dst":...,"ttl":1,"msgs":[{...},{...}]}
+    # e cada mensagem interna perde src/dst/ttl quando iguais aos do frame. As demais (PING, PONG, BYE...)
+    # vão em linhas próprias, sem mudar a ordem. Cada frame respeita o max_msg_size do receptor.
+    def __init__(self, codifica, src: str, dst: str, tamanho_maximo: int, agrupar: bool = True):
+        self._codifica = codifica # Codificação de uma mensagem avulsa (linha JSON com verificação de tamanho)
+        self._agrupar = agrupar
+        self._tamanho_maximo = tamanho_maximo
+        self._compartilhados = {"src": src, "dst": dst, "ttl": 1}
+        self._prefixo = None # Início do frame BATCH, montado só quando um lote de verdade se forma
+        self._partes: List[bytes] = [] # Frames já fechados
+        self._lote: List[tuple] = [] # Mensagens do BATCH em montagem [(msg, json interno)]
+        self._tamanho_lote = 0
+        self.mensagens = 0 # Mensagens adicionadas
+        self.tamanho = 0 # Bytes aproximados até agora (para o limite de bytes por envio)
+
+    def adiciona(self, msg: Dict[str, Any]):
+        self.mensagens += 1
+        if not self._agrupar or msg.get("type") not in TIPOS_BATCH:
+            self._fecha_lote()
+            self._partes.append(self._codifica(msg))
+            self.tamanho += len(self._partes[-1])
+            return
+
+        if isinstance(msg, MensagemCompartilhada):
+            interna_bytes = msg.codificada("batch", self._codifica_interna) # Mesmos bytes em todas as conexões
+        else:
+            interna_bytes = self._codifica_interna(msg)
+        if self._lote and len(self._prefixo_batch()) + self._tamanho_lote + len(interna_bytes) + 3 > self._tamanho_maximo:
+            self._fecha_lote() # Não cabe no frame atual: começa outro
+        self._lote.append((msg, interna_bytes))
+        self._tamanho_lote += len(interna_bytes) + 1
+        self.tamanho += len(interna_bytes) + 1
+
+    def _codifica_interna(self, msg: Dict[str, Any]) -> bytes:
+        interna = frame_codec.para_json(msg)
+        if interna is msg:
+            interna = msg.copy()
+        for campo, valor in self._compartilhados.items():
+            if interna.get(campo) == valor:
+                del interna[campo]
+        return json.dumps(interna, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+    def finaliza(self) -> bytes:
+        self._fecha_lote()
+        return b"".join(self._partes)
+
+    def _prefixo_batch(self) -> bytes:
+        if self._prefixo is None:
+            cabecalho = json.dumps({"type": "BATCH", **self._compartilhados}, ensure_ascii=False, separators=(",", ":"))
+            self._prefixo = (cabecalho[:-1] + ',"msgs":[').encode('utf-8')
+        return self._prefixo
+
+    def _fecha_lote(self):
+        if len(self._lote) == 1:
+            self._partes.append(self._codifica(self._lote[0][0])) # BATCH de uma mensagem só aumentaria a linha
+        elif self._lote:
+            self._partes.append(self._prefixo_batch() + b",".join(b for _, b in self._lote) + b"]}\n")
+        self._lote = []
+        self._tamanho_lote = 0
+
+
+def desempacota_lote(batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Reconstrói as mensagens de um BATCH recebido, devolvendo os campos compartilhados omitidos
+    msgs = []
+    for interna in batch.get("msgs") or []:
+        if not isinstance(interna, dict) or interna.get("type") not in TIPOS_BATCH:
+            logger.warning(f"[PeerConnection] Mensagem inválida dentro de BATCH ignorada: {interna}")
+            continue
+        for campo in CAMPOS_COMPARTILHADOS:
+            if campo not in interna and campo in batch:
+                interna[campo] = batch[campo]
+        msgs.append(frame_codec.de_json(interna))
+    return msgs
+
+
+class ProtocoloPeer:
+    # Parte do protocolo que não depende do engine: codificação das mensagens, montagem dos lotes de escrita,
+    # mensagens de controle (PING/PONG/BYE/BYE_OK) e despacho do que chega. PeerConnection (threads) e
+    # AsyncPeerConnection (asyncio) herdam daqui e só implementam o transporte: cada uma fornece
+    # state, peer_id_remoto, features, keep_alive, enqueue_msg, close e _envia_direct_msg (envio à frente da fila)
+
+    def envia_ping(self) -> str:
+        # Envia mensagem PING para medir RTT e manter conexão ativa
+        msg_id = str(uuid.uuid4())  # Gera um ID único para a mensagem
+
+        msg_ping = {
+            "type": "PING",
+            "msg_id": msg_id,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "ttl": 1
+        }
+
+        self._enfileira(msg_ping)  # Coloca a mensagem na fila de envio
+        logger.debug(f"[PeerConnection] Enviando PING para {self.peer_id_remoto}")
+        return msg_id  # Retorna msg_id para KeepAlive rastrear
+    
+    def _envia_pong(self, msg_ping: Dict[str, Any]): # Envia resposta PONG para um PING recebido
+        msg_pong = {
+            "type": "PONG",
+            "msg_id": msg_ping.get("msg_id"),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "ttl": 1
+        }
+        
+        self._enfileira(msg_pong)
+        logger.debug(f"[PeerConnection] Enviando PONG para {self.peer_id_remoto}")
+    
+    def _processa_pong(self, msg_pong: Dict[str, Any]): # Processa uma mensagem PONG recebida
+        if self.keep_alive:
+            self.keep_alive.processa_pong(msg_pong)
+        else:
+            logger.debug(f"[PeerConnection] PONG recebido de {self.peer_id_remoto}: {msg_pong}")
+        
+    def envia_bye(self, reason: str = "Encerrando sessão"): # Envia mensagem BYE para encerrar a conexão com um peer
+        # Dicionário com a mensagem BYE
+        msg_bye = {
+            "type": "BYE",
+            "msg_id": str(uuid.uuid4()),
+            "src": self.state.get_peer_info(),
+            "dst": self.peer_id_remoto,
+            "reason": reason,
+            "ttl": 1
+        }
+        
+        self._enfileira(msg_bye)
+        logger.debug(f"[PeerConnection] Enviando BYE para {self.peer_id_remoto}")
+        
+    def _envia_bye_ok(self, msg_bye: Dict[str, Any]): # Envia resposta BYE_OK para um BYE recebido
+        logger.info(f"[PeerConnection] BYE recebido de {self.peer_id_remoto}: {msg_bye.get('reason')}")
+        
+        # Dicionário com a mensagem BYE_OK
+        msg_bye_ok = {
+            "type": "BYE_OK",
+            "msg_id": msg_bye.get("msg_id"),
+            "src": self.state.get_peer_info(),
+            "dst": self.peer_id_remoto,
+            "ttl": 1
+        }
+        
+        try:
+            self._envia_direct_msg(msg_bye_ok) # Direto no transporte, à frente da fila
+            logger.debug(f"[PeerConnection] Enviando BYE_OK para {self.peer_id_remoto}")
+        except PeerConnectionError as e:
+            logger.error(f"[PeerConnection] Erro ao enviar BYE_OK para {self.peer_id_remoto}: {e}")
+        
+        self.close() # Fecha a conexão após enviar BYE_OK
+        
+    def _processa_bye_ok(self, msg_bye_ok: Dict[str, Any]): # Processa uma mensagem BYE_OK recebida
+        logger.info(f"[PeerConnection] BYE_OK recebido de {self.peer_id_remoto}")
+        self.close() # Fecha a conexão após receber BYE_OK
+
+    def _enfileira(self, msg: Dict[str, Any]) -> bool:
+        # Mensagens de controle geradas pela própria conexão: lane cheia vira log, não exceção
+        try:
+            return self.enqueue_msg(msg)
+        except queue.Full as e:
+            logger.warning(f"[PeerConnection] {msg.get('type')} para {self.peer_id_remoto} descartado: {e}")
+            return False
+
+    def tamanhos_fila(self) -> Dict[str, int]:
+        # Mensagens aguardando envio por lane (controle/send/pub)
+        return self._envia_queue.tamanhos()
+
+    def _codifica_msg(self, msg: Dict[str, Any]) -> bytes: # Converte uma mensagem para a linha JSON (ou frame binário) enviada no socket
+        if isinstance(msg, MensagemCompartilhada):
+            # Fan-out: codificada uma vez por formato e reaproveitada pelas outras conexões
+            return msg.codificada("binario" if FEATURE_BINARIA in self.features else "json", self._serializa_msg)
+        return self._serializa_msg(msg)
+
+    def _serializa_msg(self, msg: Dict[str, Any]) -> bytes:
+        if FEATURE_BINARIA in self.features:
+            # Negociado no handshake: frame com prefixo de tamanho, src/dst da própria conexão omitidos
+            msg_bytes = frame_codec.codifica(msg, self.state.get_peer_info(), self.peer_id_remoto)
+        else:
+            msg_json = json.dumps(frame_codec.para_json(msg), ensure_ascii = False) # Converte o dicionário em JSON
+            msg_bytes = (msg_json + "\n").encode('utf-8') # Adiciona nova linha e converte para bytes
+        
+        logger.debug(f"[PeerConnection] Enviando para {self.peer_id_remoto}: {msg.get('type')}") # Log de debug do envio
+
+        tamanho_maximo = self.state.get_config("network", "max_msg_size") # Obtém o tamanho máximo permitido para mensagens
+        if len(msg_bytes) > tamanho_maximo:
+            raise PeerConnectionError(f"Mensagem excede tamanho máximo de {tamanho_maximo} bytes") # Verifica tamanho da mensagem
+        return msg_bytes
+    
+    def _novo_lote(self) -> MontadorLote: # Agrupa SEND/PUB/ACK em BATCH se o peer negociou a feature
+        # Com binary-framing cada mensagem já é um frame compacto e sem src/dst: não precisa de BATCH
+        return MontadorLote(self._codifica_msg, self.state.get_peer_info(), self.peer_id_remoto,
+                            self.state.get_config("network", "max_msg_size"),
+                            agrupar="batch" in self.features and FEATURE_BINARIA not in self.features)
+
+    def _processa_msg_recebida(self, msg: Dict[str, Any]):
+        # Roteia mensagens recebidas para os handlers apropriados baseado no tipo
+        msg_type = msg.get("type")
+
+        try:
+            if msg_type == "PING":
+                self._envia_pong(msg)  # Responde com PONG
+            elif msg_type == "PONG":
+                self._processa_pong(msg)  # Calcula RTT e reseta falhas
+            elif msg_type == "BYE":
+                self._envia_bye_ok(msg)  # Responde BYE_OK e fecha conexão
+            elif msg_type == "BYE_OK":
+                self._processa_bye_ok(msg)  # Fecha conexão
+            elif msg_type == "SEND":
+                self._processa_send(msg)  # Delega para MessageRouter
+            elif msg_type == "ACK":
+                self._processa_ack(msg)  # Delega para MessageRouter
+            elif msg_type == "PUB":
+                self._processa_pub(msg)  # Delega para MessageRouter
+            elif msg_type == "BATCH":
+                for interna in desempacota_lote(msg):  # Várias SEND/PUB/ACK em uma linha
+                    self._processa_msg_recebida(interna)
+            else:
+                logger.warning(f"[PeerConnection] Mensagem desconhecida recebida de {self.peer_id_remoto}: {msg}")
+
+        except Exception as e:
+            logger.error(f"[PeerConnection] Erro ao processar mensagem de {self.peer_id_remoto}: {e}")
+
+    def _processa_send(self, msg: Dict[str, Any]):
+        # Processa mensagem SEND recebida: delega para MessageRouter que enviará ACK se necessário
+        try:
+            router = self.state.get_message_router()
+            if router:
+                router.process_incoming(msg, self)  # MessageRouter cuida de ACK e callbacks
+                return
+
+            # Fallback: entregar localmente e enviar ACK se necessário (caso MessageRouter não exista)
+            src = msg.get("src")
+            payload = msg.get("payload")
+            logger.info(f"[PeerConnection] SEND recebido de {src}: {payload}")
+
+            if msg.get("require_ack"):
+                ack = {
+                    "type": "ACK",
+                    "msg_id": msg.get("msg_id"),
+                    "timestamp": datetime.utcnow().isoformat() + "Z",
+                    "src": self.state.get_peer_info(),
+                    "dst": src,
+                    "ttl": 1,
+                }
+                self._enfileira(ack)
+
+        except Exception:
+            logger.exception("[PeerConnection] Erro ao processar SEND")
+
+    def _processa_ack(self, msg: Dict[str, Any]):
+        # Processa mensagem ACK recebida: delega para MessageRouter desbloquear thread aguardando
+        try:
+            router = self.state.get_message_router()
+            if router:
+                router.process_incoming(msg, self)  # MessageRouter desbloqueará Event.wait() no send()
+            else:
+                logger.info(f"[PeerConnection] ACK recebido: {msg}")
+        except Exception:
+            logger.exception("[PeerConnection] Erro ao processar ACK")
+
+    def _processa_pub(self, msg: Dict[str, Any]):
+        # Processa mensagem PUB recebida: delega para MessageRouter notificar callbacks
+        try:
+            router = self.state.get_message_router()
+            if router:
+                router.process_incoming(msg, self)  # MessageRouter chama callbacks registrados
+                return
+
+            # Fallback: apenas loga (caso MessageRouter não exista)
+            src = msg.get("src")
+            payload = msg.get("payload")
+            logger.info(f"[PeerConnection] PUB recebido de {src}: {payload}")
+        except Exception:
+            logger.exception("[PeerConnection] Erro ao processar PUB")
+
+
+class PeerConnection(ProtocoloPeer):
     def __init__(self, sock: socket.socket, peer_id_remoto: str, state, foi_iniciado: bool):
         self.sock = sock  # Socket TCP da conexão
         self.peer_id_remoto = peer_id_remoto  # ID do peer remoto (ex: alice@CIC)
         self.state = state  # Referência para o estado compartilhado
         self.foi_iniciado = foi_iniciado  # True se você iniciou a conexão (outbound), False se recebeu (inbound)
         self.keep_alive = None  # Instância de KeepAlive (apenas para conexões outbound)
+        self.features = set()  # Features negociadas no handshake (anunciadas pelos dois lados)
         
         # Extrair IP e porta remotos
         try:
@@ -27,7 +418,9 @@ class PeerConnection:
         except Exception:
             self.remoto_ip, self.remoto_porta = "unknown", 0
 
-        self._envia_queue: queue.Queue[Dict[str, Any]] = queue.Queue() # Fila para mensagens a serem enviadas (thread-safe)
+        # Fila de envio com lanes de prioridade (controle > SEND > PUB) e limite por lane (thread-safe)
+        self._envia_queue = SendQueue(state.get_config("send_queue", "lanes"),
+                                      timeout_bloqueio=state.get_config("send_queue", "block_timeout") or 5)
         
         self._rodando = threading.Event() 
         self._rodando.set() # Flag para indicar se a conexão está ativa
@@ -38,13 +431,31 @@ class PeerConnection:
         
         self._socket_lock = threading.Lock() # Lock para operações de socket thread-safe
         
+        # Leitor de mensagens da conexão: guarda o que sobrar de cada recv para as próximas leituras
+        self._leitor = FramedReader(sock, state.get_config("network", "max_msg_size"))
+        
         timeout = state.get_config("network", "connection_timeout")
         sock.settimeout(timeout) # Define timeout para operações de socket
         
+        # O escritor já junta as mensagens em lotes; o algoritmo de Nagle só atrasaria PING/ACK
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, AttributeError):
+            pass # Socket não TCP (ex: testes com socketpair)
+        
+        # Janela opcional (ms) para esperar mais mensagens antes de enviar um lote (0 = envia na hora)
+        self._janela_escrita = (state.get_config("network", "write_coalesce_ms") or 0) / 1000
+        self.msgs_enviadas = 0 # Mensagens enviadas pela fila (estatística)
+        self.envios = 0 # Chamadas sendall feitas pelo escritor (estatística)
+        self.compressor = None # CompressorFrames/DescompressorFrames se "compress" for negociado (criados no start)
+        self._descompressor = None
+        self._recebidas = deque() # Mensagens já decodificadas de um frame comprimido, aguardando o loop de leitura
+        
         logger.info(f"[PeerConnection] Criada conexão com {peer_id_remoto} ({self.remoto_ip}:{self.remoto_porta}) - Iniciador: {self.foi_iniciado}")
        
     
     def start(self): # Inicia as threads de leitura e escrita
+        self.compressor, self._descompressor = cria_compressao(self.state, self.features)
         self._thread_leitura = threading.Thread(target=self._loop_de_leitura,
                                                 name=f"PeerLeitura-{self.peer_id_remoto}",
                                                 daemon=True)
@@ -71,7 +482,7 @@ class PeerConnection:
                 "type": "HELLO",
                 "peer_id": self.state.get_peer_info(),
                 "version": "1.0",
-                "features": ["ack", "metrics"],
+                "features": features_locais(self.state),
                 "ttl": 1
             }
             
@@ -86,6 +497,7 @@ class PeerConnection:
             if resposta.get("type") != "HELLO_OK": # Resposta inesperada
                 logger.error(f"[PeerConnection] Resposta inesperada do peer {self.peer_id_remoto} durante handshake: {resposta}")
                 return False
+            self.features = set(features_locais(self.state)) & set(resposta.get("features") or [])
             
             logger.debug(f"[PeerConnection] Handshake bem sucedido com {self.peer_id_remoto}") # Handshake bem sucedido
             return True
@@ -104,12 +516,13 @@ class PeerConnection:
                 "type": "HELLO_OK",
                 "peer_id": self.state.get_peer_info(),	
                 "version": "1.0",
-                "features": ["ack", "metrics"],
+                "features": features_locais(self.state),
                 "ttl": 1
             }
             
             logger.debug(f"[PeerConnection] Enviando HELLO_OK para {self.peer_id_remoto}")
             self._envia_direct_msg(msg_hello_ok) # Envia mensagem HELLO_OK
+            self.features = set(msg_hello_ok["features"]) & set(msg_hello.get("features") or [])
             
             logger.info(f"[PeerConnection] Handshake bem sucedido com {self.peer_id_remoto}") # Handshake bem sucedido
             return True
@@ -118,76 +531,6 @@ class PeerConnection:
             logger.error(f"[PeerConnection] Erro no handshake com {self.peer_id_remoto}: {e}")
             return False
         
-    def envia_ping(self) -> str:
-        # Envia mensagem PING para medir RTT e manter conexão ativa
-        msg_id = str(uuid.uuid4())  # Gera um ID único para a mensagem
-
-        msg_ping = {
-            "type": "PING",
-            "msg_id": msg_id,
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "ttl": 1
-        }
-
-        self._envia_queue.put(msg_ping)  # Coloca a mensagem na fila de envio
-        logger.debug(f"[PeerConnection] Enviando PING para {self.peer_id_remoto}")
-        return msg_id  # Retorna msg_id para KeepAlive rastrear
-    
-    def _envia_pong(self, msg_ping: Dict[str, Any]): # Envia resposta PONG para um PING recebido
-        msg_pong = {
-            "type": "PONG",
-            "msg_id": msg_ping.get("msg_id"),
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "ttl": 1
-        }
-        
-        self._envia_queue.put(msg_pong)
-        logger.debug(f"[PeerConnection] Enviando PONG para {self.peer_id_remoto}")
-    
-    def _processa_pong(self, msg_pong: Dict[str, Any]): # Processa uma mensagem PONG recebida
-        if self.keep_alive:
-            self.keep_alive.processa_pong(msg_pong)
-        else:
-            logger.debug(f"[PeerConnection] PONG recebido de {self.peer_id_remoto}: {msg_pong}")
-        
-    def envia_bye(self, reason: str = "Encerrando sessão"): # Envia mensagem BYE para encerrar a conexão com um peer
-        # Dicionário com a mensagem BYE
-        msg_bye = {
-            "type": "BYE",
-            "msg_id": str(uuid.uuid4()),
-            "src": self.state.get_peer_info(),
-            "dst": self.peer_id_remoto,
-            "reason": reason,
-            "ttl": 1
-        }
-        
-        self._envia_queue.put(msg_bye)
-        logger.debug(f"[PeerConnection] Enviando BYE para {self.peer_id_remoto}")
-        
-    def _envia_bye_ok(self, msg_bye: Dict[str, Any]): # Envia resposta BYE_OK para um BYE recebido
-        logger.info(f"[PeerConnection] BYE recebido de {self.peer_id_remoto}: {msg_bye.get('reason')}")
-        
-        # Dicionário com a mensagem BYE_OK
-        msg_bye_ok = {
-            "type": "BYE_OK",
-            "msg_id": msg_bye.get("msg_id"),
-            "src": self.state.get_peer_info(),
-            "dst": self.peer_id_remoto,
-            "ttl": 1
-        }
-        
-        try:
-            self._envia_direct_msg(msg_bye_ok) # Envia mensagem BYE_OK
-            logger.debug(f"[PeerConnection] Enviando BYE_OK para {self.peer_id_remoto}")
-        except PeerConnectionError as e:
-            logger.error(f"[PeerConnection] Erro ao enviar BYE_OK para {self.peer_id_remoto}: {e}")
-        
-        self.close() # Fecha a conexão após enviar BYE_OK
-        
-    def _processa_bye_ok(self, msg_bye_ok: Dict[str, Any]): # Processa uma mensagem BYE_OK recebida
-        logger.info(f"[PeerConnection] BYE_OK recebido de {self.peer_id_remoto}")
-        self.close() # Fecha a conexão após receber BYE_OK
-        
     def close(self): # Fecha a conexão com o peer
         if not self._rodando.is_set():
             return # Já está fechado
@@ -198,6 +541,7 @@ class PeerConnection:
             self.keep_alive.stop() # Para o keep-alive se estiver ativo
         
         self._rodando.clear() # Marca a conexão como não rodando
+        self._envia_queue.fechar() # Acorda o escritor (e produtores bloqueados) e descarta o que estava na fila
         
         # Fechar o socket
         try:
@@ -224,14 +568,7 @@ class PeerConnection:
     
     def _envia_direct_msg(self, msg: Dict[str, Any]): # Envia uma mensagem diretamente pelo socket sem fila
         try:
-            msg_json = json.dumps(msg, ensure_ascii = False) # Converte o dicionário em JSON
-            msg_bytes = (msg_json + "\n").encode('utf-8') # Adiciona nova linha e converte para bytes
-            
-            logger.debug(f"[PeerConnection] Enviando para {self.peer_id_remoto}: {msg.get('type')}") # Log de debug do envio
-
-            tamanho_maximo = self.state.get_config("network", "max_msg_size") # Obtém o tamanho máximo permitido para mensagens
-            if len(msg_bytes) > tamanho_maximo:
-                raise PeerConnectionError(f"Mensagem excede tamanho máximo de {tamanho_maximo} bytes") # Verifica tamanho da mensagem
+            msg_bytes = self._codifica_msg(msg)
             
             with self._socket_lock: # Garante thread-safety no envio pelo socket
                 self.sock.sendall(msg_bytes) # Envia os bytes pelo socket
@@ -242,22 +579,28 @@ class PeerConnection:
     
     def _recebe_msg(self) -> Optional[Dict[str, Any]]: # Recebe uma mensagem do socket
         try:
-            buffer = b''
-            tamanho_maximo = self.state.get_config("network", "max_msg_size") # Obtém o tamanho máximo permitido para mensagens
-            
-            while b'\n' not in buffer:
-                chunk = self.sock.recv(4096)
-                if not chunk:
-                    raise PeerConnectionError("Conexão fechada pelo peer")
-                buffer += chunk
-
-                if len(buffer) > tamanho_maximo:
-                    raise PeerConnectionError(f"Mensagem recebida excede tamanho máximo de {tamanho_maximo} bytes")
-
-            # Separa a primeira linha (até o \n) do resto do buffer
-            primeira_linha, _, resto = buffer.partition(b'\n')
-            msg_linha = primeira_linha.decode('utf-8').strip()
-            msg = json.loads(msg_linha)
+            if FEATURE_BINARIA in self.features:
+                # Frame binário: decodifica direto da view do buffer de recepção
+                while not self._recebidas:
+                    corpo = self._leitor.proximo_frame()
+                    try:
+                        if self._descompressor and len(corpo) and corpo[0] == TIPO_COMPRIMIDO:
+                            corpos = self._descompressor.descomprime(corpo) # Vários frames (ou só parte de um)
+                        else:
+                            corpos = (corpo,)
+                        for corpo in corpos:
+                            self._recebidas.append(frame_codec.decodifica(corpo, self.peer_id_remoto, self.state.get_peer_info()))
+                    except (ValueError, IndexError, struct.error) as e:
+                        raise PeerConnectionError(f"Frame inválido recebido de {self.peer_id_remoto}: {e}")
+                msg = self._recebidas.popleft()
+                logger.debug(f"[PeerConnection] Mensagem recebida de {self.peer_id_remoto}: {msg.get('type')}")
+                return msg
+
+            # Próxima linha não vazia; mensagens que já estavam no buffer saem sem nenhum recv
+            msg_linha = self._leitor.proxima_linha()
+            while not msg_linha.strip():
+                msg_linha = self._leitor.proxima_linha()
+            msg = frame_codec.de_json(json.loads(msg_linha)) # json.loads aceita bytes UTF-8 direto (sem decode intermediário)
             
             logger.debug(f"[PeerConnection] Mensagem recebida de {self.peer_id_remoto}: {msg.get('type')}")
             
@@ -297,12 +640,33 @@ class PeerConnection:
         
         while self._rodando.is_set():
             try:
-                try:
-                    msg = self._envia_queue.get(timeout=1) # Aguarda mensagem na fila com timeout
-                except queue.Empty:
-                    continue
+                msg = self._envia_queue.get() # Bloqueia até haver mensagem (None = fila fechada pelo close())
+                if msg is None:
+                    break
+                
+                if self._janela_escrita:
+                    time.sleep(self._janela_escrita) # Dá tempo para mais mensagens entrarem no mesmo lote
+                
+                # Esvazia a fila (em ordem de prioridade): tudo que já está enfileirado vai em um único sendall
+                lote = self._novo_lote()
+                lote.adiciona(msg)
+                while lote.mensagens < MAX_LOTE_ESCRITA and lote.tamanho < MAX_BYTES_LOTE:
+                    try:
+                        msg = self._envia_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    lote.adiciona(msg)
                 
-                self._envia_direct_msg(msg) # Envia a mensagem diretamente pelo socket
+                dados = lote.finaliza()
+                if self.compressor:
+                    dados = self.compressor.comprime(dados) # Só se o envio passar do limiar
+                try:
+                    with self._socket_lock: # Garante thread-safety no envio pelo socket
+                        self.sock.sendall(dados)
+                except socket.error as e:
+                    raise PeerConnectionError(f"Erro ao enviar mensagem para {self.peer_id_remoto}: {e}")
+                self.msgs_enviadas += lote.mensagens
+                self.envios += 1
             
             except PeerConnectionError as e:
                 logger.warning(f"[PeerConnection] Erro ao enviar para {self.peer_id_remoto}: {e}")
@@ -314,93 +678,13 @@ class PeerConnection:
                 self.close()
                 break
             
-        logger.debug(f"[PeerConnection] Thread de escrita encerrada para {self.peer_id_remoto}")
+        logger.debug(f"[PeerConnection] Thread de escrita encerrada para {self.peer_id_remoto} "
+                     f"({self.msgs_enviadas} mensagens em {self.envios} envios)")
         
         
-    def _processa_msg_recebida(self, msg: Dict[str, Any]):
-        # Roteia mensagens recebidas para os handlers apropriados baseado no tipo
-        msg_type = msg.get("type")
-
-        try:
-            if msg_type == "PING":
-                self._envia_pong(msg)  # Responde com PONG
-            elif msg_type == "PONG":
-                self._processa_pong(msg)  # Calcula RTT e reseta falhas
-            elif msg_type == "BYE":
-                self._envia_bye_ok(msg)  # Responde BYE_OK e fecha conexão
-            elif msg_type == "BYE_OK":
-                self._processa_bye_ok(msg)  # Fecha conexão
-            elif msg_type == "SEND":
-                self._processa_send(msg)  # Delega para MessageRouter
-            elif msg_type == "ACK":
-                self._processa_ack(msg)  # Delega para MessageRouter
-            elif msg_type == "PUB":
-                self._processa_pub(msg)  # Delega para MessageRouter
-            else:
-                logger.warning(f"[PeerConnection] Mensagem desconhecida recebida de {self.peer_id_remoto}: {msg}")
-
-        except Exception as e:
-            logger.error(f"[PeerConnection] Erro ao processar mensagem de {self.peer_id_remoto}: {e}")
-
-
     # Public API para enfileirar mensagens (usado por MessageRouter)
-    def enqueue_msg(self, msg: Dict[str, Any]):
+    def enqueue_msg(self, msg: Dict[str, Any], bloquear: bool = True) -> bool:
         # Coloca mensagem na fila de envio (thread-safe) - usado por MessageRouter
-        self._envia_queue.put(msg)
-
-    def _processa_send(self, msg: Dict[str, Any]):
-        # Processa mensagem SEND recebida: delega para MessageRouter que enviará ACK se necessário
-        try:
-            router = self.state.get_message_router()
-            if router:
-                router.process_incoming(msg, self)  # MessageRouter cuida de ACK e callbacks
-                return
-
-            # Fallback: entregar localmente e enviar ACK se necessário (caso MessageRouter não exista)
-            src = msg.get("src")
-            payload = msg.get("payload")
-            logger.info(f"[PeerConnection] SEND recebido de {src}: {payload}")
-
-            if msg.get("require_ack"):
-                ack = {
-                    "type": "ACK",
-                    "msg_id": msg.get("msg_id"),
-                    "timestamp": datetime.utcnow().isoformat() + "Z",
-                    "src": self.state.get_peer_info(),
-                    "dst": src,
-                    "ttl": 1,
-                }
-                self.enqueue_msg(ack)
-
-        except Exception:
-            logger.exception("[PeerConnection] Erro ao processar SEND")
-
-    def _processa_ack(self, msg: Dict[str, Any]):
-        # Processa mensagem ACK recebida: delega para MessageRouter desbloquear thread aguardando
-        try:
-            router = self.state.get_message_router()
-            if router:
-                router.process_incoming(msg, self)  # MessageRouter desbloqueará Event.wait() no send()
-            else:
-                logger.info(f"[PeerConnection] ACK recebido: {msg}")
-        except Exception:
-            logger.exception("[PeerConnection] Erro ao processar ACK")
-
-    def _processa_pub(self, msg: Dict[str, Any]):
-        # Processa mensagem PUB recebida: delega para MessageRouter notificar callbacks
-        try:
-            router = self.state.get_message_router()
-            if router:
-                router.process_incoming(msg, self)  # MessageRouter chama callbacks registrados
-                return
-
-            # Fallback: apenas loga (caso MessageRouter não exista)
-            src = msg.get("src")
-            payload = msg.get("payload")
-            logger.info(f"[PeerConnection] PUB recebido de {src}: {payload}")
-        except Exception:
-            logger.exception("[PeerConnection] Erro ao processar PUB")
-        
-        
-        
-        
\ No newline at end of file
+        # Levanta queue.Full se a lane estiver cheia e a política for "block" (após o timeout) ou "fail"
+        # bloquear=False: a política "block" levanta queue.Full na hora (ex: retransmissões pela TimerWheel)
+        return self._envia_queue.put(msg, bloquear=bloquear)
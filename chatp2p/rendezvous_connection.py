@@ -2,6 +2,9 @@ import socket
 import json
 import logging
 import time
+import uuid
+import zlib
+import base64
 from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
@@ -12,9 +15,10 @@ class RendezvousError(Exception):
 
 # Erro retornado pelo servidor (para tratamento específico do tipo de erro)
 class RendezvousServerErro(RendezvousError):
-    def __init__(self, error_type: str, message: str = ""):
+    def __init__(self, error_type: str, message: str = "", retry_after: Optional[float] = None):
         self.error_type = error_type
         self.message = message
+        self.retry_after = retry_after # Segundos até o servidor aceitar de novo (IP bloqueado), se informado
         super().__init__(f"Rendezvous erros: {error_type} - {message}")
         
 # Erro de conexão TCP com o servidor (para permitir retry em erros de rede e não em erros lógicos)
@@ -22,6 +26,33 @@ class RendezvousConnectionError(RendezvousError):
     pass
 
 
+def _verifica_erro_servidor(resposta_json: Dict[str, Any]):
+    if resposta_json.get('status') == 'ERROR': # Se o status da resposta for erro, levanta exceção específica
+        # O servidor costuma retornar o detalhe do erro em 'message' (ex: "bad_namespace").
+        # Alguns clientes/implementações podem usar 'error' — aceite ambos.
+        error_msg = resposta_json.get('message') or resposta_json.get('error') or 'unknown'
+        # Use error_msg como tipo/descrição para facilitar logs/CLI
+        retry_after = resposta_json.get('retry_after')
+        if not isinstance(retry_after, (int, float)) or isinstance(retry_after, bool) or retry_after <= 0:
+            retry_after = None
+        raise RendezvousServerErro(error_msg, resposta_json.get('details', ''), retry_after)
+
+
+LIMITE_DESCOMPRIMIDO = 16 * 1024 * 1024  # Teto para a resposta descomprimida (protege contra "zip bomb")
+
+def _descomprime(resposta_json: Dict[str, Any]) -> Dict[str, Any]:
+    # Respostas pedidas com "compress": "zlib" podem vir embrulhadas em {"compressed": "zlib", "data": base64}
+    if resposta_json.get("compressed") != "zlib":
+        return resposta_json
+    try:
+        descompressor = zlib.decompressobj()
+        dados = descompressor.decompress(base64.b64decode(resposta_json["data"]), LIMITE_DESCOMPRIMIDO)
+        if descompressor.unconsumed_tail:
+            raise RendezvousError("Resposta descomprimida excede o limite")
+        return json.loads(dados.decode("utf-8"))
+    except (KeyError, ValueError, zlib.error) as e:
+        raise RendezvousError(f"Erro ao descomprimir a resposta do servidor: {e}")
+
 def _envia_comando(host: str, port: int, command: Dict[str, Any], timeout: int = 10):
     # Envia comando JSON para servidor Rendezvous via TCP e retorna resposta
     sock = None
@@ -69,17 +100,13 @@ def _envia_comando(host: str, port: int, command: Dict[str, Any], timeout: int =
         try:
             resposta_linha = resposta_servidor.decode("utf-8").strip() # Passa os bytes do buffer recebidos para string e remove espaços em branco
             resposta_json = json.loads(resposta_linha) # Converte a resposta de String pra JSON
+            resposta_json = _descomprime(resposta_json) # Abre a resposta se o servidor a comprimiu
             logger.debug(f"[Rendezvous] Resposta recebida: {resposta_json}") # Registra no log a resposta recebida
             
         except json.JSONDecodeError as e:
             raise RendezvousError(f"Erro ao converter a resposta do servidor: {e}")
         
-        if resposta_json.get('status') == 'ERROR': # Se o status da resposta for erro, levanta exceção específica
-            # O servidor costuma retornar o detalhe do erro em 'message' (ex: "bad_namespace").
-            # Alguns clientes/implementações podem usar 'error' — aceite ambos.
-            error_msg = resposta_json.get('message') or resposta_json.get('error') or 'unknown'
-            # Use error_msg como tipo/descrição para facilitar logs/CLI
-            raise RendezvousServerErro(error_msg, resposta_json.get('details', ''))
+        _verifica_erro_servidor(resposta_json) # Levanta RendezvousServerErro se status == ERROR
         
         #print(resposta_json)  # DEBUG para ver a resposta JSON completa (lembrar de tirar depois)
         return resposta_json  # retorna a resposta JSON do servidor
@@ -93,8 +120,77 @@ def _envia_comando(host: str, port: int, command: Dict[str, Any], timeout: int =
             except Exception:
                 pass
 
-def register(state, retry: bool = True) -> Dict[str, Any]:
+UDP_MAX_DATAGRAM = 1200  # Mesmo limite do servidor: requisição e resposta cabem em um datagrama
+
+def _envia_comando_udp(host: str, port: int, command: Dict[str, Any], timeout: float = 0.5, tentativas: int = 3):
+    # Envia comando em um único datagrama UDP (2 pacotes por comando em vez de ~7 no TCP)
+    # Retransmite com timeout dobrando a cada tentativa; a resposta é casada pelo "rid"
+    rid = uuid.uuid4().hex[:12] # ID da requisição, ecoado pelo servidor na resposta
+    comando_bytes = json.dumps(dict(command, rid=rid), ensure_ascii=False).encode("utf-8")
+
+    if len(comando_bytes) > UDP_MAX_DATAGRAM:
+        raise RendezvousConnectionError(f"Comando não cabe em um datagrama: {len(comando_bytes)} bytes")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Cria socket UDP
+    try:
+        # connect() em UDP fixa o destino: o kernel descarta datagramas de outras origens
+        sock.connect((host, port))
+        espera = timeout
+        for tentativa in range(tentativas):
+            try:
+                sock.send(comando_bytes) # (Re)transmite o comando
+                logger.debug(f"[Rendezvous] UDP {command.get('type')} rid={rid} (tentativa {tentativa + 1}/{tentativas})")
+
+                limite = time.monotonic() + espera
+                while True:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise socket.timeout()
+                    sock.settimeout(restante)
+                    datagrama = sock.recv(UDP_MAX_DATAGRAM + 1)
+                    try:
+                        resposta_json = json.loads(datagrama.decode("utf-8"))
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        continue # Lixo: ignora e continua esperando
+                    if resposta_json.get("rid") == rid: # Descarta respostas atrasadas de outras requisições
+                        break
+
+            except socket.timeout:
+                espera *= 2 # Backoff exponencial entre retransmissões
+                continue
+            except socket.error as e:
+                # ICMP port unreachable (servidor sem UDP) chega como ConnectionRefusedError
+                raise RendezvousConnectionError(f"Erro UDP com o servidor: {e}")
+
+            resposta_json.pop("rid", None)
+            resposta_json = _descomprime(resposta_json)
+            logger.debug(f"[Rendezvous] Resposta UDP recebida: {resposta_json}")
+            if resposta_json.get("status") == "ERROR" and resposta_json.get("message") == "use_tcp":
+                raise RendezvousConnectionError("Servidor pediu TCP para este comando")
+            _verifica_erro_servidor(resposta_json)
+            return resposta_json
+
+        raise RendezvousConnectionError(f"Sem resposta UDP após {tentativas} tentativas")
+
+    finally:
+        sock.close()
+
+def _envia_comando_rapido(state, host: str, port: int, command: Dict[str, Any], timeout: int = 10):
+    # Usa o caminho rápido UDP se habilitado no config.json; cai para TCP em qualquer falha de transporte
+    # O servidor só responde datagramas com o lease recebido no REGISTER TCP (prova do IP de origem):
+    # sem lease vai direto por TCP
+    if state.get_config("rendezvous", "udp_enabled") and state.lease:
+        try:
+            return _envia_comando_udp(host, port, dict(command, lease=state.lease),
+                                      timeout=state.get_config("rendezvous", "udp_timeout") or 0.5,
+                                      tentativas=state.get_config("rendezvous", "udp_retries") or 3)
+        except RendezvousConnectionError as e:
+            logger.debug(f"[Rendezvous] Caminho UDP falhou ({e}); usando TCP")
+    return _envia_comando(host, port, command, timeout)
+
+def register(state, retry: bool = True, descobrir: bool = False) -> Dict[str, Any]:
     # Registra peer no servidor Rendezvous com retry e backoff exponencial
+    # descobrir=True pede a lista de peers do namespace na mesma resposta (REGISTER + DISCOVER em uma ida)
     # Obtém as configurações no state
     host = state.get_config("rendezvous", "host")
     porta = state.get_config("rendezvous", "port")
@@ -113,8 +209,20 @@ def register(state, retry: bool = True) -> Dict[str, Any]:
         "name": state.name,
         "namespace": state.namespace,
         "port": state.port,
-        "ttl": ttl
+        "ttl": ttl,
+        "pacing": True # Pede ao servidor a sugestão de quando renovar (refresh_after)
     }
+    if descobrir:
+        comando["discover"] = "*" # Todos os namespaces, como o DISCOVER do loop automático
+        comando["compress"] = "zlib" # Listas grandes de peers vêm comprimidas
+        limite = state.get_config("rendezvous", "discover_limit")
+        amostra = state.get_config("rendezvous", "discover_sample")
+        if limite:
+            # Resposta limitada: o name do próprio REGISTER identifica o registro a excluir
+            comando["limit"] = limite
+            comando["exclude_self"] = True
+        if amostra:
+            comando["sample"] = amostra
     
     # Obtém as configurações de retry
     max_tentativas = state.get_config("rendezvous", "register_retry_attempts") # Número máximo de tentativas
@@ -125,12 +233,21 @@ def register(state, retry: bool = True) -> Dict[str, Any]:
     for tentativas in range(max_tentativas): # Loop de tentativas
         try:
             logger.debug(f"[Rendezvous] Tentando REGISTER (tentativa {tentativas + 1}/{max_tentativas})") # Log de debug
-            resposta = _envia_comando(host, porta, comando, timeout) # Envia o comando REGISTER e espera a resposta
+            if state.timestamp_registro is not None:
+                # Re-registro: o servidor aceita a renovação via UDP (o primeiro REGISTER é sempre TCP)
+                resposta = _envia_comando_rapido(state, host, porta, comando, timeout)
+            else:
+                resposta = _envia_comando(host, porta, comando, timeout) # Envia o comando REGISTER e espera a resposta
 
             # Se chegou aqui, o REGISTER foi bem sucedido
             # Atualiza o state com o TTL e timestamp confirmados pelo servidor
             state.ttl_recebido = resposta.get('ttl')
             state.timestamp_registro = time.time()
+            state.lease = resposta.get('lease') # Servidores antigos não devolvem lease (None = sempre REGISTER)
+            state.refresh_sugerido = resposta.get('refresh_after')
+            if descobrir:
+                state.peers_registro = resposta.get('peers') # None se o servidor não suporta discover no REGISTER
+                state.discover_sugerido = resposta.get('next_discover_after', state.discover_sugerido)
 
             logger.info(f"[Rendezvous] REGISTER bem sucedido {state.peer_id}")
             logger.info(f"[Rendezvous] Peer registrado em {resposta.get('ip')}:{resposta.get('port')} com TTL {resposta.get('ttl')} segundos")
@@ -158,8 +275,49 @@ def register(state, retry: bool = True) -> Dict[str, Any]:
     else:
         raise RendezvousError("REGISTER falhou: nenhuma tentativa foi executada")
 
-def discover(state, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+def heartbeat(state) -> Dict[str, Any]:
+    # Renova o TTL do registro apenas com o token de lease (sem REGISTER completo)
+    host = state.get_config("rendezvous", "host")
+    porta = state.get_config("rendezvous", "port")
+    timeout = state.get_config("network", "connection_timeout")
+
+    if not state.lease:
+        raise RendezvousError("HEARTBEAT sem lease: é necessário um REGISTER antes")
+
+    # dicionário com o comando HEARTBEAT
+    comando = {
+        "type": "HEARTBEAT",
+        "lease": state.lease,
+        "pacing": True
+    }
+
+    try:
+        logger.debug(f"[Rendezvous] Executando HEARTBEAT") # Log de debug
+        resposta = _envia_comando_rapido(state, host, porta, comando, timeout) # Envia o comando HEARTBEAT e espera a resposta
+
+        # Atualiza o state com o TTL renovado pelo servidor
+        state.ttl_recebido = resposta.get('ttl')
+        state.timestamp_registro = time.time()
+        state.refresh_sugerido = resposta.get('refresh_after')
+
+        logger.info(f"[Rendezvous] HEARTBEAT bem sucedido {state.peer_id} (TTL {resposta.get('ttl')}s)")
+        return resposta
+
+    except RendezvousServerErro as e:
+        # unknown_lease: registro expirou ou servidor reiniciou sem ele, descarta o lease
+        if e.error_type == "unknown_lease":
+            state.lease = None
+        logger.warning(f"[Rendezvous] HEARTBEAT recusado pelo servidor: {e}")
+        raise
+
+    except RendezvousError as e: # Erro
+        logger.error(f"[Rendezvous] HEARTBEAT falhou: {e}")
+        raise
+
+def discover(state, namespace: Optional[str] = None, limit: Optional[int] = None,
+             sample: Optional[str] = None) -> List[Dict[str, Any]]:
     # Descobre peers registrados no servidor Rendezvous (todos ou filtrado por namespace)
+    # limit/sample pedem uma resposta limitada ("random", "newest" ou "nearest" = mesma rede primeiro)
     # Obtém as configurações no state
     host = state.get_config("rendezvous", "host")
     porta = state.get_config("rendezvous", "port")
@@ -167,16 +325,26 @@ def discover(state, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
     
     # dicionário com o comando DISCOVER
     comando = {
-        "type": "DISCOVER"
+        "type": "DISCOVER",
+        "pacing": True, # Pede ao servidor a sugestão de quando repetir o DISCOVER
+        "compress": "zlib" # Aceita a resposta comprimida (o servidor só comprime respostas grandes)
     } 
     if namespace:
         comando["namespace"] = namespace # Adiciona o namespace ao comando se fornecido
+    if limit:
+        # Resposta limitada: não desperdiça vagas com o próprio registro
+        comando["limit"] = limit
+        comando["exclude_self"] = True
+        comando["name"] = state.name
+    if sample:
+        comando["sample"] = sample
         
     try:
         logger.debug(f"[Rendezvous] Executand DISCOVER (namespace = {namespace or '*'})") # Log de debug
-        resposta = _envia_comando(host, porta, comando, timeout) # Envia o comando DISCOVER e espera a resposta
+        resposta = _envia_comando_rapido(state, host, porta, comando, timeout) # Envia o comando DISCOVER e espera a resposta
         
         peers = resposta.get("peers", []) # Obtém a lista de peers da resposta
+        state.discover_sugerido = resposta.get("next_discover_after")
         logger.info(f"[Rendezvous] DISCOVER retornou {len(peers)} peers")
         
         return peers # Retorna a lista de peers encontrados
@@ -185,6 +353,41 @@ def discover(state, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
         logger.error(f"[Rendezvous] DISCOVER falhou: {e}")
         raise
 
+def discover_varios(state, namespaces: List[str], limit: Optional[int] = None,
+                    sample: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    # Descobre peers de vários namespaces em uma única requisição (resposta agrupada por namespace)
+    host = state.get_config("rendezvous", "host")
+    porta = state.get_config("rendezvous", "port")
+    timeout = state.get_config("network", "connection_timeout")
+
+    # dicionário com o comando DISCOVER agrupado
+    comando = {
+        "type": "DISCOVER",
+        "namespaces": list(namespaces),
+        "pacing": True,
+        "compress": "zlib"
+    }
+    if limit:
+        comando["limit"] = limit
+        comando["exclude_self"] = True
+        comando["name"] = state.name
+    if sample:
+        comando["sample"] = sample
+
+    try:
+        logger.debug(f"[Rendezvous] Executando DISCOVER agrupado (namespaces = {', '.join(namespaces)})") # Log de debug
+        resposta = _envia_comando_rapido(state, host, porta, comando, timeout) # Envia o comando DISCOVER e espera a resposta
+
+        grupos = {ns: grupo.get("peers", []) for ns, grupo in resposta.get("namespaces", {}).items()}
+        state.discover_sugerido = resposta.get("next_discover_after")
+        logger.info(f"[Rendezvous] DISCOVER agrupado retornou {sum(len(p) for p in grupos.values())} peers em {len(grupos)} namespaces")
+
+        return grupos # Retorna {namespace: [peers]}
+
+    except RendezvousError as e: # Erro
+        logger.error(f"[Rendezvous] DISCOVER agrupado falhou: {e}")
+        raise
+
 def unregister(state) -> Dict[str, Any]:
     # Remove registro do peer do servidor Rendezvous (chamado ao sair do programa)
     # Obtém as configurações no state
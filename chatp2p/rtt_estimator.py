@@ -0,0 +1,43 @@
+import threading
+from typing import Optional
+
+# Estimador de RTT no estilo Jacobson/Karels (RFC 6298): SRTT e RTTVAR por média móvel exponencial,
+# RTO = SRTT + max(G, K * RTTVAR), limitado a [rto_minimo, rto_maximo]. Tempos em segundos.
+ALFA = 1 / 8
+BETA = 1 / 4
+K = 4
+GRANULARIDADE = 0.01 # Resolução da TimerWheel: prazos menores não fazem diferença
+
+
+class RttEstimator:
+    def __init__(self, rto_inicial: float = 1.0, rto_minimo: float = 0.2, rto_maximo: float = 60.0):
+        self._lock = threading.Lock() # Amostras chegam da thread de leitura (ACK) e do KeepAlive (PONG)
+        self.rto_inicial = rto_inicial
+        self.rto_minimo = rto_minimo
+        self.rto_maximo = rto_maximo
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.amostras = 0
+
+    def amostra(self, rtt: float):
+        # Registra uma medição de RTT (segundos); só use amostras de mensagens não retransmitidas (Karn)
+        if rtt < 0:
+            return
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - ALFA) * self.srtt + ALFA * rtt
+            self.amostras += 1
+
+    def rto(self, tentativa: int = 0) -> float:
+        # Timeout de retransmissão; cada tentativa anterior sem ACK dobra o valor (backoff limitado)
+        with self._lock:
+            if self.srtt is None:
+                base = self.rto_inicial
+            else:
+                base = self.srtt + max(GRANULARIDADE, K * self.rttvar)
+        base = min(self.rto_maximo, max(self.rto_minimo, base))
+        return min(self.rto_maximo, base * (2 ** tentativa))
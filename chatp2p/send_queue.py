@@ -0,0 +1,116 @@
+import threading
+import queue
+import logging
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lanes em ordem de prioridade: o escritor sempre esvazia "controle" antes de "send" e "send" antes de "pub"
+LANES = ("controle", "send", "pub")
+POLITICAS = ("block", "drop_oldest", "fail")
+
+# Limites padrão (mensagens por lane) se o config.json não tiver a seção "send_queue"
+LIMITES_PADRAO = {
+    "controle": {"max": 1024, "policy": "fail"},     # Cheia só se o peer parou de ler de vez (o keep-alive derruba)
+    "send": {"max": 1024, "policy": "block"},        # Backpressure para quem chama MessageRouter.send
+    "pub": {"max": 4096, "policy": "drop_oldest"},   # Flood de PUB descarta as mais antigas
+}
+
+
+def lane_da_msg(msg: Dict[str, Any]) -> str:
+    # PING/PONG/ACK/BYE/BYE_OK e qualquer outro tipo vão na lane de controle
+    tipo = msg.get("type")
+    if tipo == "SEND":
+        return "send"
+    if tipo == "PUB":
+        return "pub"
+    return "controle"
+
+
+class SendQueue:
+    # Fila de envio de uma PeerConnection: uma deque limitada por lane, com prioridade estrita entre lanes.
+    # put() segue a política da lane quando ela está cheia:
+    #   "block": espera espaço até timeout_bloqueio e então levanta queue.Full
+    #   "drop_oldest": descarta a mensagem mais antiga da lane
+    #   "fail": levanta queue.Full na hora
+    def __init__(self, limites: Optional[Dict[str, Dict[str, Any]]] = None, timeout_bloqueio: float = 5.0):
+        self._lock = threading.Lock()
+        self._nao_vazia = threading.Condition(self._lock) # Escritor esperando mensagem
+        self._com_espaco = threading.Condition(self._lock) # Produtores esperando espaço (política "block")
+        self._lanes = {lane: deque() for lane in LANES}
+        self._limites = {}
+        for lane in LANES:
+            cfg = dict(LIMITES_PADRAO[lane], **((limites or {}).get(lane) or {}))
+            if cfg["policy"] not in POLITICAS or int(cfg["max"]) < 1:
+                raise ValueError(f"Configuração inválida para a lane {lane}: {cfg}")
+            self._limites[lane] = (int(cfg["max"]), cfg["policy"])
+        self.timeout_bloqueio = timeout_bloqueio
+        self._fechada = False
+        self.descartadas = {lane: 0 for lane in LANES} # Mensagens descartadas por drop_oldest (estatística)
+
+    def put(self, msg: Dict[str, Any], bloquear: bool = True) -> bool:
+        # Enfileira na lane do tipo da mensagem; False se a fila já foi fechada
+        # bloquear=False trata a política "block" como "fail" (para quem não pode esperar, ex: event loop)
+        lane = lane_da_msg(msg)
+        fila = self._lanes[lane]
+        maximo, politica = self._limites[lane]
+
+        with self._lock:
+            if self._fechada:
+                return False
+            if len(fila) >= maximo:
+                if politica == "drop_oldest":
+                    fila.popleft()
+                    self.descartadas[lane] += 1
+                elif politica == "block" and bloquear:
+                    if not self._com_espaco.wait_for(lambda: len(fila) < maximo or self._fechada,
+                                                     self.timeout_bloqueio):
+                        raise queue.Full(f"Lane {lane} cheia ({maximo} mensagens)")
+                    if self._fechada:
+                        return False
+                else:
+                    raise queue.Full(f"Lane {lane} cheia ({maximo} mensagens)")
+            fila.append(msg)
+            self._nao_vazia.notify()
+        return True
+
+    def _retira_locked(self):
+        # Deve ser chamado com self._lock: próxima mensagem da lane de maior prioridade
+        for lane in LANES:
+            fila = self._lanes[lane]
+            if fila:
+                msg = fila.popleft()
+                self._com_espaco.notify_all() # Produtores de várias lanes podem estar esperando
+                return msg
+        return None
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        # Bloqueia até haver mensagem; retorna None quando a fila é fechada
+        with self._lock:
+            while not self._fechada:
+                msg = self._retira_locked()
+                if msg is not None:
+                    return msg
+                self._nao_vazia.wait()
+            return None
+
+    def get_nowait(self) -> Dict[str, Any]:
+        with self._lock:
+            msg = None if self._fechada else self._retira_locked()
+        if msg is None:
+            raise queue.Empty
+        return msg
+
+    def fechar(self):
+        # Acorda o escritor e qualquer produtor bloqueado; mensagens ainda na fila são descartadas
+        with self._lock:
+            self._fechada = True
+            for fila in self._lanes.values():
+                fila.clear()
+            self._nao_vazia.notify_all()
+            self._com_espaco.notify_all()
+
+    def tamanhos(self) -> Dict[str, int]:
+        with self._lock:
+            return {lane: len(fila) for lane, fila in self._lanes.items()}
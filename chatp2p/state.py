@@ -2,11 +2,21 @@ import threading
 import json
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Mapping
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+_VAZIO: Mapping[str, Any] = MappingProxyType({})
+
+
+def namespace_do_peer(peer_id: str) -> Optional[str]:
+    # "alice@CIC" -> "CIC"; peer_ids fora do formato nome@namespace não entram em nenhum namespace
+    partes = peer_id.split("@")
+    return partes[1] if len(partes) == 2 else None
+
+
 class State:
     def __init__(self, config_path: str = "config.json"):
         self._lock = threading.RLock() # Lock principal para proteger o estado compartilhado
@@ -24,10 +34,22 @@ class State:
         # Controle de re-registro automático (valores confirmados pelo servidor)
         self.ttl_recebido: Optional[int] = None  # TTL confirmado pelo servidor na resposta do REGISTER
         self.timestamp_registro: Optional[float] = None  # Timestamp Unix do último REGISTER bem-sucedido
+        self.lease: Optional[str] = None  # Token de lease devolvido pelo REGISTER (usado pelo HEARTBEAT)
+
+        # Sugestões de ritmo enviadas pelo servidor (None = servidor antigo, usa os valores do config)
+        self.refresh_sugerido: Optional[int] = None  # Segundos após o registro para renovar (refresh_after)
+        self.discover_sugerido: Optional[int] = None  # Segundos até o próximo DISCOVER (next_discover_after)
+        self.peers_registro: Optional[list] = None  # Peers devolvidos junto com o REGISTER (consumidos pelo primeiro discover)
         
         self._conexoes: Dict[str, Any] = {} # Dicionário de conexões ativas {peer_id: PeerConnection}
+        self._por_namespace: Dict[str, Dict[str, Any]] = {} # Índice {namespace: {peer_id: PeerConnection}}
+        # Snapshots imutáveis refeitos a cada adiciona/remove (copy-on-write): quem só lê (PUB, CLI) pega a
+        # referência atual sem lock e sem copiar, e nunca vê o dicionário mudando durante a iteração
+        self._snapshot_conexoes: Mapping[str, Any] = _VAZIO
+        self._snapshot_namespaces: Mapping[str, Mapping[str, Any]] = _VAZIO
         
         self._message_router: Optional[Any] = None # Roteador de mensagens
+        self._timer_wheel: Optional[Any] = None # Temporizador compartilhado (PING/PONG, discover, re-registro)
         
         self._flag_encerrado = threading.Event() # Flag para indicar se o programa está sendo encerrado
         
@@ -68,9 +90,13 @@ class State:
             return max(0, int(tempo_restante))
     
     def adiciona_conexao(self, peer_id: str, conexao):
-        # Adiciona uma conexão ativa ao dicionário de conexões (thread-safe)
+        # Adiciona uma conexão ativa ao dicionário de conexões e ao índice de namespaces (thread-safe)
         with self._lock:
             self._conexoes[peer_id] = conexao
+            namespace = namespace_do_peer(peer_id)
+            if namespace is not None:
+                self._por_namespace.setdefault(namespace, {})[peer_id] = conexao
+            self._publica_snapshots_locked(namespace)
             logger.info(f"[State] Conexão adicionada: {peer_id}")
     
     # Função para remover uma conexão do dicionário de conexões ativas
@@ -78,22 +104,48 @@ class State:
         with self._lock:
             if peer_id in self._conexoes:
                 del self._conexoes[peer_id]
+                namespace = namespace_do_peer(peer_id)
+                membros = self._por_namespace.get(namespace)
+                if membros is not None:
+                    membros.pop(peer_id, None)
+                    if not membros:
+                        del self._por_namespace[namespace]
+                self._publica_snapshots_locked(namespace)
                 logger.info(f"[State] Conexão removida: {peer_id}")
+
+    def _publica_snapshots_locked(self, namespace: Optional[str]):
+        # Refaz o snapshot geral e o do namespace alterado (os dos outros namespaces são reaproveitados)
+        self._snapshot_conexoes = MappingProxyType(dict(self._conexoes))
+        if namespace is None:
+            return
+        namespaces = dict(self._snapshot_namespaces)
+        membros = self._por_namespace.get(namespace)
+        if membros:
+            namespaces[namespace] = MappingProxyType(dict(membros))
+        else:
+            namespaces.pop(namespace, None)
+        self._snapshot_namespaces = MappingProxyType(namespaces)
     
     # Função get para obter conexão com um peer específico 
     def get_conexao(self, peer_id: str):
         with self._lock:
             return self._conexoes.get(peer_id)
     
-    # Função get para obter todas as conexões ativas
-    def get_todas_conexoes(self) -> Dict[str, Any]:
-        with self._lock:
-            return self._conexoes.copy()
+    # Função get para obter todas as conexões ativas (snapshot imutável, não copia)
+    def get_todas_conexoes(self) -> Mapping[str, Any]:
+        return self._snapshot_conexoes
+
+    # Função get para as conexões de um namespace (snapshot imutável; custo independe do total de peers)
+    def get_conexoes_namespace(self, namespace: str) -> Mapping[str, Any]:
+        return self._snapshot_namespaces.get(namespace, _VAZIO)
+
+    # Função get para todos os namespaces com conexões ativas {namespace: {peer_id: conexão}}
+    def get_namespaces(self) -> Mapping[str, Mapping[str, Any]]:
+        return self._snapshot_namespaces
         
     # Função get para peer_ids com conexões ativas
     def get_peer_ids_conectados(self) -> list:
-        with self._lock:
-            return list(self._conexoes.keys())
+        return list(self._snapshot_conexoes.keys())
     
     # Função para verificar se existe conexão ativa com um peer específico
     def verifica_conexao(self, peer_id: str) -> bool:
@@ -127,3 +179,13 @@ class State:
         # Retorna instância do MessageRouter ou None se não configurado (thread-safe)
         with self._lock:
             return getattr(self, "_message_router", None)
+
+    def set_timer_wheel(self, timer_wheel):
+        # Armazena a TimerWheel compartilhada no state (thread-safe)
+        with self._lock:
+            self._timer_wheel = timer_wheel
+
+    def get_timer_wheel(self):
+        # Retorna a TimerWheel ou None se não configurada (thread-safe)
+        with self._lock:
+            return self._timer_wheel
@@ -0,0 +1,149 @@
+import threading
+import time
+import logging
+from typing import Callable, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Resolução e tamanho padrão da roda: 10 ms por slot (ACK atrasado e RTO em LAN), 1024 slots (uma volta ~10 s).
+# Prazos maiores que uma volta ficam no slot com um contador de voltas restantes.
+RESOLUCAO_PADRAO = 0.01
+SLOTS_PADRAO = 1024
+
+
+class Temporizador:
+    # Handle de um prazo agendado na TimerWheel (mesma ideia do asyncio.TimerHandle)
+    __slots__ = ("prazo", "fn", "args", "voltas", "slot", "cancelado")
+
+    def __init__(self, prazo: float, fn: Callable[..., Any], args: tuple):
+        self.prazo = prazo
+        self.fn = fn
+        self.args = args
+        self.voltas = 0
+        self.slot = None
+        self.cancelado = False
+
+    def cancel(self):
+        # Idempotente; a roda descarta o temporizador quando passar pelo slot dele
+        self.cancelado = True
+
+
+class TimerWheel:
+    # Roda de temporização (hashed timing wheel) com uma única thread para todos os prazos do cliente:
+    # PING/PONG de cada conexão, discover, re-registro. Agendar e cancelar são O(1); a thread dorme até
+    # o próximo slot ocupado (ou indefinidamente se não houver prazos), sem acordar em intervalos fixos.
+    # Os callbacks rodam na thread da roda e devem ser rápidos (trabalho bloqueante vai para outra thread).
+    def __init__(self, resolucao: float = RESOLUCAO_PADRAO, slots: int = SLOTS_PADRAO):
+        self.resolucao = resolucao
+        self._slots = [[] for _ in range(slots)]
+        self._lock = threading.Lock()
+        self._acorda = threading.Condition(self._lock)
+        self._origem = time.monotonic()
+        self._tick_atual = 0 # Próximo tick a processar
+        self._pendentes = 0 # Temporizadores na roda (inclui cancelados ainda não descartados)
+        self._rodando = False
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._rodando:
+                return
+            self._rodando = True
+            self._origem = time.monotonic()
+            self._tick_atual = 0
+        self._thread = threading.Thread(target=self._loop, name="TimerWheel", daemon=True)
+        self._thread.start()
+        logger.debug("[TimerWheel] TimerWheel iniciada")
+
+    def stop(self):
+        with self._lock:
+            if not self._rodando:
+                return
+            self._rodando = False
+            for slot in self._slots:
+                slot.clear()
+            self._pendentes = 0
+            self._acorda.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        logger.debug("[TimerWheel] TimerWheel encerrada")
+
+    def call_later(self, atraso: float, fn: Callable[..., Any], *args) -> Temporizador:
+        # Agenda fn(*args) para daqui a `atraso` segundos (mesma assinatura de loop.call_later)
+        prazo = time.monotonic() + max(0.0, atraso)
+        temporizador = Temporizador(prazo, fn, args)
+        with self._lock:
+            if not self._pendentes:
+                # Roda vazia: a thread ficou parada, então alinha o tick atual com o relógio
+                self._tick_atual = max(self._tick_atual, self._tick_do(time.monotonic()) - 1)
+            tick = max(self._tick_do(prazo), self._tick_atual)
+            temporizador.voltas = (tick - self._tick_atual) // len(self._slots)
+            temporizador.slot = tick % len(self._slots)
+            self._slots[temporizador.slot].append(temporizador)
+            self._pendentes += 1
+            self._acorda.notify() # O novo prazo pode ser anterior ao que a thread está esperando
+        return temporizador
+
+    def pendentes(self) -> int:
+        with self._lock:
+            return self._pendentes
+
+    # --- Thread da roda
+
+    def _tick_do(self, instante: float) -> int:
+        # Arredonda para cima: o callback nunca roda antes do prazo
+        return int(-(-(instante - self._origem) // self.resolucao))
+
+    def _proximo_tick_ocupado_locked(self) -> Optional[int]:
+        # Próximo tick com algum temporizador no slot (pode ser de uma volta futura; então só decrementa)
+        if not self._pendentes:
+            return None
+        total = len(self._slots)
+        for i in range(total):
+            if self._slots[(self._tick_atual + i) % total]:
+                return self._tick_atual + i
+        return None
+
+    def _loop(self):
+        while True:
+            vencidos = []
+            with self._lock:
+                while self._rodando:
+                    proximo = self._proximo_tick_ocupado_locked()
+                    if proximo is None:
+                        self._acorda.wait() # Nada agendado: dorme até um call_later
+                        continue
+                    espera = self._origem + proximo * self.resolucao - time.monotonic()
+                    if espera > 0:
+                        self._acorda.wait(espera)
+                        continue
+                    break
+                if not self._rodando:
+                    return
+
+                # Processa todos os ticks já vencidos até agora
+                agora = self._tick_do(time.monotonic())
+                total = len(self._slots)
+                while self._tick_atual <= agora and self._pendentes:
+                    slot = self._slots[self._tick_atual % total]
+                    if slot:
+                        restantes = []
+                        for temporizador in slot:
+                            if temporizador.cancelado:
+                                self._pendentes -= 1
+                            elif temporizador.voltas > 0:
+                                temporizador.voltas -= 1
+                                restantes.append(temporizador)
+                            else:
+                                self._pendentes -= 1
+                                vencidos.append(temporizador)
+                        slot[:] = restantes
+                    self._tick_atual += 1
+
+            for temporizador in vencidos: # Fora do lock: callbacks podem agendar/cancelar
+                if temporizador.cancelado:
+                    continue
+                try:
+                    temporizador.fn(*temporizador.args)
+                except Exception as e:
+                    logger.error(f"[TimerWheel] Erro no callback {getattr(temporizador.fn, '__name__', temporizador.fn)}: {e}")
@@ -0,0 +1,29 @@
+import base64
+import zlib
+
+# Opt-in response compression: a request carrying "compress": "zlib" may get its
+# response wrapped as
+#   {"status": ..., "compressed": "zlib", "size": <raw bytes>, "data": <base64>}
+# Base64 keeps the reply a single JSON line (TCP) or datagram (UDP); key-heavy
+# DISCOVER bodies still shrink several times after the 4/3 expansion.
+
+CODECS = ("zlib",)
+LEVEL = 6
+
+
+def requested(args) -> bool:
+    return args.get("compress") in CODECS
+
+
+def compress_response(body: str, status, threshold: int):
+    """
+    Envelope (a dict) for the JSON text `body`, or None when it is below
+    `threshold` bytes or would not get smaller.
+    """
+    raw = body.encode("utf-8")
+    if len(raw) < threshold:
+        return None
+    packed = base64.b64encode(zlib.compress(raw, LEVEL)).decode("ascii")
+    if len(packed) >= len(raw):
+        return None
+    return {"status": status, "compressed": "zlib", "size": len(raw), "data": packed}
@@ -1,8 +1,10 @@
 
 
 from rendezvous import RendezvousServer
+from server_config import ServerLimits, load_limits
 import logging
 import argparse
+import os
 from pathlib import Path
 
 
@@ -70,9 +72,31 @@ if __name__ == "__main__":
         help="Port for the rendezvous server (default: 8080).",
     )
     
+    parser.add_argument(
+        "--udp",
+        action="store_true",
+        help="Also accept single-datagram REGISTER refresh/HEARTBEAT/DISCOVER over UDP on the same port.",
+    )
+    
+    parser.add_argument(
+        "--config",
+        default="server_config.json",
+        help="JSON file with server limits/tunables, re-read on SIGHUP or RELOAD (default: server_config.json).",
+    )
+    
     args = parser.parse_args()
 
     setup_logging(args.log_mode, args.log_file)
     
-    server = RendezvousServer(args.host, args.port)
-    server.start()
+    limits = ServerLimits()
+    if os.path.exists(args.config):
+        try:
+            limits = load_limits(args.config)
+        except (OSError, ValueError) as e:
+            logging.getLogger("config").error("Invalid config %s: %s", args.config, e)
+            raise SystemExit(1)
+    else:
+        logging.getLogger("config").info("Config file %s not found; using defaults", args.config)
+    
+    server = RendezvousServer(args.host, args.port, limits=limits, config_path=args.config)
+    server.start(udp=args.udp)
@@ -10,6 +10,7 @@ class PeerRecord:
     namespace: str
     ttl: int
     timestamp: datetime
+    lease: Optional[str] = None  # token accepted by HEARTBEAT to refresh this record
 
     
     
@@ -0,0 +1,43 @@
+import random
+
+# Advisory timing returned to clients that ask for it ("pacing": true).
+# Values are hints: a client may poll less often, never needs to poll more often.
+
+DISCOVER_BASE = 60   # seconds, interval for a namespace with ~1 membership change/min
+DISCOVER_MIN = 10
+DISCOVER_MAX = 600
+JITTER = 0.1         # +/-10% so that clients told the same thing do not synchronize
+
+
+def _overload_stretch(load: float) -> float:
+    # 1.0 while at most half of the workers are busy, then grows linearly
+    return 1.0 + max(0.0, load - 0.5) * 4.0
+
+
+def _jitter(value: float) -> float:
+    return value * random.uniform(1.0 - JITTER, 1.0 + JITTER)
+
+
+def next_discover_after(load: float, churn_per_min: float) -> int:
+    """
+    Seconds until the next DISCOVER is worth sending.
+
+    Stable namespaces can be polled rarely (2x DISCOVER_BASE when nothing changes),
+    busy ones more often; everything is stretched when the server is overloaded.
+    """
+    interval = 2 * DISCOVER_BASE / (1.0 + churn_per_min)
+    interval *= _overload_stretch(load)
+    return int(min(DISCOVER_MAX, max(DISCOVER_MIN, _jitter(interval))))
+
+
+def refresh_after(ttl: int, load: float) -> int:
+    """
+    Seconds after a successful REGISTER/HEARTBEAT at which to refresh again.
+
+    Normally 80% of the TTL; under load the refresh moves closer to expiry (up to
+    90%) to shed requests, always leaving at least 10% of the TTL as margin.
+    """
+    fraction = 0.8 + min(0.1, max(0.0, load - 0.5) * 0.2)
+    # Jitter only downwards: refreshing late risks expiry, refreshing early is harmless
+    fraction *= random.uniform(1.0 - JITTER / 2, 1.0)
+    return max(1, int(ttl * fraction))
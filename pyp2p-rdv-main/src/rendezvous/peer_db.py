@@ -1,17 +1,302 @@
+import heapq
+import ipaddress
+import itertools
 import json
+import math
 import os
+import random
+import secrets
+from itertools import islice
 from models import PeerRecord
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import threading
+import time
 import logging
 
 log = logging.getLogger("peer_db")
 
+CHURN_TAU = 300.0  # seconds, time constant of the per-namespace churn average
+
+
+def peer_key(peer: PeerRecord):
+    """Identity of a registration: the upsert key used by add_peer."""
+    return (peer.ip, peer.namespace, peer.name)
+
+
+class _RadixNode:
+    """Node of a path-compressed binary trie: `length` leading bits of `prefix` are fixed."""
+    __slots__ = ("prefix", "length", "children", "keys")
+
+    def __init__(self, prefix, length):
+        self.prefix = prefix
+        self.length = length
+        self.children = [None, None]  # next bit 0 / 1 (internal nodes have both)
+        self.keys = {}  # peer_key -> None (ordered set); only full-width leaves hold keys
+
+
+class _PrefixIndex:
+    """
+    Radix (PATRICIA) trie per IP family answering "closest by longest common prefix".
+
+    Chains of single-child nodes are compressed, so the trie has at most 2n nodes
+    and add/discard walk at most one node per address bit (O(32) or O(128),
+    independent of the number of peers). The subtree below a node is exactly
+    one CIDR block; the peers sharing k leading bits with an address are the
+    subtrees hanging off its path below depth k.
+    """
+    __slots__ = ("_roots", "_unparsable")
+
+    _WIDTH = {4: 32, 6: 128}
+
+    def __init__(self):
+        self._roots = {4: _RadixNode(0, 0), 6: _RadixNode(0, 0)}
+        self._unparsable = {}  # peer_key -> None, for addresses that do not parse
+
+    @staticmethod
+    def _parse(ip):
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return 0, 0
+        return addr.version, int(addr)
+
+    def add(self, ip, key):
+        family, x = self._parse(ip)
+        width = self._WIDTH.get(family)
+        if width is None:
+            self._unparsable[key] = None
+            return
+        node = self._roots[family]
+        while node.length < width:
+            bit = (x >> (width - node.length - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = _RadixNode(x, width)
+            else:
+                # Leading bits shared with the child's prefix (capped at what it fixes)
+                common = min(child.length, width - (x ^ child.prefix).bit_length())
+                if common < child.length:
+                    # Diverges inside the compressed edge: split it at `common`
+                    mid = _RadixNode(x >> (width - common) << (width - common), common)
+                    mid.children[(child.prefix >> (width - common - 1)) & 1] = child
+                    leaf = mid.children[(x >> (width - common - 1)) & 1] = _RadixNode(x, width)
+                    node.children[bit] = mid
+                    child = leaf
+            node = child
+        node.keys[key] = None
+
+    def discard(self, ip, key):
+        family, x = self._parse(ip)
+        width = self._WIDTH.get(family)
+        if width is None:
+            self._unparsable.pop(key, None)
+            return
+        grandparent = parent = None
+        node = self._roots[family]
+        while node is not None and node.length < width:
+            grandparent, parent = parent, node
+            node = node.children[(x >> (width - node.length - 1)) & 1]
+        if node is None or node.prefix != x:
+            return
+        node.keys.pop(key, None)
+        if node.keys or parent is None:
+            return
+        # Drop the empty leaf; an internal parent left with one child is merged away
+        parent.children[parent.children[1] is node] = None
+        if grandparent is not None:
+            survivor = parent.children[0] or parent.children[1]
+            grandparent.children[grandparent.children[1] is parent] = survivor
+
+    @staticmethod
+    def _subtree(node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield from node.keys
+            for child in reversed(node.children):  # lower addresses first
+                if child is not None:
+                    stack.append(child)
+
+    def nearest(self, ip):
+        """Yield peer keys by decreasing common prefix with `ip`, lazily."""
+        family, x = self._parse(ip)
+        width = self._WIDTH.get(family)
+        if width is not None:
+            # Walk the path of `ip`: the sibling hanging off each step shares exactly
+            # that step's depth with it, so deeper siblings come first
+            siblings = []
+            node = self._roots[family]
+            while node is not None and node.length < width:
+                bit = (x >> (width - node.length - 1)) & 1
+                siblings.append(node.children[bit ^ 1])
+                child = node.children[bit]
+                if child is not None and min(child.length, width - (x ^ child.prefix).bit_length()) < child.length:
+                    siblings.append(child)  # diverges inside the edge: whole subtree shares less
+                    break
+                node = child
+            else:
+                if node is not None:
+                    yield from node.keys  # same address
+            for sibling in reversed(siblings):
+                if sibling is not None:
+                    yield from self._subtree(sibling)
+        # Other families share no prefix with the requester
+        for other, root in self._roots.items():
+            if other != family:
+                yield from self._subtree(root)
+        yield from self._unparsable
+
+
+class _PeerIndex:
+    """
+    Set of peer records keyed by peer_key with O(1) add/remove.
+
+    `members` keeps records in refresh order (oldest first), which serves the
+    default and newest-first DISCOVER orderings. `_keys` is a dense array of the
+    same keys (swap-remove on delete) so uniform random samples can be drawn
+    without copying the whole set, and `prefixes` orders them by address for
+    locality-aware answers.
+    """
+    __slots__ = ("members", "_keys", "_pos", "prefixes")
+
+    def __init__(self):
+        self.members = {}
+        self._keys = []
+        self._pos = {}
+        self.prefixes = _PrefixIndex()
+
+    def __len__(self):
+        return len(self.members)
+
+    def put(self, key, peer):
+        if key in self.members:
+            # re-insert so that refresh order reflects the latest REGISTER
+            del self.members[key]
+        else:
+            self._pos[key] = len(self._keys)
+            self._keys.append(key)
+            self.prefixes.add(peer.ip, key)
+        self.members[key] = peer
+
+    def discard(self, key):
+        peer = self.members.pop(key, None)
+        if peer is None:
+            return
+        self.prefixes.discard(peer.ip, key)
+        i = self._pos.pop(key)
+        last = self._keys.pop()
+        if i < len(self._keys):
+            self._keys[i] = last
+            self._pos[last] = i
+
+    def oldest_first(self):
+        return iter(self.members.values())
+
+    def newest_first(self):
+        return reversed(self.members.values())
+
+    def nearest_first(self, ip):
+        members = self.members
+        return (members[key] for key in self.prefixes.nearest(ip))
+
+    def random_order(self, rng=random):
+        """Yield members in uniformly random order, lazily (no full copy for small draws)."""
+        keys = self._keys
+        n = len(keys)
+        # Fisher-Yates over a virtual permutation of range(n): only the swapped
+        # positions are stored, so k draws cost O(k) time and memory whatever n is.
+        swapped = {}
+        for i in range(n):
+            j = rng.randrange(i, n)
+            pick = swapped.get(j, j)
+            swapped[j] = swapped.get(i, i)
+            yield self.members[keys[pick]]
+
+
 class PeerDatabase:
-    def __init__(self, filename="peers.json"):
+    def __init__(self, filename="peers.json", persist_interval=0):
         self.filename = filename
         self._lock = threading.RLock()
-        self.peers = self._load()
+        # Persistence policy: 0 writes peers.json on every change, N > 0 batches
+        # changes and writes at most every N seconds (see flush_if_due).
+        self.persist_interval = persist_interval
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._all = _PeerIndex()
+        self._by_ns = {}  # namespace -> _PeerIndex
+        self._leases = {}  # lease token -> peer_key
+        self._by_ip = {}  # ip -> number of live registrations from it
+        # Min-heap of (expiry, serial, peer_key): one entry per REGISTER/refresh. Entries
+        # made stale by a later refresh or a removal are skipped when popped.
+        self._expiry = []
+        self._expiry_serial = itertools.count()
+        self._churn = {}  # namespace (None = all) -> [events/min EWMA, last update]
+        for peer in self._load():
+            self._index_put(peer)
+        self._churn.clear()  # loading the file is not membership change
+
+    @property
+    def peers(self):
+        # Snapshot of every record, in refresh order
+        with self._lock:
+            return list(self._all.members.values())
+
+    def _index_put(self, peer: PeerRecord):
+        # MUST be called with self._lock held (or during __init__)
+        key = peer_key(peer)
+        if key not in self._all.members:
+            self._note_churn(peer.namespace)
+            self._by_ip[peer.ip] = self._by_ip.get(peer.ip, 0) + 1
+        self._all.put(key, peer)
+        heapq.heappush(self._expiry, (self._expires_at(peer), next(self._expiry_serial), key))
+        if peer.lease:
+            self._leases[peer.lease] = key
+        ns = self._by_ns.get(peer.namespace)
+        if ns is None:
+            ns = self._by_ns[peer.namespace] = _PeerIndex()
+        ns.put(key, peer)
+
+    def _index_discard(self, peer: PeerRecord):
+        # MUST be called with self._lock held
+        key = peer_key(peer)
+        if key in self._all.members:
+            self._note_churn(peer.namespace)
+            count = self._by_ip[peer.ip] - 1
+            if count:
+                self._by_ip[peer.ip] = count
+            else:
+                del self._by_ip[peer.ip]
+        self._all.discard(key)
+        if peer.lease:
+            self._leases.pop(peer.lease, None)
+        ns = self._by_ns.get(peer.namespace)
+        if ns is not None:
+            ns.discard(key)
+            if not ns:
+                del self._by_ns[peer.namespace]
+
+    @staticmethod
+    def _expires_at(peer: PeerRecord):
+        return peer.timestamp + timedelta(seconds=peer.ttl)
+
+    def _note_churn(self, namespace):
+        # MUST be called with self._lock held: one join/leave in `namespace`
+        now = time.monotonic()
+        for ns in (namespace, None):
+            entry = self._churn.get(ns)
+            if entry is None:
+                self._churn[ns] = [60.0 / CHURN_TAU, now]
+            else:
+                entry[0] = entry[0] * math.exp(-(now - entry[1]) / CHURN_TAU) + 60.0 / CHURN_TAU
+                entry[1] = now
+
+    def churn_rate(self, namespace=None) -> float:
+        """Recent membership changes per minute in `namespace` (None = every namespace)."""
+        with self._lock:
+            entry = self._churn.get(namespace)
+            if entry is None:
+                return 0.0
+            return entry[0] * math.exp(-(time.monotonic() - entry[1]) / CHURN_TAU)
 
     def _load(self):
         if not os.path.exists(self.filename):
@@ -57,7 +342,7 @@ class PeerDatabase:
 
         # prepara conteúdo serializável
         payload = []
-        for p in self.peers:
+        for p in self._all.oldest_first():
             d = dict(p.__dict__)  # se for dataclass, poderia usar asdict(p)
             ts = d.get("timestamp")
             if isinstance(ts, datetime):
@@ -73,20 +358,64 @@ class PeerDatabase:
             os.fsync(f.fileno())
         os.replace(tmpf, self.filename)
         
-        log.info("Saved %d peer(s) into %s", len(self.peers), self.filename)
+        self._dirty = False
+        self._last_save = time.monotonic()
+        log.info("Saved %d peer(s) into %s", len(self._all), self.filename)
         
     def _save(self):
         with self._lock:
             self._save_locked()
 
+    def _persist_locked(self):
+        # MUST be called with self._lock held: record a change under the current policy
+        if self.persist_interval <= 0:
+            self._save_locked()
+        else:
+            self._dirty = True
+
+    def flush(self):
+        """Write pending changes now (used on shutdown and by the periodic flush)."""
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+    def flush_if_due(self):
+        """Write pending changes if persist_interval has elapsed since the last save."""
+        with self._lock:
+            if self._dirty and time.monotonic() - self._last_save >= self.persist_interval:
+                self._save_locked()
+
     def _sweep(self):
+        """
+        Remove expired records.
+
+        Pops the expiry heap only up to now, so the cost is O(expired * log n)
+        rather than a scan of the table: reads stay bounded by what they return.
+        """
         with self._lock:
-            before = len(self.peers)
-            self.peers = [p for p in self.peers if not p.is_expired()]
-            expired = before - len(self.peers)
+            now = datetime.now(timezone.utc)
+            heap = self._expiry
+            expired = 0
+            while heap and heap[0][0] < now:
+                _, _, key = heapq.heappop(heap)
+                peer = self._all.members.get(key)
+                # A refreshed record has a later entry still queued; removed ones are gone
+                if peer is not None and peer.is_expired():
+                    self._index_discard(peer)
+                    expired += 1
+            if len(heap) > 2 * len(self._all) + 1024:
+                self._rebuild_expiry_locked()
+            if expired:
+                self._persist_locked()
         if expired:
             log.info("Expired %d peer(s) removed", expired)
 
+    def _rebuild_expiry_locked(self):
+        # MUST be called with self._lock held: drop the stale entries left by refreshes
+        self._expiry = [(self._expires_at(p), next(self._expiry_serial), key)
+                        for key, p in self._all.members.items()]
+        heapq.heapify(self._expiry)
+
 
     def is_ip_registered(self, ip: str) -> bool:
         """
@@ -96,35 +425,89 @@ class PeerDatabase:
         IP address exists in the peer database.
         It first performs a sweep operation to remove stale entries before checking.
         """
-        found = False
-
         with self._lock:
             self._sweep()
-            for p in self.peers:
-                if p.ip == ip:
-                    found = True
-                    break
-            self._save_locked()
-
-        return found
+            return ip in self._by_ip
     def add_peer(self, peer: PeerRecord):
-        """Upsert by (ip, namespace, name) to avoid duplicates."""
+        """Upsert by (ip, namespace, name) to avoid duplicates. Returns the lease token."""
         
         with self._lock:
             # optional dedup key: (ip, namespace, name)
             self._sweep()
-            updated = False
-            
-            for i, p in enumerate(self.peers):
-                if p.ip == peer.ip and p.namespace == peer.namespace and p.name == peer.name:
-                    # update existing record (port/ttl/timestamp/observed_*)
-                    self.peers[i] = peer  # update existing
-                    updated = True
-                    break
-            if not updated:
-                self.peers.append(peer)
-            
-            self._save_locked()
+            self._add_locked(peer)
+        return peer.lease
+
+    def _add_locked(self, peer: PeerRecord):
+        # MUST be called with self._lock held (and after a sweep)
+        # A re-REGISTER keeps the lease already handed out for this registration
+        current = self._all.members.get(peer_key(peer))
+        if current is not None and current.lease:
+            peer.lease = current.lease
+        elif not peer.lease:
+            peer.lease = secrets.token_urlsafe(16)
+        
+        # update existing record (port/ttl/timestamp/observed_*) or insert a new one
+        self._index_put(peer)
+        
+        self._persist_locked()
+
+    def add_peer_and_sample(self, peer: PeerRecord, namespaces, limit=None, sample=None,
+                            exclude=None, near_ip=None):
+        """
+        REGISTER and DISCOVER in one pass: upsert `peer`, then select from each of
+        `namespaces` as sample_peers() would, under a single lock and expiry sweep.
+
+        Returns (lease, {namespace: (records, total)}).
+        """
+        with self._lock:
+            self._sweep()
+            self._add_locked(peer)
+            groups = {ns: self._select_locked(ns, limit, sample, exclude, near_ip) for ns in namespaces}
+        return peer.lease, groups
+
+    def has_peer(self, ip: str, namespace, name) -> bool:
+        """O(1) check for a live registration with exactly this (ip, namespace, name)."""
+        with self._lock:
+            peer = self._all.members.get((ip, namespace, name))
+            return peer is not None and not peer.is_expired()
+
+    def lease_owner(self, lease, ip: str):
+        """
+        O(1) proof of source address: the peer_key of the live registration that owns
+        `lease` when it was handed out (over TCP) to `ip`, else None. Nothing is refreshed.
+        """
+        if not isinstance(lease, str):
+            return None
+        with self._lock:
+            key = self._leases.get(lease)
+            peer = self._all.members.get(key) if key is not None else None
+            if peer is None or peer.ip != ip or peer.is_expired():
+                return None
+            return key
+
+    def refresh_lease(self, lease: str, ip: str):
+        """
+        Extend the registration that owns `lease` by its TTL, starting now.
+
+        O(1): no sweep over the table and no persistence write (the refreshed
+        timestamp is written out with the next save). Returns the refreshed
+        record, or None if the lease is unknown, expired or presented from
+        another IP.
+        """
+        with self._lock:
+            key = self._leases.get(lease)
+            if key is None:
+                return None
+            peer = self._all.members.get(key)
+            if peer is None or peer.ip != ip:
+                return None
+            if peer.is_expired():
+                self._index_discard(peer)
+                return None
+            peer.timestamp = datetime.now(timezone.utc)
+            self._index_put(peer)  # moves it to the newest end
+            self._dirty = True  # written by the next save/flush, never forced here
+            return peer
 
     def remove_peer(self, ip : str, namespace : str, name=None, port=None):
         """
@@ -133,8 +516,6 @@ class PeerDatabase:
         """
         
         with self._lock:
-            before = len(self.peers)
-            
             def match(p):
                 ok = (p.ip == ip and p.namespace == namespace)
                 if name is not None:
@@ -143,13 +524,16 @@ class PeerDatabase:
                     ok &= (p.port == port)
                 return ok
             
-            self.peers = [p for p in self.peers if not match(p)]
-            removed = before - len(self.peers)
+            ns = self._by_ns.get(namespace)
+            doomed = [p for p in ns.oldest_first() if match(p)] if ns else []
+            for p in doomed:
+                self._index_discard(p)
+            removed = len(doomed)
             log.info("Removed %d peer(s) ip=%s ns=%s name=%r port=%r",
                      removed, ip, namespace, name, port)
             
             # Persist under the same lock to keep file and memory in sync.
-            self._save_locked()
+            self._persist_locked()
             
             # return True if any peer was removed
             return removed > 0 
@@ -160,9 +544,56 @@ class PeerDatabase:
         with self._lock:
             self._sweep()
             if namespace:
-                return [p for p in self.peers if p.namespace == namespace]
-            return self.peers  # return a shallow copy
+                ns = self._by_ns.get(namespace)
+                return list(ns.oldest_first()) if ns else []
+            return list(self._all.oldest_first())  # return a shallow copy
+
+    def sample_peers(self, namespace=None, limit=None, sample=None, exclude=None, near_ip=None):
+        """
+        Bounded view of a namespace (or of every namespace when None).
+
+        `sample` selects the order in which records are taken: None keeps refresh
+        order, "newest" walks newest-first, "random" draws a uniform sample and
+        "nearest" walks by longest common IP prefix with `near_ip`.
+        `exclude` is an optional predicate for records to skip (e.g. the requester).
+        Only up to `limit` records are visited past the excluded ones, so the full
+        list is never materialized. Returns (records, total) where total is the
+        namespace size before limit/exclusion.
+        """
+        with self._lock:
+            self._sweep()
+            return self._select_locked(namespace, limit, sample, exclude, near_ip)
+
+    def sample_many(self, namespaces, limit=None, sample=None, exclude=None, near_ip=None):
+        """
+        sample_peers() over several namespaces with one lock and one expiry sweep.
+
+        `limit` applies per namespace. Returns {namespace: (records, total)} in the
+        order of `namespaces`.
+        """
+        with self._lock:
+            self._sweep()
+            return {ns: self._select_locked(ns, limit, sample, exclude, near_ip) for ns in namespaces}
+
+    def _select_locked(self, namespace, limit, sample, exclude, near_ip):
+        # MUST be called with self._lock held (and after a sweep)
+        index = self._all if namespace is None else self._by_ns.get(namespace)
+        if not index:
+            return [], 0
+
+        if sample == "random":
+            it = index.random_order()
+        elif sample == "newest":
+            it = index.newest_first()
+        elif sample == "nearest":
+            it = index.nearest_first(near_ip)
+        else:
+            it = index.oldest_first()
+
+        if exclude is not None:
+            it = (p for p in it if not exclude(p))
+        return list(islice(it, limit)), len(index)
     
     def get_all_db(self):
         with self._lock:
-            return list(self.peers)
+            return list(self._all.oldest_first())
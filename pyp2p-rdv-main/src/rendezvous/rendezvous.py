@@ -1,18 +1,38 @@
 
 import socket
+import selectors
+import signal
 import threading
 import time
-from collections import defaultdict, deque
+import ipaddress
+import concurrent.futures
+from collections import defaultdict, deque, OrderedDict
+from dataclasses import dataclass, field, replace
 from peer_db import PeerDatabase
 from protocol_parser import ProtocolParser
 from request_handler import RequestHandler
+from server_config import ServerLimits, load_limits
+import compression
 import json
 import logging
 
 
 log = logging.getLogger("rendezvous")
 
-MAX_LINE = 32 * 1024  # 32KB
+# Optional UDP transport: single-datagram requests, responses must fit one datagram
+UDP_MAX_DATAGRAM = 1200  # bytes; stays below common path MTUs
+UDP_COMMANDS = ("REGISTER", "HEARTBEAT", "DISCOVER")
+
+
+@dataclass
+class _PendingRequest:
+    """Connection accepted by the front stage that has not sent a full line yet."""
+    connection: socket.socket
+    address: tuple
+    peer: str
+    deadline: float
+    buf: bytearray = field(default_factory=bytearray)
+
 
 class RendezvousServer:
     """
@@ -22,6 +42,25 @@ class RendezvousServer:
     and block IPs that exceed the configured threshold. This helps protect against
     simple DoS attacks and excessive connection attempts.
     
+    Connections are accepted by a single selector-based front stage that buffers
+    the request line of every pending client, enforcing the max_line and
+    request_timeout limits there. Only complete lines are handed to the worker pool, so
+    slow clients cannot pin workers while they trickle bytes.
+    
+    With `udp=True` the same port also accepts single-datagram REGISTER refresh,
+    HEARTBEAT and DISCOVER requests carrying a request id (`rid`) and the lease
+    handed out by a TCP REGISTER. The lease is bound to the IP that registered, so
+    it proves the source address: datagrams without a valid one are dropped
+    unanswered (a reply could go to a spoofed victim). Verified datagrams count
+    against a separate per-IP UDP window that only drops datagrams and never
+    blocks TCP. Answers that do not fit UDP_MAX_DATAGRAM are "use_tcp".
+    
+    Limits and tunables live in a ServerLimits object. When a config file is given
+    it is re-read on SIGHUP or on a RELOAD command from loopback, and the new
+    limits replace the old ones in a single swap: the worker pool is resized,
+    the listen backlog and persistence interval changed, without a restart and
+    without dropping in-flight requests.
+    
     Limitations:
     - NAT/proxy scenarios: Multiple legitimate clients behind the same NAT/proxy
       share the same public IP and may trigger false-positive blocks.
@@ -38,30 +77,181 @@ class RendezvousServer:
     - Consider using external rate-limiting solutions (e.g., fail2ban, iptables)
       for more sophisticated protection
     """
-    def __init__(self, host='0.0.0.0', port=5000, max_attempts=50, window_seconds=60, block_time=60):
+    def __init__(self, host='0.0.0.0', port=5000, max_attempts=50, window_seconds=60, block_time=60,
+                 limits: ServerLimits = None, config_path=None):
         self.host = host
         self.port = port
-        self.peer_db = PeerDatabase()
+        
+        # Limits/tunables: swapped as a whole on reload, read without locking
+        self.limits = limits or ServerLimits(
+            max_attempts=max_attempts,  # Maximum connection attempts in the time window
+            window_seconds=window_seconds,  # Time window for counting attempts (in seconds)
+            block_time=block_time,  # Duration to block an IP (in seconds)
+        )
+        self._base_limits = self.limits  # values for keys absent from the config file
+        self.config_path = config_path
+        self._reload_lock = threading.Lock()
+        self._reload_requested = False
+        
+        self.peer_db = PeerDatabase(persist_interval=self.limits.persist_interval)
         self.parser = ProtocolParser()
-        self.handler = RequestHandler(self.peer_db)
+        self.handler = RequestHandler(self.peer_db, load_fn=self.current_load)
         
-        # IP blocking configuration
-        self.max_attempts = max_attempts  # Maximum connection attempts in the time window
-        self.window_seconds = window_seconds  # Time window for counting attempts (in seconds)
-        self.block_time = block_time  # Duration to block an IP (in seconds)
+        # Requests handed to the pool and not finished yet (feeds the pacing hints)
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
         
         # Thread-safe data structures for IP blocking
         self.attempts = defaultdict(deque)  # IP -> deque of connection timestamps
         self.blocked_ips = {}  # IP -> block timestamp
         self.attempts_lock = threading.Lock()  # Lock to protect shared data structures
+        self.udp_attempts = defaultdict(deque)  # IP -> timestamps of verified datagrams (never blocks TCP)
         
+        # Selector front stage (owned by the accept thread only)
+        self._selector = None
+        self._pending = OrderedDict()  # fd -> _PendingRequest, in accept order
+        self._listener = None
+        self._executor = None
+        self._pool_size = None  # max_workers of the current executor
+        self._backlog = None
+        self._applied_limits = None  # last limits the front stage applied successfully
+        self._next_flush = None
+        self._wake_r, self._wake_w = None, None  # self-pipe to wake select()
         
-    def handle_client(self, connection, address):
-        connection.settimeout(5)
-        buf = b""
-        line = None
-        peer = f"{address[0]}:{address[1]}"
-        client_ip = address[0]
+    # IP blocking configuration (read-only views of the current limits)
+    @property
+    def max_attempts(self):
+        return self.limits.max_attempts
+
+    @property
+    def window_seconds(self):
+        return self.limits.window_seconds
+
+    @property
+    def block_time(self):
+        return self.limits.block_time
+
+    def current_load(self) -> float:
+        """Busy-or-queued requests per worker: < 1 means idle capacity, > 1 means a backlog."""
+        return self._inflight / self.limits.max_workers
+
+    def _submit(self, fn, *args):
+        # Every request goes through here so that the in-flight count stays exact
+        with self._inflight_lock:
+            self._inflight += 1
+
+        def run():
+            try:
+                fn(*args)
+            finally:
+                with self._inflight_lock:
+                    self._inflight -= 1
+
+        self._executor.submit(run)
+
+    def reload_config(self):
+        """
+        Re-read config_path and swap in the new limits.
+
+        Returns (ok, limits_dict_or_error). On any read/validation error the current
+        limits stay in place. Pool size and backlog are applied by the front stage,
+        which is woken up right after the swap.
+        """
+        with self._reload_lock:
+            if not self.config_path:
+                return False, "no_config_file"
+            try:
+                new = load_limits(self.config_path, base=self._base_limits)
+            except (OSError, ValueError) as e:
+                log.error("Config reload from %s failed, keeping current limits: %s", self.config_path, e)
+                return False, str(e)
+
+            old = self.limits
+            self.limits = new
+            self.peer_db.persist_interval = new.persist_interval
+            if new.persist_interval <= 0 and old.persist_interval > 0:
+                self.peer_db.flush()  # back to write-through: nothing may stay unsaved
+
+            changed = {k: v for k, v in new.as_dict().items() if old.as_dict()[k] != v}
+            log.info("Config reloaded from %s; changed: %s", self.config_path, changed or "nothing")
+
+        self._wake()
+        return True, new.as_dict()
+
+    def _wake(self):
+        # Interrupt select() so the front stage re-reads the limits
+        if self._wake_w is not None:
+            try:
+                self._wake_w.send(b"\0")
+            except OSError:
+                pass
+
+    def _on_sighup(self, signum, frame):
+        # Runs on the front-stage thread between bytecodes: only flag it, the loop does the work
+        self._reload_requested = True
+
+    def _apply_front_stage_limits(self):
+        """
+        Bring the worker pool, listen backlog and flush schedule in line with self.limits.
+
+        If any step fails, the last limits that applied cleanly are swapped back in and
+        re-applied, so a reloaded value the sockets or the pool reject is logged instead
+        of stopping the front stage. At startup there is nothing to fall back to and the
+        error propagates.
+        """
+        limits = self.limits
+        try:
+            self._apply_limits(limits)
+        except Exception as e:
+            previous = self._applied_limits
+            if previous is None:
+                raise
+            log.error("Could not apply reloaded limits, keeping the previous ones: %s", e)
+            with self._reload_lock:
+                if self.limits is limits:  # a newer reload gets its own attempt
+                    self.limits = previous
+                    self.peer_db.persist_interval = previous.persist_interval
+            self._apply_limits(previous)
+        else:
+            self._applied_limits = limits
+
+    def _apply_limits(self, limits):
+        if limits.max_workers != self._pool_size:
+            old = self._executor
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=limits.max_workers, thread_name_prefix='cli'
+            )
+            self._pool_size = limits.max_workers
+            if old is not None:
+                # Already queued requests still run on the old pool; it exits once drained
+                old.shutdown(wait=False)
+                log.info("Worker pool resized to %d", limits.max_workers)
+
+        if limits.backlog != self._backlog:
+            self._listener.listen(limits.backlog)
+            self._backlog = limits.backlog
+
+        if limits.persist_interval > 0:
+            if self._next_flush is None:
+                self._next_flush = time.monotonic() + limits.persist_interval
+        else:
+            self._next_flush = None
+
+    def _flush_if_due(self):
+        if self._next_flush is None or time.monotonic() < self._next_flush:
+            return
+        # File I/O belongs on a worker, not on the front stage
+        self._executor.submit(self.peer_db.flush_if_due)
+        self._next_flush = time.monotonic() + self.limits.persist_interval
+        
+    def _record_attempt(self, client_ip, peer):
+        """
+        Count one request from `client_ip` in the sliding window.
+
+        Returns (allowed, remaining): `remaining` is the number of seconds left on an
+        existing block (None when the IP was just blocked or is allowed).
+        """
+        limits = self.limits  # one consistent snapshot for this request
         
         # IP blocking check with thread-safe access
         with self.attempts_lock:
@@ -72,25 +262,11 @@ class RendezvousServer:
                 block_timestamp = self.blocked_ips[client_ip]
                 time_since_block = now - block_timestamp
                 
-                if time_since_block < self.block_time:
+                if time_since_block < limits.block_time:
                     # Still blocked
                     log.warning(f"Connection from {peer} blocked due to too many attempts "
-                               f"({int(self.block_time - time_since_block)}s remaining)")
-                    
-                    msg = json.dumps({
-                        "status": "ERROR",
-                        "message": f"Connection from {peer} has been blocked due to excessive login attempts (limit: {self.max_attempts}). The block will be lifted in {int(self.block_time - time_since_block)} seconds."
-                    })
-                    
-                    try:
-                        connection.sendall((msg + "\n").encode("utf-8"))
-                        
-                        connection.shutdown(socket.SHUT_RDWR)
-                    except Exception:
-                        pass
-                    
-                    connection.close()
-                    return
+                               f"({int(limits.block_time - time_since_block)}s remaining)")
+                    return False, int(limits.block_time - time_since_block)
                 else:
                     # Block expired, remove from blocked list and clear attempts
                     del self.blocked_ips[client_ip]
@@ -99,68 +275,339 @@ class RendezvousServer:
             
             # Clean old timestamps from the sliding window
             attempts_deque = self.attempts[client_ip]
-            while attempts_deque and attempts_deque[0] < now - self.window_seconds:
+            while attempts_deque and attempts_deque[0] < now - limits.window_seconds:
                 attempts_deque.popleft()
             
             # Check if this IP has exceeded the maximum attempts
-            if len(attempts_deque) >= self.max_attempts:
+            if len(attempts_deque) >= limits.max_attempts:
                 # Block this IP
                 self.blocked_ips[client_ip] = now
                 log.warning(f"Connection from {peer} blocked due to too many attempts "
-                           f"({len(attempts_deque)} attempts in {self.window_seconds}s)")
-                try:
-                    connection.shutdown(socket.SHUT_RDWR)
-                except Exception:
-                    pass
-                connection.close()
-                return
+                           f"({len(attempts_deque)} attempts in {limits.window_seconds}s)")
+                return False, None
             
             # Record this connection attempt
             attempts_deque.append(now)
+
+        return True, None
+
+    def _record_udp_attempt(self, client_ip) -> bool:
+        """
+        Count one verified datagram from `client_ip` in its own sliding window.
+
+        Over the limit the datagram is dropped; nothing is blocked and the TCP
+        attempts/blocked_ips tables are never touched.
+        """
+        limits = self.limits
+        with self.attempts_lock:
+            now = time.time()
+            attempts_deque = self.udp_attempts[client_ip]
+            while attempts_deque and attempts_deque[0] < now - limits.window_seconds:
+                attempts_deque.popleft()
+            if len(attempts_deque) >= limits.max_attempts:
+                return False
+            attempts_deque.append(now)
+        return True
+
+    def _check_rate_limit(self, connection, address) -> bool:
+        """
+        Apply the sliding-window IP blocking to a freshly accepted connection.
+
+        Returns True when the connection may proceed. When the client is blocked the
+        connection is answered (if still under block) and closed here.
+        """
+        peer = f"{address[0]}:{address[1]}"
+        allowed, remaining = self._record_attempt(address[0], peer)
+        if allowed:
+            return True
+
+        if remaining is not None:
+            msg = json.dumps({
+                "status": "ERROR",
+                "message": f"Connection from {peer} has been blocked due to excessive login attempts (limit: {self.max_attempts}). The block will be lifted in {remaining} seconds.",
+                "retry_after": remaining
+            })
+            
+            try:
+                # Fresh socket with an empty send buffer: a short message never blocks here
+                connection.settimeout(0.5)
+                connection.sendall((msg + "\n").encode("utf-8"))
+            except Exception:
+                pass
+
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        connection.close()
+        return False
+
+    def _accept_pending(self, server):
+        """
+        Accept every connection waiting in the backlog and park it in the selector.
+
+        Runs on the front-stage thread only; the listening socket is non-blocking so
+        the loop stops as soon as the backlog is drained.
+        """
+        while True:
+            try:
+                connection, address = server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                log.warning("accept() failed: %s", e)
+                return
+
+            limits = self.limits
+            ka_idle, ka_intvl, ka_cnt = limits.ka_idle, limits.ka_intvl, limits.ka_cnt
+            
+            # Also enable keepalive on accepted sockets (some OSes don't inherit all opts)
+            try:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                if hasattr(socket, "TCP_KEEPIDLE"):
+                    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, ka_idle)
+                if hasattr(socket, "TCP_KEEPINTVL"):
+                    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, ka_intvl)
+                if hasattr(socket, "TCP_KEEPCNT"):
+                    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, ka_cnt)
+                if hasattr(socket, "TCP_KEEPALIVE"):
+                    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, ka_idle)
+            except Exception as e:
+                log.debug("Keepalive not supported on accepted socket %s:%s: %s", *address, e)
+
+            if not self._check_rate_limit(connection, address):
+                continue
+
+            peer = f"{address[0]}:{address[1]}"
+            log.info(f"Connection from {peer}")
+
+            connection.setblocking(False)
+            pending = _PendingRequest(
+                connection=connection,
+                address=address,
+                peer=peer,
+                deadline=time.monotonic() + limits.request_timeout,
+            )
+            self._selector.register(connection, selectors.EVENT_READ, data=pending)
+            self._pending[connection.fileno()] = pending
+
+    def _on_readable(self, pending):
+        """
+        Buffer whatever the client sent and dispatch once a full request line is present.
+
+        The front stage never blocks: partial lines stay in the pending buffer until the
+        newline arrives, the line grows past max_line, the peer closes or the deadline expires.
+        """
+        connection = pending.connection
+        peer = pending.peer
+        try:
+            chunk = connection.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            log.debug("Receive failed from %s: %s", peer, e)
+            self._drop_pending(pending)
+            return
+
+        if not chunk:
+            # EOF: se já tem algo no buffer, processa como uma linha; senão encerra.
+            if pending.buf.strip():
+                self._dispatch(pending, bytes(pending.buf))
+            else:
+                msg = json.dumps({"status": "ERROR", "message": "Empty request line"})
+                log.warning("Empty request line from %s; sending error", peer)
+                self._reply_and_drop(pending, msg)
+            return
+
+        # Only the new chunk needs scanning for the terminator
+        nl = chunk.find(b"\n")
+        scanned = len(pending.buf)
+        pending.buf += chunk
+
+        max_line = self.limits.max_line
+        if len(pending.buf) > max_line:
+            log.warning("Request line too long from %s: %d bytes (limit=%d). Closing.", peer, len(pending.buf), max_line)
+            log.debug("First 200 bytes from %s: %r", peer, bytes(pending.buf[:200]))
+            
+            msg = json.dumps({"status": "ERROR","message": "line_too_long","limit": max_line})
+            self._reply_and_drop(pending, msg)
+            return
+
+        if nl != -1:
+            self._dispatch(pending, bytes(pending.buf[:scanned + nl]))
+
+    def _expire_pending(self):
+        """Close pending connections whose request line did not arrive in time."""
+        now = time.monotonic()
+        # Pending entries are kept in accept order and share the same timeout,
+        # so the expired ones are always at the front. (Right after a reload that
+        # shortens request_timeout, newer entries may wait for older ones to expire.)
+        while self._pending:
+            pending = next(iter(self._pending.values()))
+            if pending.deadline > now:
+                break
+            msg = json.dumps({"status": "ERROR", "message": "Timeout: no data received, closing connection"}) 
+            log.warning("Timeout waiting data from %s; sending error and closing", pending.peer)
+            self._reply_and_drop(pending, msg)
+
+    def _next_timeout(self):
+        # Sleep in select() only until the oldest pending request expires or a flush is due
+        deadlines = []
+        if self._pending:
+            deadlines.append(next(iter(self._pending.values())).deadline)
+        if self._next_flush is not None:
+            deadlines.append(self._next_flush)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _detach(self, pending):
+        # Remove the connection from the front stage (selector + pending index)
+        self._pending.pop(pending.connection.fileno(), None)
+        try:
+            self._selector.unregister(pending.connection)
+        except (KeyError, ValueError):
+            pass
+
+    def _drop_pending(self, pending):
+        self._detach(pending)
+        self._close_connection(pending.connection, pending.peer)
+
+    def _reply_and_drop(self, pending, msg):
+        """
+        Best-effort error reply from the front stage, then close.
+
+        The socket is non-blocking here: error messages are small enough to fit in an
+        empty send buffer, and a client that is not reading does not deserve a worker.
+        """
+        self._detach(pending)
+        try:
+            pending.connection.send((msg + "\n").encode("utf-8"))
+        except OSError as e:
+            # Quieter log to avoid clutter in DoS scenarios
+            log.debug("Failed to send error reply to %s: %s", pending.peer, e)
+        self._close_connection(pending.connection, pending.peer)
+
+    def _dispatch(self, pending, line):
+        # Complete request line: hand over to the pool (limits concurrency)
+        self._detach(pending)
+        self._submit(self.process_request, pending.connection, pending.address, line)
+
+    def _close_connection(self, connection, peer):
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
         
-        log.info(f"Connection from {peer}")
+        connection.close()
+        log.info("Connection closed with %s", peer)
+
+    def _on_datagrams(self, udp_sock):
+        # Drain every queued datagram; each complete request goes to the pool
+        while True:
+            try:
+                data, address = udp_sock.recvfrom(UDP_MAX_DATAGRAM + 1)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                log.debug("UDP receive failed: %s", e)
+                return
+
+            peer = f"{address[0]}:{address[1]}"
+            if len(data) > UDP_MAX_DATAGRAM:
+                log.debug("Oversized datagram from %s (%d bytes); dropped", peer, len(data))
+                continue
+
+            # Source address check before anything else: only the holder of a lease issued
+            # over TCP to this IP gets an answer. Everything else is dropped silently, so
+            # forged datagrams neither reflect traffic nor count toward any IP's budget.
+            request = self.parser.parse(data.decode("utf-8", errors="replace"))
+            owner = self.peer_db.lease_owner(request.args.get("lease"), address[0])
+            if owner is None:
+                log.debug("Datagram from %s without a valid lease; dropped", peer)
+                continue
+
+            if not self._record_udp_attempt(address[0]):
+                log.debug("UDP budget exceeded for %s; datagram dropped", peer)
+                continue
+
+            self._submit(self.process_datagram, udp_sock, request, owner, address)
+
+    def process_datagram(self, udp_sock, request, owner, address):
+        """
+        Worker-side handling of one verified UDP request: same handler as TCP, one datagram back.
+
+        `owner` is the registration whose lease came with the datagram. Requests without
+        a usable `rid` are dropped (the client could not match the answer). The response
+        echoes `rid`; when it would not fit in one datagram the client is told to retry
+        over TCP instead.
+        """
+        peer = f"{address[0]}:{address[1]}"
+        log.info("Received datagram from %s: %s %s", peer, request.command,
+                 {k: v for k, v in request.args.items() if k != "lease"})
+
+        rid = request.args.get("rid")
+        if not isinstance(rid, (str, int)) or isinstance(rid, bool) or len(str(rid)) > 32:
+            log.debug("Datagram from %s without a valid rid; dropped", peer)
+            return
+
+        if request.command not in UDP_COMMANDS:
+            response = {"status": "ERROR", "message": "use_tcp"}
+        elif request.command == "REGISTER" and owner != (
+                address[0], request.args.get("namespace"), request.args.get("name")):
+            # Only refreshes of the lease's own registration go over UDP
+            response = {"status": "ERROR", "message": "use_tcp"}
+        else:
+            response = json.loads(self.handler.handle(request, address[0]))
+            if compression.requested(request.args):
+                # Compressing can also bring a DISCOVER under the datagram limit
+                packed = compression.compress_response(json.dumps(response), response.get("status"),
+                                                       self.limits.compress_threshold)
+                if packed:
+                    response = packed
+
+        response["rid"] = rid
+        out = json.dumps(response).encode("utf-8")
+        if len(out) > UDP_MAX_DATAGRAM:
+            log.info("Response to %s does not fit a datagram (%d bytes); asking for TCP", peer, len(out))
+            out = json.dumps({"status": "ERROR", "message": "use_tcp", "rid": rid}).encode("utf-8")
+
+        try:
+            udp_sock.sendto(out, address)
+            log.info("Responded datagram to %s (status=%s)", peer, response.get("status"))
+        except OSError as e:
+            log.debug("Failed to send datagram to %s: %s", peer, e)
+
+    def _handle_reload(self, client_ip):
+        # Admin command: only accepted from the server host itself
+        try:
+            local = ipaddress.ip_address(client_ip).is_loopback
+        except ValueError:
+            local = False
+        if not local:
+            log.warning("RELOAD refused from %s", client_ip)
+            return json.dumps({"status": "ERROR", "message": "forbidden"})
+
+        ok, result = self.reload_config()
+        if not ok:
+            return json.dumps({"status": "ERROR", "message": "reload_failed", "details": result})
+        return json.dumps({"status": "OK", "limits": result})
+
+    def process_request(self, connection, address, line):
+        """
+        Worker-side handling of one complete request line: parse, handle, reply, close.
+
+        Only CPU work and the (small) response write happen here; all waiting for
+        client bytes is done by the selector front stage.
+        """
+        peer = f"{address[0]}:{address[1]}"
         t = threading.current_thread()
         old_name = t.name
         
         try:
             # Changing thread name for better logging
             t.name = f"cli-{address[0]}:{address[1]}"
-            
-            while True:
-                try:
-                    chunk = connection.recv(4096)
-                    if not chunk:
-                        # EOF: se já tem algo no buffer, processa como uma linha; senão encerra.
-                        if buf.strip():
-                            line = buf
-                        break
-                    buf += chunk
-                    
-                    if len(buf) > MAX_LINE:
-                        log.warning("Request line too long from %s: %d bytes (limit=%d). Closing.", peer, len(buf), MAX_LINE)
-                        log.debug("First 200 bytes from %s: %r", peer, buf[:200])
-                        
-                        msg = json.dumps({"status": "ERROR","message": "line_too_long","limit": MAX_LINE})
-                        try:
-                            connection.sendall((msg + "\n").encode("utf-8"))
-                        except (socket.timeout, BrokenPipeError, ConnectionResetError) as e:
-                            # Quieter log to avoid clutter in DoS scenarios
-                            log.debug("Failed to send 'line_too_long' to %s: %s", peer, e)
-                        return # close connection at finally block
-                    
-                    if b"\n" in buf:
-                        line, _rest = buf.split(b"\n", 1)
-                        break
-                    
-                except (TimeoutError, socket.timeout):
-                    msg = json.dumps({"status": "ERROR", "message": "Timeout: no data received, closing connection"}) 
-                    
-                    log.warning("Timeout waiting data from %s; sending error and closing", peer)
-
-                    try:
-                        connection.sendall((msg + "\n").encode("utf-8"))
-                    finally:
-                        return # close connection at finally block
+            connection.settimeout(self.limits.request_timeout)
                     
             # if did come useful data, process it and close connection        
             if not line or not line.strip():
@@ -178,39 +625,54 @@ class RendezvousServer:
             
             log.info("Parsed request (%s) from %s", request.command, peer)
 
-            response = self.handler.handle(request, address[0])
-            connection.sendall((response + "\n").encode("utf-8"))
+            if request.command == "RELOAD":
+                response = self._handle_reload(address[0])
+            else:
+                response = self.handler.handle(request, address[0])
             
             try:  
                 status = json.loads(response).get("status") 
             except Exception:
                 status = "?"
-            log.info("Responded to %s (status=%s)", peer, status)
+            
+            size = len(response)
+            if compression.requested(request.args):
+                packed = compression.compress_response(response, status, self.limits.compress_threshold)
+                if packed:
+                    response = json.dumps(packed)
+            connection.sendall((response + "\n").encode("utf-8"))
+            
+            log.info("Responded to %s (status=%s, %d bytes%s)", peer, status, len(response),
+                     "" if len(response) == size else f", {size} uncompressed")
 
             # after sending response, just close connection
             return
+
+        except (socket.timeout, BrokenPipeError, ConnectionResetError) as e:
+            log.debug("Failed to send response to %s: %s", peer, e)
                
         finally:
             t.name = old_name
-            try:
-                connection.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            
-            connection.close()
-            log.info("Connection closed with %s", peer)
+            self._close_connection(connection, peer)
 
             
             
     def start(
         self,
-        max_workers: int = 64,
-        backlog: int = 128,
-        ka_idle: int = 60,
-        ka_intvl: int = 15,
-        ka_cnt: int = 4,
+        max_workers: int = None,
+        backlog: int = None,
+        ka_idle: int = None,
+        ka_intvl: int = None,
+        ka_cnt: int = None,
+        udp: bool = False,
     ):
-        import concurrent.futures  # keep import local to avoid new global deps
+        # Explicit arguments override the configured limits (kept for compatibility)
+        overrides = {k: v for k, v in dict(max_workers=max_workers, backlog=backlog, ka_idle=ka_idle,
+                                           ka_intvl=ka_intvl, ka_cnt=ka_cnt).items() if v is not None}
+        if overrides:
+            self.limits = replace(self.limits, **overrides).validate()
+        limits = self.limits
+        ka_idle, ka_intvl, ka_cnt = limits.ka_idle, limits.ka_intvl, limits.ka_cnt
             
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -231,32 +693,60 @@ class RendezvousServer:
             log.debug("Keepalive tuning not supported on listener: %s", e)
 
         server.bind((self.host, self.port))
-        server.listen(backlog)
+        server.setblocking(False)
+        self._listener = server
+        
+        # Front stage: one thread buffers request lines for every pending connection,
+        # workers only see complete lines.
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(server, selectors.EVENT_READ, data=None)
+        
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, data=None)
+        
+        # SIGHUP -> reload (main thread only, POSIX only)
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.set_wakeup_fd(self._wake_w.fileno())
+            signal.signal(signal.SIGHUP, self._on_sighup)
+        
+        udp_sock = None
+        if udp:
+            udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp_sock.bind((self.host, self.port))
+            udp_sock.setblocking(False)
+            self._selector.register(udp_sock, selectors.EVENT_READ, data=None)
+            log.info("UDP fast path enabled on %s:%d (max datagram=%d)", self.host, self.port, UDP_MAX_DATAGRAM)
+        
+        # Creates the pool and calls listen() with the configured backlog
+        self._apply_front_stage_limits()
         
         log.info("Rendezvous server listening on %s:%d (backlog=%d, workers=%d)",
-                 self.host, self.port, backlog, max_workers)
+                 self.host, self.port, limits.backlog, limits.max_workers)
         
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=max_workers, thread_name_prefix='cli'
-        ) as executor:
+        try:
             while True:
-                connection, address = server.accept()
+                for key, _events in self._selector.select(self._next_timeout()):
+                    if key.fileobj is udp_sock:
+                        self._on_datagrams(udp_sock)
+                    elif key.fileobj is self._wake_r:
+                        try:
+                            while self._wake_r.recv(512):
+                                pass
+                        except (BlockingIOError, InterruptedError):
+                            pass
+                        if self._reload_requested:
+                            self._reload_requested = False
+                            self._executor.submit(self.reload_config)
+                        self._apply_front_stage_limits()
+                    elif key.data is None:
+                        self._accept_pending(server)
+                    else:
+                        self._on_readable(key.data)
                 
-                # Also enable keepalive on accepted sockets (some OSes don't inherit all opts)
-                try:
-                    connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                    if hasattr(socket, "TCP_KEEPIDLE"):
-                        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, ka_idle)
-                    if hasattr(socket, "TCP_KEEPINTVL"):
-                        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, ka_intvl)
-                    if hasattr(socket, "TCP_KEEPCNT"):
-                        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, ka_cnt)
-                    if hasattr(socket, "TCP_KEEPALIVE"):
-                        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, ka_idle)
-                except Exception as e:
-                    log.debug("Keepalive not supported on accepted socket %s:%s: %s", *address, e)
-
-                # Hand over to the pool (limits concurrency)
-                executor.submit(self.handle_client, connection, address)
-
-
+                self._expire_pending()
+                self._flush_if_due()
+        finally:
+            self._executor.shutdown(wait=True)
+            self.peer_db.flush()
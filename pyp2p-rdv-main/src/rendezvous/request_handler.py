@@ -4,12 +4,18 @@ from datetime import datetime, timezone
 import logging
 
 from peer_db import PeerDatabase
+import pacing
 
 log = logging.getLogger("Handler")
 
+MAX_NAMESPACES = 32  # namespaces per grouped DISCOVER (or REGISTER with discover)
+SAMPLES = (None, "random", "newest", "nearest")
+
 class RequestHandler:
-    def __init__(self, peer_db : PeerDatabase):
+    def __init__(self, peer_db : PeerDatabase, load_fn=None):
         self.peer_db = peer_db
+        # Server load (busy workers / pool size) used for the pacing hints
+        self.load_fn = load_fn or (lambda: 0.0)
 
     def handle(self, request, client_ip):
         cmd = request.command
@@ -52,6 +58,23 @@ class RequestHandler:
                 log.warning("REGISTER invalid (port)")
                 return json.dumps({"status": "ERROR", "message": "bad_port"})
             
+            # Optional inline DISCOVER: true = own namespace, "*" = every namespace,
+            # or a list of namespaces (grouped like DISCOVER "namespaces")
+            discover = args.get("discover")
+            if discover:
+                if discover is True:
+                    discover_ns = [namespace]
+                elif discover == "*":
+                    discover_ns = [None]
+                else:
+                    discover_ns = self._namespace_list(discover)
+                    if discover_ns is None:
+                        log.warning("REGISTER invalid (discover:%r)", discover)
+                        return json.dumps({"status": "ERROR", "message": "bad_namespaces"})
+                options, error = self._discover_options(args, client_ip)
+                if error:
+                    return error
+            
             try:
                 peer = PeerRecord(
                     ip=client_ip,
@@ -61,22 +84,57 @@ class RequestHandler:
                     ttl=ttl,
                     timestamp=datetime.now(timezone.utc),
                 )
-                self.peer_db.add_peer(peer)
+                if discover:
+                    lease, groups = self.peer_db.add_peer_and_sample(peer, discover_ns, **options)
+                else:
+                    lease = self.peer_db.add_peer(peer)
                 
                 log.info("REGISTER OK: %s:%d ns=%s ttl=%d", peer.ip, peer.port, peer.namespace, peer.ttl)
                 
-                return json.dumps({
+                response = {
                     "status": "OK",
                     "ttl": peer.ttl,
                     "ip": peer.ip,       
-                    "port": peer.port    
-                })  
+                    "port": peer.port,
+                    "lease": lease
+                }
+                if discover is True or discover == "*":
+                    records, total = groups[discover_ns[0]]
+                    response["peers"] = self._peer_list(records)
+                    if self._bounded(options):
+                        response["total"] = total
+                elif discover:
+                    response["namespaces"] = self._grouped(groups)
+                if args.get("pacing"):
+                    response["refresh_after"] = pacing.refresh_after(peer.ttl, self.load_fn())
+                    if discover:
+                        response["next_discover_after"] = self._next_discover_after(discover_ns)
+                return json.dumps(response)  
                           
             except Exception as e:
                 log.exception("REGISTER failed")
                 return json.dumps({"status": "ERROR", "message": str(e)})
 
             
+        elif cmd == "HEARTBEAT":
+            lease = args.get("lease")
+            
+            if not isinstance(lease, str) or not lease or len(lease) > 64:
+                log.warning("HEARTBEAT invalid (lease)")
+                return json.dumps({"status": "ERROR", "message": "lease_required"})
+            
+            peer = self.peer_db.refresh_lease(lease, client_ip)
+            if peer is None:
+                # Unknown/expired lease: the client must fall back to a full REGISTER
+                log.info("HEARTBEAT from ip=%s with unknown lease", client_ip)
+                return json.dumps({"status": "ERROR", "message": "unknown_lease"})
+            
+            log.debug("HEARTBEAT OK: %s:%d ns=%s ttl=%d", peer.ip, peer.port, peer.namespace, peer.ttl)
+            response = {"status": "OK", "ttl": peer.ttl}
+            if args.get("pacing"):
+                response["refresh_after"] = pacing.refresh_after(peer.ttl, self.load_fn())
+            return json.dumps(response)
+            
         elif cmd == "DISCOVER":
             
             if not self.peer_db.is_ip_registered(client_ip):
@@ -89,22 +147,45 @@ class RequestHandler:
                     log.warning("UNREGISTER invalid (namespace:%r)", namespace)
                     return json.dumps({"status": "ERROR", "message": "bad_namespace"})
             
+            # Grouped form: "namespaces": [...] answers several namespaces in one request
+            namespaces = args.get("namespaces")
+            if namespaces is not None:
+                namespaces = self._namespace_list(namespaces)
+                if namespaces is None or namespace is not None:
+                    log.warning("DISCOVER invalid (namespaces:%r)", args.get("namespaces"))
+                    return json.dumps({"status": "ERROR", "message": "bad_namespaces"})
+            
+            # Optional bounding: limit / sample / exclude_self
+            options, error = self._discover_options(args, client_ip)
+            if error:
+                return error
             
-            peers = self.peer_db.get_peers(namespace)
-            now = datetime.now(timezone.utc)
+            if namespaces is not None:
+                groups = self.peer_db.sample_many(namespaces, **options)
+                log.info("DISCOVER namespaces=%r limit=%r sample=%r -> %d peer(s)", namespaces,
+                         options["limit"], options["sample"], sum(len(r) for r, _ in groups.values()))
+                response = {"status": "OK", "namespaces": self._grouped(groups)}
+                if args.get("pacing"):
+                    response["next_discover_after"] = self._next_discover_after(namespaces)
+                return json.dumps(response)
             
-            peer_list = [{
-                "ip": p.ip,
-                "port": p.port,
-                "name": p.name,
-                "namespace": p.namespace,
-                "ttl": p.ttl,
-                "expires_in": max(0, int(p.ttl - (now - p.timestamp).total_seconds()))
-            } for p in peers]
+            if not self._bounded(options):
+                peers = self.peer_db.get_peers(namespace)
+                total = None
+            else:
+                peers, total = self.peer_db.sample_peers(namespace, **options)
             
-            log.info("DISCOVER ns=%r -> %d peer(s)", namespace, len(peer_list)) 
+            peer_list = self._peer_list(peers)
             
-            return json.dumps({"status": "OK", "peers": peer_list})
+            log.info("DISCOVER ns=%r limit=%r sample=%r -> %d peer(s)", namespace, options["limit"],
+                     options["sample"], len(peer_list)) 
+            
+            response = {"status": "OK", "peers": peer_list}
+            if total is not None:
+                response["total"] = total
+            if args.get("pacing"):
+                response["next_discover_after"] = self._next_discover_after([namespace])
+            return json.dumps(response)
         
         elif cmd == "UNREGISTER":
             try:
@@ -158,5 +239,70 @@ class RequestHandler:
                 return json.dumps({"status": "ERROR", "message": str(e)})
 
         log.warning("Unknown command: %s", cmd)
-        return json.dumps({"status": "ERROR", "message": "Unknown command"})    
+        return json.dumps({"status": "ERROR", "message": "Unknown command"})
+
+    def _discover_options(self, args, client_ip):
+        """
+        Parse the DISCOVER bounding fields (limit, sample, exclude_self + name).
+
+        Returns (options, None) with keyword arguments for PeerDatabase.sample_peers,
+        or (None, error_response).
+        """
+        limit = args.get("limit")
+        sample = args.get("sample")
+        
+        if limit is not None:
+            try:
+                limit = int(limit)
+                if limit < 1:
+                    raise ValueError()
+            except (ValueError, TypeError):
+                log.warning("DISCOVER invalid (limit:%r)", limit)
+                return None, json.dumps({"status": "ERROR", "message": "bad_limit"})
+        
+        if sample not in SAMPLES:
+            log.warning("DISCOVER invalid (sample:%r)", sample)
+            return None, json.dumps({"status": "ERROR", "message": "bad_sample"})
+        
+        exclude = None
+        if args.get("exclude_self", False):
+            # The requester is identified by its IP and, when given, its name
+            self_name = args.get("name")
+            exclude = lambda p: p.ip == client_ip and (self_name is None or p.name == self_name)
+        
+        return {"limit": limit, "sample": sample, "exclude": exclude, "near_ip": client_ip}, None
+
+    @staticmethod
+    def _bounded(options):
+        return options["limit"] is not None or options["sample"] is not None or options["exclude"] is not None
+
+    @staticmethod
+    def _namespace_list(value):
+        # Validated, de-duplicated list of namespaces (order kept), or None if invalid
+        if not isinstance(value, list) or not (1 <= len(value) <= MAX_NAMESPACES):
+            return None
+        if not all(isinstance(ns, str) and 1 <= len(ns) <= 64 for ns in value):
+            return None
+        return list(dict.fromkeys(value))
+
+    @staticmethod
+    def _peer_list(peers):
+        now = datetime.now(timezone.utc)
+        return [{
+            "ip": p.ip,
+            "port": p.port,
+            "name": p.name,
+            "namespace": p.namespace,
+            "ttl": p.ttl,
+            "expires_in": max(0, int(p.ttl - (now - p.timestamp).total_seconds()))
+        } for p in peers]
+
+    def _grouped(self, groups):
+        return {ns: {"peers": self._peer_list(records), "total": total}
+                for ns, (records, total) in groups.items()}
+
+    def _next_discover_after(self, namespaces):
+        # The busiest namespace sets the pace
+        churn = max(self.peer_db.churn_rate(ns) for ns in namespaces)
+        return pacing.next_discover_after(self.load_fn(), churn)    
 
@@ -0,0 +1,75 @@
+import json
+import logging
+from dataclasses import dataclass, asdict, fields, replace
+
+log = logging.getLogger("config")
+
+
+@dataclass(frozen=True)
+class ServerLimits:
+    """
+    Tunables of the rendezvous server that can change while it is running.
+
+    Instances are immutable: a reload builds a new object and the server swaps the
+    reference, so a request always sees one consistent set of limits. Host, port and
+    the UDP listener are bound at startup and are not part of this set.
+    """
+    # IP blocking (sliding window)
+    max_attempts: int = 50
+    window_seconds: int = 60
+    block_time: int = 60
+    # Worker pool and listener
+    max_workers: int = 64
+    backlog: int = 128
+    # TCP keepalive applied to accepted sockets
+    ka_idle: int = 60
+    ka_intvl: int = 15
+    ka_cnt: int = 4
+    # Request front stage
+    request_timeout: float = 5
+    max_line: int = 32 * 1024
+    # peers.json writes: 0 = on every change, N = at most every N seconds
+    persist_interval: float = 0
+    # Responses at least this large are compressed for clients that ask ("compress")
+    compress_threshold: int = 1024
+
+    def validate(self):
+        for f in fields(self):
+            value = getattr(self, f.name)
+            # Only the float fields (timeouts/intervals) take fractions: the others reach
+            # listen(), ThreadPoolExecutor and setsockopt, which need a real int
+            allowed = (int, float) if f.type is float else int
+            if isinstance(value, bool) or not isinstance(value, allowed):
+                kind = "a number" if f.type is float else "an integer"
+                raise ValueError(f"{f.name} must be {kind}, got {value!r}")
+            if f.name == "persist_interval":
+                if value < 0:
+                    raise ValueError(f"{f.name} must be >= 0, got {value!r}")
+            elif value <= 0:
+                raise ValueError(f"{f.name} must be > 0, got {value!r}")
+        return self
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def load_limits(path, base: ServerLimits = None) -> ServerLimits:
+    """
+    Read a JSON object of tunables from `path` on top of `base` (defaults if None).
+
+    Unknown keys are rejected so that a typo cannot silently keep the old value.
+    Raises OSError/ValueError on unreadable or invalid files; callers keep the
+    limits they already have in that case.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+
+    if not isinstance(raw, dict):
+        raise ValueError("config must be a JSON object")
+
+    known = {f.name for f in fields(ServerLimits)}
+    unknown = sorted(set(raw) - known)
+    if unknown:
+        raise ValueError(f"unknown config key(s): {', '.join(unknown)}")
+
+    return replace(base or ServerLimits(), **raw).validate()
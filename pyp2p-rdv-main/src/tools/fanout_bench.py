@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the chat client's PUB fan-out (no network).
+
+MessageRouter.publish() runs against N PeerConnections over local socketpairs
+whose reader/writer threads are never started, so every publication stays in
+the send queues. Each queue is then drained the way the write loop does it
+(one batch per connection), which times the writer-side encode on its own:
+
+    python fanout_bench.py --sizes 10,100,1000 --out before.json
+    python fanout_bench.py --sizes 10,100,1000 --out after.json --compare before.json
+
+Phases, for each size and framing (json lines, binary-framing):
+
+    publish     publish("*") to every connection
+    publish_ns  publish("#ns0") with the connections spread over --namespaces
+    encode      every writer encoding one broadcast (one sample = N batches)
+    fanout      publish + encode, the full cost of one broadcast
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import queue
+import resource
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "chatp2p"))
+
+from message_router import MessageRouter
+from peer_connection import PeerConnection
+from state import State
+
+from rdv_bench import _stats, compare
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "chatp2p", "config.json")
+DEFAULT_SIZES = "10,100,1000"
+FRAMINGS = {
+    "json": {"ack", "metrics", "seq", "batch"},
+    "bin": {"ack", "metrics", "seq", "batch", "binary-framing"},
+}
+
+
+class Bench:
+    """One size and framing: N idle connections registered in a fresh State."""
+
+    def __init__(self, size, framing, namespaces, payload, budget):
+        self.size = size
+        self.payload = payload
+        self.budget = budget
+        self.state = State(CONFIG)
+        self.state.config["message_router"]["pub_ttl"] = 1  # direct neighbours only: no relay copies
+        self.state.set_peer_info("bench", "ns0", 1, 60)
+        self.router = MessageRouter(self.state)
+        self.state.set_message_router(self.router)
+        self.pairs = []
+        self.members = []
+        for i in range(size):
+            local, remote = socket.socketpair()
+            peer_id = f"p{i}@ns{i % namespaces}"
+            conn = PeerConnection(local, peer_id, self.state, foi_iniciado=True)
+            conn.features = set(FRAMINGS[framing])
+            self.state.adiciona_conexao(peer_id, conn)
+            self.pairs.append((conn, remote))
+            if i % namespaces == 0:
+                self.members.append(conn)
+        self.bytes_out = 0
+
+    def close(self):
+        self.router.shutdown()
+        for conn, remote in self.pairs:
+            conn.sock.close()
+            remote.close()
+
+    def _drain(self, conns):
+        # What each write loop does with one queued PUB: take it, build the batch, encode it
+        sent = 0
+        for conn in conns:
+            try:
+                msg = conn._envia_queue.get_nowait()
+            except queue.Empty:
+                continue
+            lote = conn._novo_lote()
+            lote.adiciona(msg)
+            sent += len(lote.finaliza())
+        return sent
+
+    def _timed(self, rounds, op):
+        samples = []
+        deadline = time.perf_counter_ns() + int(self.budget * 1e9)
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            samples.append(op())
+            if time.perf_counter_ns() > deadline:
+                break
+        return _stats(samples, time.perf_counter_ns() - start)
+
+    def phase_publish(self, rounds):
+        def op():
+            t0 = time.perf_counter_ns()
+            self.router.publish("*", self.payload)
+            elapsed = time.perf_counter_ns() - t0
+            self._drain(self.state.get_todas_conexoes().values())
+            return elapsed
+        return self._timed(rounds, op)
+
+    def phase_publish_ns(self, rounds):
+        def op():
+            t0 = time.perf_counter_ns()
+            self.router.publish("#ns0", self.payload)
+            elapsed = time.perf_counter_ns() - t0
+            self._drain(self.members)
+            return elapsed
+        return self._timed(rounds, op)
+
+    def phase_encode(self, rounds):
+        def op():
+            self.router.publish("*", self.payload)
+            conns = self.state.get_todas_conexoes().values()
+            t0 = time.perf_counter_ns()
+            self.bytes_out = self._drain(conns)
+            return time.perf_counter_ns() - t0
+        return self._timed(rounds, op)
+
+    def phase_fanout(self, rounds):
+        def op():
+            t0 = time.perf_counter_ns()
+            self.router.publish("*", self.payload)
+            self._drain(self.state.get_todas_conexoes().values())
+            return time.perf_counter_ns() - t0
+        return self._timed(rounds, op)
+
+    def run(self, rounds):
+        phases = {
+            "publish": self.phase_publish(rounds),
+            "publish_ns": self.phase_publish_ns(rounds),
+            "encode": self.phase_encode(rounds),
+            "fanout": self.phase_fanout(rounds),
+        }
+        phases["publish_ns"]["members"] = len(self.members)
+        phases["encode"]["bytes_per_broadcast"] = self.bytes_out
+        return {"connections": self.size, "phases": phases,
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def _raise_fd_limit(size):
+    # Two sockets per connection
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = 2 * size + 64
+    if soft < wanted and (hard == resource.RLIM_INFINITY or hard >= wanted):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chat client PUB fan-out microbenchmarks")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated connection counts (default: %(default)s)")
+    ap.add_argument("--framing", default="json,bin", help="comma-separated framings to run (json, bin)")
+    ap.add_argument("--namespaces", type=int, default=10, help="namespaces the connections are spread over")
+    ap.add_argument("--payload-size", type=int, default=64, help="PUB payload length in characters")
+    ap.add_argument("--rounds", type=int, default=200, help="publications per phase")
+    ap.add_argument("--budget", type=float, default=10.0, help="seconds per phase before stopping early")
+    ap.add_argument("--out", default="fanout_results.json", help="JSON results file")
+    ap.add_argument("--compare", help="previous results file to compare against")
+    args = ap.parse_args()
+
+    logging.disable(logging.CRITICAL)  # publish() logs every fan-out at INFO
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    framings = [f for f in args.framing.split(",") if f.strip()]
+    for framing in framings:
+        if framing not in FRAMINGS:
+            ap.error(f"unknown framing {framing!r} (expected one of: {', '.join(FRAMINGS)})")
+    _raise_fd_limit(max(sizes))
+
+    payload = ("fan-out ✓ " * (args.payload_size // 10 + 1))[:args.payload_size]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": {},
+    }
+
+    for size in sorted(sizes):
+        for framing in framings:
+            print(f"[bench] connections={size} framing={framing} ...", flush=True)
+            bench = Bench(size, framing, args.namespaces, payload, args.budget)
+            try:
+                result = bench.run(args.rounds)
+            finally:
+                bench.close()
+            report["results"][f"{size}/{framing}"] = result
+            for phase, stats in result["phases"].items():
+                print(f"  {phase:<14} ops={stats['ops']:<5} mean={stats.get('mean_us', 0):>12.1f}us "
+                      f"p99={stats.get('p99_us', 0):>12.1f}us")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
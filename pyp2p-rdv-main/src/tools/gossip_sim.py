@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Simulation of the chat client's PUB relaying over a sparse mesh (no network).
+
+Every peer is a real State + MessageRouter; connections are in-memory stubs
+whose enqueue_msg() puts a JSON round-trip of the message on one global FIFO,
+which is then delivered hop by hop until it is empty. The mesh is a ring (so
+it is connected) plus random edges up to the requested average degree, and
+peers are spread over --namespaces namespaces:
+
+    python gossip_sim.py --peers 500 --degree 6
+    python gossip_sim.py --peers 500 --degree 6 --mode fanout --fanout 3
+    python gossip_sim.py --peers 500 --degree 6 --transit --out sim.json
+
+Rounds alternate between a broadcast ("*") and a namespace-cast ("#ns1") from
+a random origin. For each kind the report gives the delivery ratio (targets
+reached / targets), copies sent per publication, duplicates dropped by the
+dedup cache and the hop counts of the deliveries.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "chatp2p"))
+
+from message_router import MessageRouter
+from state import State
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "chatp2p", "config.json")
+
+
+class Link:
+    """One direction of a connection: what the router on one side enqueues reaches the other side."""
+
+    def __init__(self, wire, local, remote):
+        self.wire = wire
+        self.local = local
+        self.peer_id_remoto = remote
+
+    def enqueue_msg(self, msg, bloquear=True):
+        self.wire.append((self.peer_id_remoto, self.local, json.loads(json.dumps(msg))))
+        return True
+
+
+class Mesh:
+    def __init__(self, peers, degree, namespaces, mode, fanout, transit, rng):
+        self.ids = [f"p{i}@ns{i % namespaces}" for i in range(peers)]
+        self.wire = deque()
+        self.states, self.routers, self.links = {}, {}, {}
+        for peer_id in self.ids:
+            name, namespace = peer_id.split("@")
+            state = State(CONFIG)
+            state.set_peer_info(name, namespace, 1, 60)
+            state.config["message_router"].update(gossip_mode=mode, gossip_fanout=fanout, pub_transit=transit)
+            self.states[peer_id] = state
+            self.routers[peer_id] = MessageRouter(state)
+
+        edges = {(self.ids[i], self.ids[(i + 1) % peers]) for i in range(peers)}
+        while len(edges) < peers * degree // 2:
+            a, b = rng.sample(self.ids, 2)
+            if (b, a) not in edges:
+                edges.add((a, b))
+        for a, b in edges:
+            for local, remote in ((a, b), (b, a)):
+                link = Link(self.wire, local, remote)
+                self.links[(local, remote)] = link
+                self.states[local].adiciona_conexao(remote, link)
+        self.edges = len(edges)
+
+        self.delivered = {}
+        for peer_id, router in self.routers.items():
+            router.register_receive_callback(
+                lambda src, payload, meta, peer_id=peer_id: self.delivered.__setitem__(peer_id, meta["msg"]["ttl"]))
+
+    def publish(self, origin, dst, ttl):
+        # Runs one publication to completion; returns (deliveries {peer: hops}, copies sent, duplicates)
+        self.delivered.clear()
+        for router in self.routers.values():
+            router.estatisticas_pub.update(recebidos=0, duplicados=0, repassados=0)
+        self.routers[origin].publish(dst, "sim", ttl=ttl)
+        while self.wire:
+            to, frm, msg = self.wire.popleft()
+            self.routers[to].process_incoming(msg, self.links[(to, frm)])
+        copies = sum(r.estatisticas_pub["recebidos"] for r in self.routers.values())
+        duplicates = sum(r.estatisticas_pub["duplicados"] for r in self.routers.values())
+        hops = {peer: ttl - left + 1 for peer, left in self.delivered.items()}
+        return hops, copies, duplicates
+
+    def close(self):
+        for router in self.routers.values():
+            router.shutdown()
+
+
+def _summary(runs):
+    targets = sum(r["targets"] for r in runs)
+    hops = [h for r in runs for h in r["hops"]]
+    return {
+        "publications": len(runs),
+        "delivery_ratio": round(sum(len(r["hops"]) for r in runs) / targets, 4) if targets else None,
+        "copies_per_msg": round(sum(r["copies"] for r in runs) / len(runs), 1),
+        "duplicates_per_msg": round(sum(r["duplicates"] for r in runs) / len(runs), 1),
+        "hops_max": max(hops, default=0),
+        "hops_mean": round(sum(hops) / len(hops), 2) if hops else 0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="PUB relay simulation over a sparse in-memory mesh")
+    ap.add_argument("--peers", type=int, default=200, help="peers in the mesh")
+    ap.add_argument("--degree", type=int, default=6, help="average connections per peer")
+    ap.add_argument("--namespaces", type=int, default=3, help="namespaces the peers are spread over")
+    ap.add_argument("--mode", choices=("flood", "fanout"), default="flood", help="gossip_mode of every peer")
+    ap.add_argument("--fanout", type=int, default=3, help="gossip_fanout of every peer")
+    ap.add_argument("--transit", action="store_true", help="set pub_transit (namespace-cast relayed by non-members)")
+    ap.add_argument("--ttl", type=int, default=8, help="ttl of each publication")
+    ap.add_argument("--rounds", type=int, default=20, help="publications (alternating * and #ns1)")
+    ap.add_argument("--seed", type=int, default=1, help="random seed for the mesh and the origins")
+    ap.add_argument("--out", help="optional JSON results file")
+    args = ap.parse_args()
+
+    logging.disable(logging.CRITICAL)  # publish() and State log every step at INFO
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)  # fanout mode samples neighbours with the module-level random
+    mesh = Mesh(args.peers, args.degree, args.namespaces, args.mode, args.fanout, args.transit, rng)
+    runs = {"*": [], "#ns1": []}
+    try:
+        for k in range(args.rounds):
+            dst = "*" if k % 2 == 0 else "#ns1"
+            origin = rng.choice(mesh.ids)
+            hops, copies, duplicates = mesh.publish(origin, dst, args.ttl)
+            targets = [p for p in mesh.ids if p != origin and (dst == "*" or p.endswith("@ns1"))]
+            runs[dst].append({"targets": len(targets), "hops": [hops[p] for p in targets if p in hops],
+                              "copies": copies, "duplicates": duplicates})
+    finally:
+        mesh.close()
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "edges": mesh.edges,
+        "log2_peers": round(math.log2(args.peers), 1),
+        "results": {dst: _summary(r) for dst, r in runs.items() if r},
+    }
+    print(f"[sim] peers={args.peers} edges={mesh.edges} mode={args.mode} fanout={args.fanout} "
+          f"transit={args.transit} ttl={args.ttl} log2(peers)={report['log2_peers']}")
+    for dst, s in report["results"].items():
+        print(f"  {dst:<5} delivery={s['delivery_ratio']:.3f} copies/msg={s['copies_per_msg']:>8.1f} "
+              f"duplicates/msg={s['duplicates_per_msg']:>8.1f} hops max={s['hops_max']} mean={s['hops_mean']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[sim] results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the rendezvous store and request handler (no sockets).
+
+Drives PeerDatabase and RequestHandler.handle directly at several table sizes
+and writes one JSON document per run, so that changes to the store can be
+compared run to run:
+
+    python rdv_bench.py --sizes 1000,10000 --out before.json
+    python rdv_bench.py --sizes 1000,10000 --out after.json --compare before.json
+
+Time is virtual: datetime.now() in the rendezvous modules is replaced by a clock
+that only moves when the benchmark advances it, so expiry (the sweep phase) is
+exercised deterministically and no record expires while a large table loads.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rendezvous"))
+
+import models
+import peer_db
+import request_handler
+from models import PeerRecord
+from peer_db import PeerDatabase
+from protocol_parser import Request
+from request_handler import RequestHandler
+
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+SHORT_TTL = 60      # one preloaded record in SHORT_EVERY expires in the sweep phase
+LONG_TTL = 3600
+SHORT_EVERY = 10
+
+
+class VirtualClock:
+    """Stands in for datetime.now() in models, peer_db and request_handler."""
+
+    START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def advance(self, seconds):
+        self.offset += seconds
+
+    def install(self):
+        clock = self
+
+        class VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                now = clock.START + timedelta(seconds=clock.offset)
+                return now if tz is not None else now.replace(tzinfo=None)
+
+        for module in (models, peer_db, request_handler):
+            module.datetime = VirtualDatetime
+
+
+def _stats(samples_ns, wall_ns):
+    samples = sorted(samples_ns)
+    n = len(samples)
+    if not n:
+        return {"ops": 0}
+    pick = lambda q: samples[min(n - 1, int(q * (n - 1) + 0.5))] / 1000
+    return {
+        "ops": n,
+        "total_s": round(wall_ns / 1e9, 6),
+        "mean_us": round(sum(samples) / n / 1000, 3),
+        "p50_us": round(pick(0.50), 3),
+        "p99_us": round(pick(0.99), 3),
+        "max_us": round(samples[-1] / 1000, 3),
+    }
+
+
+class Bench:
+    """One table size: preload, then run the phases in order on the same store."""
+
+    def __init__(self, size, namespaces, ops, budget, trace_ops):
+        self.size = size
+        self.namespaces = namespaces
+        self.ops = ops
+        self.budget = budget
+        self.trace_ops = trace_ops
+        self.clock = VirtualClock()
+        self.clock.install()
+        self.tmpdir = tempfile.TemporaryDirectory(prefix="rdv_bench_")
+        # Deferred persistence: the benchmark measures the in-memory store, not json.dump
+        self.db = PeerDatabase(os.path.join(self.tmpdir.name, "peers.json"), persist_interval=10 ** 9)
+        self.handler = RequestHandler(self.db)
+        self.serial = 0
+
+    def close(self):
+        self.tmpdir.cleanup()
+
+    def preload(self):
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter_ns()
+        now = datetime.now(timezone.utc)
+        with self.db._lock:
+            # Straight into the index: add_peer() sweeps the whole table on every call
+            for i in range(self.size):
+                self.db._add_locked(PeerRecord(
+                    ip=f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+                    port=1024 + i % 60000,
+                    name=f"p{i}",
+                    namespace=f"ns{i % self.namespaces}",
+                    ttl=SHORT_TTL if i % SHORT_EVERY == 0 else LONG_TTL,
+                    timestamp=models.datetime.now(timezone.utc),
+                ))
+        return {
+            "records": self.size,
+            "total_s": round((time.perf_counter_ns() - start) / 1e9, 6),
+            "blocks": sys.getallocatedblocks() - blocks,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    # --- phases: each takes the number of operations and returns (samples_ns, wall_ns)
+
+    def _run(self, n, op):
+        samples = []
+        deadline = time.perf_counter_ns() + int(self.budget * 1e9)
+        start = time.perf_counter_ns()
+        for i in range(n):
+            t0 = time.perf_counter_ns()
+            op(i)
+            t1 = time.perf_counter_ns()
+            samples.append(t1 - t0)
+            if t1 > deadline:
+                break
+        return samples, time.perf_counter_ns() - start
+
+    def _handle(self, command, args, ip):
+        args = dict(args, type=command)
+        reply = json.loads(self.handler.handle(Request(command, args), ip))
+        if reply.get("status") != "OK":
+            raise RuntimeError(f"{command} failed: {reply}")
+        return reply
+
+    def new_clients(self, n):
+        # Fresh (ip, namespace, name, port) tuples that are not in the preloaded table
+        clients = []
+        for _ in range(n):
+            self.serial += 1
+            s = self.serial
+            clients.append({"ip": f"192.168.{(s >> 8) & 255}.{s & 255}", "namespace": f"ns{s % self.namespaces}",
+                            "name": f"bench{s}", "port": 2000 + s % 60000, "lease": None})
+        return clients
+
+    def phase_register(self, clients):
+        def op(i):
+            c = clients[i]
+            reply = self._handle("REGISTER", {"namespace": c["namespace"], "name": c["name"],
+                                              "port": c["port"], "ttl": LONG_TTL}, c["ip"])
+            c["lease"] = reply["lease"]
+        samples, wall = self._run(len(clients), op)
+        del clients[len(samples):]  # later phases only use the registered ones
+        return samples, wall
+
+    def phase_refresh(self, clients):
+        return self._run(len(clients), lambda i: self._handle("HEARTBEAT", {"lease": clients[i]["lease"]},
+                                                              clients[i]["ip"]))
+
+    def phase_discover_ns(self, clients, n):
+        return self._run(min(n, len(clients)), lambda i: self._handle(
+            "DISCOVER", {"namespace": clients[i]["namespace"]}, clients[i]["ip"]))
+
+    def phase_discover_bounded(self, clients, n):
+        # Random sample of 10 across every namespace: cost should not grow with the table
+        return self._run(min(n, len(clients)), lambda i: self._handle(
+            "DISCOVER", {"limit": 10, "sample": "random"}, clients[i]["ip"]))
+
+    def phase_discover_all(self, clients, n):
+        return self._run(min(n, len(clients)), lambda i: self._handle("DISCOVER", {}, clients[i]["ip"]))
+
+    def phase_unregister(self, clients):
+        return self._run(len(clients), lambda i: self._handle(
+            "UNREGISTER", {"namespace": clients[i]["namespace"], "name": clients[i]["name"],
+                           "port": clients[i]["port"]}, clients[i]["ip"]))
+
+    def phase_sweep(self, n):
+        return self._run(n, lambda i: self.db._sweep())
+
+    def request_phases(self, ops, discover_ops, discover_all_ops):
+        """register -> refresh -> discover(ns) -> discover(limit) -> discover(all) -> unregister on fresh clients."""
+        clients = self.new_clients(ops)
+        yield "register", lambda: self.phase_register(clients)
+        yield "refresh", lambda: self.phase_refresh(clients)
+        yield "discover_ns", lambda: self.phase_discover_ns(clients, discover_ops)
+        yield "discover_limit", lambda: self.phase_discover_bounded(clients, discover_ops)
+        yield "discover_all", lambda: self.phase_discover_all(clients, discover_all_ops)
+        yield "unregister", lambda: self.phase_unregister(clients)
+
+    def run(self, discover_ops, discover_all_ops, sweep_ops):
+        result = {"preload": self.preload(), "phases": {}}
+        phases = result["phases"]
+
+        for name, phase in self.request_phases(self.ops, discover_ops, discover_all_ops):
+            blocks = sys.getallocatedblocks()
+            samples, wall = phase()
+            phases[name] = _stats(samples, wall)
+            phases[name]["net_blocks_per_op"] = round((sys.getallocatedblocks() - blocks) / max(1, len(samples)), 2)
+
+        # Memory profile on a second, smaller set of clients (tracing distorts timings)
+        if self.trace_ops:
+            tracemalloc.start()
+            try:
+                for name, phase in self.request_phases(self.trace_ops, min(discover_ops, self.trace_ops),
+                                                       min(discover_all_ops, self.trace_ops)):
+                    before = tracemalloc.take_snapshot()
+                    base, _ = tracemalloc.get_traced_memory()
+                    tracemalloc.reset_peak()
+                    samples, _ = phase()
+                    _, peak = tracemalloc.get_traced_memory()
+                    diff = tracemalloc.take_snapshot().compare_to(before, "filename")
+                    phases[name]["traced_ops"] = len(samples)
+                    phases[name]["peak_bytes"] = peak - base
+                    phases[name]["allocs_per_op"] = round(
+                        sum(s.count_diff for s in diff if s.count_diff > 0) / max(1, len(samples)), 2)
+            finally:
+                tracemalloc.stop()
+
+        # Sweep with nothing to expire (paid by every REGISTER/DISCOVER), then after
+        # the virtual clock passes SHORT_TTL so that 1/SHORT_EVERY of the table expires
+        samples, wall = self.phase_sweep(sweep_ops)
+        phases["sweep_idle"] = _stats(samples, wall)
+
+        before = len(self.db._all)
+        self.clock.advance(SHORT_TTL * 2)
+        samples, wall = self.phase_sweep(1)
+        phases["sweep_expire"] = _stats(samples, wall)
+        phases["sweep_expire"]["expired"] = before - len(self.db._all)
+
+        result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return result
+
+
+def compare(current, previous):
+    """Print mean latency ratios (current / previous) for every size and phase in both runs."""
+    print(f"{'size':>9} {'phase':<14} {'before_us':>12} {'after_us':>12} {'ratio':>7}")
+    for size, result in current["results"].items():
+        old = previous.get("results", {}).get(size)
+        if not old:
+            continue
+        for phase, stats in result["phases"].items():
+            old_stats = old["phases"].get(phase)
+            if not old_stats or not old_stats.get("mean_us") or "mean_us" not in stats:
+                continue
+            ratio = stats["mean_us"] / old_stats["mean_us"]
+            print(f"{size:>9} {phase:<14} {old_stats['mean_us']:>12.1f} {stats['mean_us']:>12.1f} {ratio:>7.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rendezvous store/handler microbenchmarks")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated table sizes (default: %(default)s)")
+    ap.add_argument("--namespaces", type=int, default=100, help="namespaces the table is spread over")
+    ap.add_argument("--ops", type=int, default=200, help="register/refresh/unregister operations per size")
+    ap.add_argument("--discover-ops", type=int, default=50, help="DISCOVER <namespace> operations per size")
+    ap.add_argument("--discover-all-ops", type=int, default=5, help="DISCOVER (all namespaces) operations per size")
+    ap.add_argument("--sweep-ops", type=int, default=5, help="idle sweeps per size")
+    ap.add_argument("--trace-ops", type=int, default=20, help="operations per phase in the tracemalloc pass (0 = skip)")
+    ap.add_argument("--budget", type=float, default=10.0, help="seconds per phase before stopping early")
+    ap.add_argument("--out", default="bench_results.json", help="JSON results file")
+    ap.add_argument("--compare", help="previous results file to compare against")
+    args = ap.parse_args()
+
+    logging.disable(logging.CRITICAL)  # the handler logs every request at INFO
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": {},
+    }
+
+    for size in sorted(sizes):
+        print(f"[bench] size={size} ...", flush=True)
+        bench = Bench(size, args.namespaces, args.ops, args.budget, args.trace_ops)
+        try:
+            result = bench.run(args.discover_ops, args.discover_all_ops, args.sweep_ops)
+        finally:
+            bench.close()
+        report["results"][str(size)] = result
+        for phase, stats in result["phases"].items():
+            print(f"  {phase:<14} ops={stats['ops']:<5} mean={stats.get('mean_us', 0):>12.1f}us "
+                  f"p99={stats.get('p99_us', 0):>12.1f}us")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
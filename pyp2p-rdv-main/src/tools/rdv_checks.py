@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Socket-free checks for rendezvous behaviour that rc_tester cannot express.
+
+rc_tester sends independent lines to a live server, so it cannot carry a value
+from one reply into the next request (a lease into HEARTBEAT), move time, or
+register from several source addresses. These checks drive RequestHandler and
+PeerDatabase directly on a virtual clock (see rdv_bench.VirtualClock):
+
+    python rdv_checks.py            # every check
+    python rdv_checks.py heartbeat  # checks whose name contains "heartbeat"
+"""
+import argparse
+import ipaddress
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rendezvous"))
+
+from peer_db import PeerDatabase, _PrefixIndex
+from protocol_parser import Request
+from rdv_bench import VirtualClock
+from rendezvous import RendezvousServer
+from request_handler import RequestHandler
+from server_config import ServerLimits
+
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, message, *got):
+    if not condition:
+        raise CheckFailed(message + ("" if not got else f"; got {got[0]!r}"))
+
+
+class Env:
+    """Fresh store and handler on a virtual clock, one per check."""
+
+    def __init__(self):
+        self.clock = VirtualClock()
+        self.clock.install()
+        self.tmpdir = tempfile.TemporaryDirectory(prefix="rdv_checks_")
+        self.db = PeerDatabase(os.path.join(self.tmpdir.name, "peers.json"), persist_interval=10 ** 9)
+        self.handler = RequestHandler(self.db)
+
+    def close(self):
+        self.tmpdir.cleanup()
+
+    def handle(self, command, args, ip):
+        return json.loads(self.handler.handle(Request(command, dict(args, type=command)), ip))
+
+
+@check
+def heartbeat_refreshes_lease(env):
+    ip = "10.0.0.1"
+    reply = env.handle("REGISTER", {"namespace": "hb", "name": "alice", "port": 4300, "ttl": 60}, ip)
+    expect(reply.get("status") == "OK" and isinstance(reply.get("lease"), str), "REGISTER without lease", reply)
+    lease = reply["lease"]
+
+    env.clock.advance(50)
+    reply = env.handle("HEARTBEAT", {"lease": lease}, ip)
+    expect(reply == {"status": "OK", "ttl": 60}, "HEARTBEAT did not return ttl", reply)
+
+    # 100 s after REGISTER but only 50 s after the HEARTBEAT: still registered
+    env.clock.advance(50)
+    expect(env.db.has_peer(ip, "hb", "alice"), "record expired although the lease was refreshed")
+    reply = env.handle("DISCOVER", {"namespace": "hb"}, ip)
+    expect([p["name"] for p in reply.get("peers", [])] == ["alice"], "refreshed peer missing from DISCOVER", reply)
+    expect(reply["peers"][0]["expires_in"] == 10, "expiry not counted from the HEARTBEAT", reply)
+
+    reply = env.handle("HEARTBEAT", {"lease": lease, "pacing": True}, ip)
+    expect(reply.get("status") == "OK" and 1 <= reply.get("refresh_after", 0) <= 60,
+           "HEARTBEAT pacing hint missing", reply)
+
+    # A re-REGISTER keeps the lease already handed out
+    reply = env.handle("REGISTER", {"namespace": "hb", "name": "alice", "port": 4300, "ttl": 60}, ip)
+    expect(reply.get("lease") == lease, "re-REGISTER changed the lease", reply)
+
+
+@check
+def heartbeat_rejects_other_ip_and_expired_lease(env):
+    reply = env.handle("REGISTER", {"namespace": "hb", "name": "bob", "port": 4301, "ttl": 30}, "10.0.0.2")
+    lease = reply["lease"]
+
+    reply = env.handle("HEARTBEAT", {"lease": lease}, "10.0.0.3")
+    expect(reply == {"status": "ERROR", "message": "unknown_lease"}, "lease accepted from another IP", reply)
+
+    env.clock.advance(31)
+    reply = env.handle("HEARTBEAT", {"lease": lease}, "10.0.0.2")
+    expect(reply == {"status": "ERROR", "message": "unknown_lease"}, "expired lease refreshed", reply)
+    expect(not env.db.has_peer("10.0.0.2", "hb", "bob"), "expired record still registered")
+
+
+def _common_prefix(a, b):
+    # Leading bits shared by two addresses; -1 across families or for unparsable ones
+    try:
+        a, b = ipaddress.ip_address(a), ipaddress.ip_address(b)
+    except ValueError:
+        return -1
+    if a.version != b.version:
+        return -1
+    return a.max_prefixlen - (int(a) ^ int(b)).bit_length()
+
+
+@check
+def discover_nearest_orders_by_subnet(env):
+    me = "10.1.2.3"
+    peers = [("far", "192.168.7.7"), ("v6", "2001:db8::7"), ("slash8", "10.200.0.1"),
+             ("slash16", "10.1.99.1"), ("slash24", "10.1.2.200"), ("slash29", "10.1.2.5"), ("self", me)]
+    for port, (name, ip) in enumerate(peers, 4400):
+        env.handle("REGISTER", {"namespace": "near", "name": name, "port": port, "ttl": 60}, ip)
+
+    reply = env.handle("DISCOVER", {"namespace": "near", "sample": "nearest", "limit": 10}, me)
+    names = [p["name"] for p in reply.get("peers", [])]
+    expect(names == ["self", "slash29", "slash24", "slash16", "slash8", "far", "v6"],
+           "DISCOVER nearest not ordered by common prefix", names)
+
+    reply = env.handle("DISCOVER", {"namespace": "near", "sample": "nearest", "limit": 2,
+                                    "exclude_self": True, "name": "self"}, me)
+    names = [p["name"] for p in reply.get("peers", [])]
+    expect(names == ["slash29", "slash24"], "limit/exclude_self not applied to the nearest walk", names)
+
+    # Unregistered peers leave the index
+    env.handle("UNREGISTER", {"namespace": "near", "name": "slash29"}, "10.1.2.5")
+    reply = env.handle("DISCOVER", {"namespace": "near", "sample": "nearest", "limit": 2}, me)
+    names = [p["name"] for p in reply.get("peers", [])]
+    expect(names == ["self", "slash24"], "removed peer still returned by nearest", names)
+
+
+@check
+def prefix_index_matches_brute_force(env):
+    rng = random.Random(7)
+    subnets = [rng.getrandbits(32) & 0xFFFFFF00 for _ in range(4)]
+    for _trial in range(50):
+        index, live = _PrefixIndex(), {}
+        for key in range(rng.randint(1, 200)):
+            roll = rng.random()
+            if roll < 0.1:
+                ip = str(ipaddress.IPv6Address(rng.getrandbits(128)))
+            elif roll < 0.12:
+                ip = "not-an-ip"
+            else:
+                ip = str(ipaddress.IPv4Address(rng.choice(subnets) | rng.getrandbits(rng.choice((0, 3, 8)))))
+            index.add(ip, key)
+            live[key] = ip
+            if rng.random() < 0.3:
+                gone = rng.choice(list(live))
+                index.discard(live.pop(gone), gone)
+
+        for target in (rng.choice(list(live.values()) or ["10.0.0.1"]),
+                       str(ipaddress.IPv4Address(rng.choice(subnets) | 5)), "2001:db8::1", "not-an-ip"):
+            got = list(index.nearest(target))
+            expect(sorted(got) == sorted(live), f"nearest({target}) did not yield every live key once")
+            scores = [_common_prefix(live[key], target) for key in got]
+            expect(all(a >= b for a, b in zip(scores, scores[1:])),
+                   f"nearest({target}) not in decreasing common-prefix order", scores)
+
+
+@check
+def reload_rejects_bad_types_and_keeps_serving(env):
+    config = os.path.join(env.tmpdir.name, "server_config.json")
+    server = RendezvousServer(limits=ServerLimits(backlog=64, max_workers=4), config_path=config)
+    server.peer_db = env.db  # keep peers.json out of the working directory
+    server._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        server._listener.bind(("127.0.0.1", 0))
+        server._apply_front_stage_limits()
+        good = server.limits
+
+        for bad in ({"backlog": 10.5}, {"max_workers": 2.0}, {"ka_idle": True}, {"max_line": "4096"}):
+            with open(config, "w", encoding="utf-8") as f:
+                json.dump(bad, f)
+            ok, error = server.reload_config()
+            expect(not ok and "integer" in error, f"reload accepted {bad}", error)
+            expect(server.limits is good, f"limits swapped after rejecting {bad}")
+
+        with open(config, "w", encoding="utf-8") as f:
+            json.dump({"request_timeout": 2.5, "persist_interval": 0.5, "backlog": 32}, f)
+        ok, _ = server.reload_config()
+        expect(ok and server.limits.backlog == 32, "valid reload with float timeouts rejected", server.limits)
+        server._apply_front_stage_limits()
+        good = server.limits
+
+        # A value that gets past validation but fails while being applied rolls back
+        server.limits = replace(good, max_workers=8, backlog=10.5)
+        server._apply_front_stage_limits()
+        expect(server.limits is good, "failed apply did not restore the previous limits", server.limits)
+        expect(server._pool_size == good.max_workers and server._backlog == good.backlog,
+               "pool/backlog not back to the previous limits", (server._pool_size, server._backlog))
+        expect(server._executor.submit(lambda: 42).result(timeout=5) == 42, "worker pool unusable after rollback")
+    finally:
+        server._listener.close()
+        if server._executor:
+            server._executor.shutdown(wait=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Socket-free rendezvous behaviour checks")
+    ap.add_argument("only", nargs="?", help="run only the checks whose name contains this text")
+    args = ap.parse_args()
+
+    logging.disable(logging.CRITICAL)  # the handler logs every request at INFO
+
+    checks = [fn for fn in CHECKS if not args.only or args.only in fn.__name__]
+    passed = 0
+    for fn in checks:
+        env = Env()
+        try:
+            fn(env)
+        except CheckFailed as e:
+            print(f"[{fn.__name__}] FAIL: {e}")
+        else:
+            print(f"[{fn.__name__}] OK")
+            passed += 1
+        finally:
+            env.close()
+    print(f"\nSummary: {passed}/{len(checks)} passed")
+    sys.exit(0 if passed == len(checks) else 1)
+
+
+if __name__ == "__main__":
+    main()